@@ -1,16 +1,10 @@
 # -*- coding: utf-8 -*-
 import streamlit as st
-import json
 import os
 import sys
 import threading
 import socket
 import re
-import subprocess
-import tempfile
-import shutil
-from http.server import BaseHTTPRequestHandler, HTTPServer
-from urllib.parse import urlparse, parse_qs
 
 # 1. Page configuration
 st.set_page_config(layout="wide", page_title="内鬼裁决终端", initial_sidebar_state="collapsed")
@@ -20,7 +14,11 @@ SRC_DIR = os.path.join(BASE_DIR, "src")
 if SRC_DIR not in sys.path:
     sys.path.insert(0, SRC_DIR)
 
+import build_cache  # noqa: E402
+import catalog  # noqa: E402
 import db  # noqa: E402
+import js_check  # noqa: E402
+import api_server  # noqa: E402
 
 # Secrets: read from environment, Streamlit secrets, or local .streamlit/secrets.toml
 def _load_local_secrets():
@@ -94,147 +92,10 @@ def start_api():
     
     db.init_db()
 
-    class Handler(BaseHTTPRequestHandler):
-        def log_message(self, format, *args):
-            # 静默日志，避免输出到控制台
-            pass
-            
-        def _send_json(self, obj, status=200):
-            data = json.dumps(obj, ensure_ascii=False).encode("utf-8")
-            self.send_response(status)
-            self.send_header("Content-Type", "application/json; charset=utf-8")
-            self.send_header("Access-Control-Allow-Origin", "*")
-            self.send_header("Access-Control-Allow-Headers", "Content-Type")
-            self.send_header("Access-Control-Allow-Methods", "GET, POST, OPTIONS")
-            self.end_headers()
-            self.wfile.write(data)
-
-        def _send_error(self, message, status=500):
-            self._send_json({"error": message, "ok": False}, status=status)
-
-        def do_OPTIONS(self):
-            self.send_response(204)
-            self.send_header("Access-Control-Allow-Origin", "*")
-            self.send_header("Access-Control-Allow-Headers", "Content-Type")
-            self.send_header("Access-Control-Allow-Methods", "GET, POST, OPTIONS")
-            self.end_headers()
-
-        def do_GET(self):
-            parsed = urlparse(self.path)
-            try:
-                if parsed.path == "/api/history/list":
-                    qs = parse_qs(parsed.query)
-                    limit = int(qs.get("limit", ["20"])[0])
-                    client_id = qs.get("client_id", [""])[0]
-                    if not client_id:
-                        return self._send_error("缺少客户端ID", status=400)
-                    rows = db.get_recent_history(limit, client_id)
-                    items = [
-                        {
-                            "id": r[0],
-                            "rule_id": r[1],
-                            "content": r[2],
-                            "category": r[3],
-                            "timestamp": r[4],
-                        }
-                        for r in rows
-                    ]
-                    return self._send_json({"items": items, "ok": True})
-
-                if parsed.path == "/api/history/recent":
-                    qs = parse_qs(parsed.query)
-                    limit = int(qs.get("limit", ["10"])[0])
-                    client_id = qs.get("client_id", [""])[0]
-                    if not client_id:
-                        return self._send_error("缺少客户端ID", status=400)
-                    return self._send_json({"ids": db.get_recent_ids(limit, client_id), "ok": True})
-
-                if parsed.path == "/api/history/stats":
-                    qs = parse_qs(parsed.query)
-                    client_id = qs.get("client_id", [""])[0]
-                    if not client_id:
-                        return self._send_error("缺少客户端ID", status=400)
-                    stats = db.get_stats(client_id)
-                    stats["ok"] = True
-                    return self._send_json(stats)
-
-                if parsed.path == "/api/health":
-                    # 检查数据库连接状态
-                    try:
-                        db_health = db.health_check()
-                        return self._send_json({"ok": True, "db_connected": db_health})
-                    except Exception as e:
-                        return self._send_json({"ok": True, "db_connected": False, "db_error": str(e)})
-
-                self._send_error("未找到接口", status=404)
-            except Exception as e:
-                print(f"API Error in GET {parsed.path}: {e}")
-                self._send_error(f"服务器错误: {str(e)}", status=500)
-
-        def do_POST(self):
-            parsed = urlparse(self.path)
-            length = int(self.headers.get("Content-Length", 0))
-            body = self.rfile.read(length) if length else b"{}"
-            try:
-                payload = json.loads(body.decode("utf-8"))
-            except json.JSONDecodeError:
-                return self._send_error("无效的JSON数据", status=400)
-
-            try:
-                if parsed.path == "/api/history/add":
-                    client_id = payload.get("client_id")
-                    if not client_id:
-                        return self._send_error("缺少客户端ID", status=400)
-                    if not payload.get("id") or not payload.get("content"):
-                        return self._send_error("缺少必要的字段", status=400)
-
-                    item = db.add_record(payload, client_id)
-                    if not item:
-                        latest = db.get_recent_history(1, client_id)
-                        if latest:
-                            item = {
-                                "id": latest[0][0],
-                                "rule_id": latest[0][1],
-                                "content": latest[0][2],
-                                "category": latest[0][3],
-                                "timestamp": latest[0][4],
-                            }
-                    return self._send_json({"ok": True, "item": item})
-
-                if parsed.path == "/api/history/undo":
-                    client_id = payload.get("client_id")
-                    if not client_id:
-                        return self._send_error("缺少客户端ID", status=400)
-
-                    ids = payload.get("ids") or []
-                    if ids:
-                        deleted_count = db.delete_records_by_ids(client_id, ids)
-                        return self._send_json({"ok": True, "deleted_count": deleted_count})
-
-                    row = db.delete_last_record(client_id)
-                    if not row:
-                        return self._send_json({"ok": False, "message": "没有可撤销的记录"})
-
-                    return self._send_json({
-                        "ok": True,
-                        "item": {
-                            "id": row[0],
-                            "rule_id": row[1],
-                            "content": row[2],
-                            "category": row[3],
-                            "timestamp": row[4],
-                        },
-                    })
-
-                self._send_error("未找到接口", status=404)
-            except Exception as e:
-                print(f"API Error in POST {parsed.path}: {e}")
-                self._send_error(f"服务器错误: {str(e)}", status=500)
-
     # 查找可用端口
     actual_port = _find_free_port(API_PORT if API_PORT > 0 else 8502)
     
-    server = HTTPServer(("0.0.0.0", actual_port), Handler)
+    server = api_server.create_server(("0.0.0.0", actual_port))
     thread = threading.Thread(target=server.serve_forever, daemon=True)
     thread.start()
     
@@ -272,7 +133,6 @@ def load_text(path):
         return ""
 
 
-css_content = load_text("assets/css/style.css")
 fallback_css = """
 :root {
     --bg-color: #0f1923;
@@ -413,28 +273,13 @@ html, body {
 }
 """
 
-json_data = load_text("assets/data/rules.json")
-
 # 预先生成规则数据 - 直接作为JS对象
-if json_data:
-    try:
-        # 解析JSON并验证
-        rules_obj = json.loads(json_data)
-        # 直接序列化为JS对象（不包裹在字符串中）
-        json_data_js = json.dumps(rules_obj, ensure_ascii=False)
-    except json.JSONDecodeError:
-        json_data_js = '[]'
-else:
-    json_data_js = '[]'
-
-# 加载所有 JS 模块
-config_js = load_text("src/config.js")
-utils_js = load_text("src/utils.js")
-api_js = load_text("src/api.js")
-effects_js = load_text("src/effects.js")
-store_js = load_text("src/core/Store.js")
-glitch_js = load_text("src/components/GlitchText.js")
-main_js = load_text("src/main.js")
+# 规则目录在进程内共享（与 API 服务器相同），只在文件变化时重新解析和序列化
+try:
+    rules_catalog = catalog.get_catalog()
+    json_data_js, rules_digest = rules_catalog.to_json(), rules_catalog.digest
+except (OSError, ValueError):
+    json_data_js, rules_digest = '[]', ""
 
 
 # 构建 JS 代码 - 使用更健壮的模块处理方式
@@ -507,8 +352,35 @@ def process_js(content):
     return content
 
 
-# 按依赖顺序合并所有模块：config -> utils -> api -> effects -> Store -> GlitchText -> main
-combined_js = f"""
+# 页面的全部输入：app.py 本身（模板与 process_js）、样式表和各 JS 模块
+_PAGE_SOURCES = (
+    os.path.abspath(__file__),
+    os.path.join(BASE_DIR, "assets/css/style.css"),
+    os.path.join(BASE_DIR, "src/config.js"),
+    os.path.join(BASE_DIR, "src/utils.js"),
+    os.path.join(BASE_DIR, "src/api.js"),
+    os.path.join(BASE_DIR, "src/effects.js"),
+    os.path.join(BASE_DIR, "src/core/Store.js"),
+    os.path.join(BASE_DIR, "src/components/GlitchText.js"),
+    os.path.join(BASE_DIR, "src/main.js"),
+)
+
+
+def _build_page(json_data_js):
+    """读取并处理全部前端源码，返回 (combined_js, html_template)"""
+    css_content = load_text("assets/css/style.css")
+
+    # 加载所有 JS 模块
+    config_js = load_text("src/config.js")
+    utils_js = load_text("src/utils.js")
+    api_js = load_text("src/api.js")
+    effects_js = load_text("src/effects.js")
+    store_js = load_text("src/core/Store.js")
+    glitch_js = load_text("src/components/GlitchText.js")
+    main_js = load_text("src/main.js")
+
+    # 按依赖顺序合并所有模块：config -> utils -> api -> effects -> Store -> GlitchText -> main
+    combined_js = f"""
 // ==================== Config Module ====================
 {process_js(config_js)}
 
@@ -530,84 +402,9 @@ combined_js = f"""
 // ==================== Main Entry ====================
 {process_js(main_js)}
 """
-
-# Auto JS syntax validation (prevent silent interaction failures)
-def _validate_js_syntax(js_code):
-    node_path = shutil.which("node")
-    if not node_path:
-        return True, "node not found"
-    try:
-        with tempfile.NamedTemporaryFile(mode="w", suffix=".js", delete=False, encoding="utf-8") as f:
-            f.write(js_code)
-            tmp_path = f.name
-        proc = subprocess.run(
-            [node_path, "--check", tmp_path],
-            capture_output=True,
-            text=True,
-            timeout=5,
-        )
-        if proc.returncode == 0:
-            return True, ""
-        return False, (proc.stderr or proc.stdout or "unknown JS syntax error")
-    except Exception as e:
-        return False, str(e)
-    finally:
-        try:
-            if "tmp_path" in locals() and os.path.exists(tmp_path):
-                os.remove(tmp_path)
-        except Exception:
-            pass
-
 
-js_ok, js_error = _validate_js_syntax(combined_js)
-if not js_ok:
-    st.error("JS 语法校验失败，已阻止加载以避免交互完全失效。请修复后重试。")
-    st.code(js_error)
-    st.stop()
-
-# Fallback check when node is unavailable: ensure no leaked __STRING placeholders
-if re.search(r"__STRING_\\d+__", combined_js):
-    st.error("JS 处理异常：检测到未还原的字符串占位符。")
-    st.stop()
-
-# 2. Inject global CSS overrides for Streamlit layout
-st.markdown("""
-    <style>
-        /* Hide Streamlit header */
-        header[data-testid="stHeader"] { display: none; }
-        
-        /* Hide Streamlit footer */
-        footer { display: none; }
-
-        /* Ensure page background matches app (avoid white edges) */
-        html, body, .stApp {
-            background: #0f1923 !important;
-        }
-
-        /* Ensure iframe and main areas don't show white */
-        iframe, .main, section[data-testid="stMain"] {
-            background: #0f1923 !important;
-        }
-        
-        /* Remove default padding */
-        .block-container {
-            padding-top: 0rem !important;
-            padding-bottom: 0rem !important;
-            padding-left: 0rem !important;
-            padding-right: 0rem !important;
-            max-width: 100% !important;
-        }
-        
-        /* Normalize iframe box model */
-        iframe {
-            display: block; /* Remove inline gaps */
-            width: 100% !important;
-        }
-    </style>
-""", unsafe_allow_html=True)
-
-# 3. Build HTML - 不再暴露 Supabase 配置到前端
-html_template = f"""
+    # 3. Build HTML - 不再暴露 Supabase 配置到前端
+    html_template = f"""
 <!DOCTYPE html>
 <html lang="zh-CN">
 <head>
@@ -872,9 +669,86 @@ html_template = f"""
 </html>
 """
 
-# 替换模板变量 - 不再暴露 Supabase 密钥
-html_template = html_template.replace("{API_PORT}", str(ACTUAL_API_PORT))
-html_template = html_template.replace("{json_data_js}", json_data_js)
+    # 替换模板变量 - 不再暴露 Supabase 密钥
+    html_template = html_template.replace("{API_PORT}", str(ACTUAL_API_PORT))
+    html_template = html_template.replace("{json_data_js}", json_data_js)
+    return combined_js, html_template
+
+
+# 源码、规则和端口都未变化的 rerun 直接复用上次的构建结果，跳过读取、process_js 和模板拼装
+(combined_js, html_template), page_cached, page_ms = build_cache.get_cache("page").get(
+    _PAGE_SOURCES,
+    lambda: _build_page(json_data_js),
+    extra=(API_PORT, ACTUAL_API_PORT, rules_digest),
+)
+# 每次交互都会 rerun，只在重新构建时输出；命中耗时见 /api/health 的 build_cache
+if not page_cached:
+    print(f"Page build: rebuilt in {page_ms:.2f} ms")
+
+# Auto JS syntax validation (prevent silent interaction failures)
+# 结论按 JS 内容与 node 版本缓存在磁盘上（见 js_check.py），未变化时不再启动 node；
+# JS_CHECK_FORCE=1 强制重新校验
+def _validate_js_syntax(js_code):
+    return js_check.validate(js_code)
+
+
+js_ok, js_error = _validate_js_syntax(combined_js)
+if not js_ok:
+    st.error("JS 语法校验失败，已阻止加载以避免交互完全失效。请修复后重试。")
+    st.code(js_error)
+    st.stop()
+
+# Fallback check when node is unavailable: ensure no leaked __STRING placeholders
+if re.search(r"__STRING_\\d+__", combined_js):
+    st.error("JS 处理异常：检测到未还原的字符串占位符。")
+    st.stop()
+
+# 2. Inject global CSS overrides for Streamlit layout
+st.markdown("""
+    <style>
+        /* Hide Streamlit header */
+        header[data-testid="stHeader"] { display: none; }
+        
+        /* Hide Streamlit footer */
+        footer { display: none; }
+
+        /* Ensure page background matches app (avoid white edges) */
+        html, body, .stApp {
+            background: #0f1923 !important;
+        }
+
+        /* Ensure iframe and main areas don't show white */
+        iframe, .main, section[data-testid="stMain"] {
+            background: #0f1923 !important;
+        }
+        
+        /* Remove default padding */
+        .block-container {
+            padding-top: 0rem !important;
+            padding-bottom: 0rem !important;
+            padding-left: 0rem !important;
+            padding-right: 0rem !important;
+            max-width: 100% !important;
+        }
+        
+        /* Normalize iframe box model */
+        iframe {
+            display: block; /* Remove inline gaps */
+            width: 100% !important;
+        }
+    </style>
+""", unsafe_allow_html=True)
+
+# 同一页面也由 API 服务以预压缩形式提供（本机可直接打开 /app.html）；内容未变时沿用已压缩的结果
+page_payload, page_compressed = api_server.register_static(
+    "/app.html", html_template.encode("utf-8"), "text/html; charset=utf-8"
+)
+if page_compressed:
+    page_report = page_payload.report()
+    print(
+        f"Page payload: {page_report['bytes']} bytes, encoded {page_report['encoded_bytes']}, "
+        f"saved {page_report['saved_bytes']} bytes ({page_report['saved_pct']}%)"
+    )
 
 # 4. Render HTML component; height is managed via postMessage resize
 # 使用合理的初始高度，避免布局抖动
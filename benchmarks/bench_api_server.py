@@ -0,0 +1,94 @@
+"""
+API 服务器吞吐基准 - 对比 single / pool / asyncio 三种模式
+
+每种模式在内存后端上启动服务器，N 个客户端各自使用一条持久连接反复请求
+/api/history/recent，统计每秒请求数和延迟分位；--idle 额外保持一批空闲连接，
+观察空闲连接对吞吐的影响。single 模式为 HTTP/1.0，每个请求新建连接。
+
+用法: python benchmarks/bench_api_server.py [--clients 16] [--seconds 3] [--idle 200]
+"""
+import argparse
+import http.client
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import db  # noqa: E402
+import api_server  # noqa: E402
+
+PATH = "/api/history/recent?client_id=bench"
+
+
+def _client(port, deadline, latencies):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        conn.request("GET", PATH)
+        resp = conn.getresponse()
+        resp.read()
+        latencies.append(time.perf_counter() - start)
+        if resp.will_close:
+            conn.close()
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    conn.close()
+
+
+def _run(mode, clients, seconds, idle):
+    server = api_server.create_server(("127.0.0.1", 0), mode=mode)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+    idle_socks = []
+    for _ in range(idle):
+        s = socket.create_connection(("127.0.0.1", port))
+        s.sendall(f"GET {PATH} HTTP/1.1\r\nHost: bench\r\n\r\n".encode())
+        data = b""
+        while not data.endswith(b"}"):  # 读完响应后保持空闲
+            data += s.recv(65536)
+        idle_socks.append(s)
+
+    results = [[] for _ in range(clients)]
+    deadline = time.perf_counter() + seconds
+    threads = [threading.Thread(target=_client, args=(port, deadline, results[i])) for i in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    for s in idle_socks:
+        s.close()
+    server.shutdown()
+    server.server_close()
+    latencies = sorted(x for r in results for x in r)
+    if not latencies:
+        return 0.0, 0.0, 0.0
+    return (len(latencies) / elapsed,
+            latencies[len(latencies) // 2] * 1000,
+            latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--idle", type=int, default=0)
+    parser.add_argument("--modes", default="single,pool,asyncio")
+    args = parser.parse_args()
+
+    db.DB_BACKEND = "memory"
+    for i in range(20):
+        db.add_record({"id": f"TAC-{i:02d}", "content": "bench", "category": "tactical"}, "bench")
+
+    print(f"clients: {args.clients}  seconds: {args.seconds:g}  idle connections: {args.idle}")
+    for mode in args.modes.split(","):
+        rps, p50, p95 = _run(mode, args.clients, args.seconds, args.idle)
+        print(f"{mode:>8}: {rps:8.0f} req/s  p50 {p50:6.2f} ms  p95 {p95:6.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+响应压缩基准 - 页面与 API JSON 的压缩率，以及逐请求压缩与预压缩的耗时
+
+页面内容近似为 app.py 内联的全部 CSS、JS 模块和规则 JSON。
+
+用法: python benchmarks/bench_compression.py [--requests 200]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+import compression  # noqa: E402
+
+_PAGE_FILES = (
+    "assets/css/style.css",
+    "src/config.js",
+    "src/utils.js",
+    "src/api.js",
+    "src/effects.js",
+    "src/core/Store.js",
+    "src/components/GlitchText.js",
+    "src/main.js",
+    "assets/data/rules.json",
+)
+
+
+def _page():
+    parts = []
+    for name in _PAGE_FILES:
+        with open(os.path.join(ROOT, name), "rb") as f:
+            parts.append(f.read())
+    return b"\n".join(parts)
+
+
+def _history_json(items):
+    rows = [{"id": i, "rule_id": f"TAC-{i % 50:02d}", "content": "规则内容" * 8, "category": "tactical",
+             "timestamp": "2024-01-01T00:00:00+00:00"} for i in range(items)]
+    return json.dumps({"items": rows, "ok": True}, ensure_ascii=False).encode("utf-8")
+
+
+def _per_request_ms(fn, requests):
+    start = time.perf_counter()
+    for _ in range(requests):
+        fn()
+    return (time.perf_counter() - start) / requests * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+    accept = "gzip, deflate, br"
+    print(f"encodings: {', '.join(compression.available_encodings())}  threshold: {compression.COMPRESS_MIN_BYTES} B")
+
+    page = _page()
+    start = time.perf_counter()
+    payload = compression.StaticPayload(page, "text/html; charset=utf-8")
+    build_ms = (time.perf_counter() - start) * 1000
+    report = payload.report()
+    print(f"page: {report['bytes']} B -> {report['encoded_bytes']}  saved {report['saved_bytes']} B "
+          f"({report['saved_pct']}%)  precompress once: {build_ms:.1f} ms")
+    print(f"  per request, compress: {_per_request_ms(lambda: compression.encode(page, accept), args.requests):.3f} ms"
+          f"  precompressed: {_per_request_ms(lambda: payload.select(accept), args.requests):.4f} ms")
+
+    for items in (8, 20, 200):
+        data = _history_json(items)
+        body, encoding = compression.encode(data, accept)
+        ms = _per_request_ms(lambda: compression.encode(data, accept), args.requests)
+        print(f"history list {items:>3} items: {len(data):>6} B -> {len(body):>6} B ({encoding or 'identity'})  {ms:.3f} ms/response")
+
+
+if __name__ == '__main__':
+    main()
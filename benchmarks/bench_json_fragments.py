@@ -0,0 +1,67 @@
+"""
+JSON 片段拼接基准 - 列表响应的序列化耗时
+
+对比三种方式组装 /api/history/list 的响应体：
+    dumps      每次把行转换为 dict 后整体 json.dumps（旧实现）
+    cold       片段缓存为空，逐条编码并写入缓存
+    fragments  片段已缓存（写入时编码），只做字节拼接
+
+用法: python benchmarks/bench_json_fragments.py [--repeat 200]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import api_server  # noqa: E402
+
+
+def _rows(count):
+    return [
+        (i, f"TAC-{i % 50:02d}", f"规则内容 {i % 50} " * 4, "tactical", f"2024-01-01T00:00:{i % 60:02d}.000000+00:00")
+        for i in range(count, 0, -1)
+    ]
+
+
+def _old(rows):
+    return json.dumps({"items": [api_server._row_item(r) for r in rows], "ok": True}, ensure_ascii=False).encode("utf-8")
+
+
+def _new(rows):
+    return api_server._encode_json({"items": api_server._items_json(rows), "ok": True})
+
+
+def _cold(rows):
+    api_server._item_fragment.cache_clear()
+    return _new(rows)
+
+
+def _time_us(fn, rows, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(rows)
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+    print(f"encoder: {'orjson' if api_server.orjson is not None else 'json'}  "
+          f"fragment cache: {api_server.API_FRAGMENT_CACHE}")
+    for count in (20, 200, 2000):
+        rows = _rows(count)
+        assert json.loads(_old(rows)) == json.loads(_new(rows))
+        old = _time_us(_old, rows, args.repeat)
+        cold = _time_us(_cold, rows, max(1, args.repeat // 10))
+        _new(rows)
+        warm = _time_us(_new, rows, args.repeat)
+        print(f"{count:>5} items: dumps {old:9.1f} us  cold {cold:9.1f} us  fragments {warm:9.1f} us  "
+              f"({old / warm:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+内存存储锁争用基准 - 并发写入时比较分段锁与单把锁的等待次数和等待时间
+
+用法: python benchmarks/bench_memory_locks.py [--threads 8] [--ops 20000] [--stripes 16]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import db  # noqa: E402
+
+RULE = {"id": "TAC-01", "content": "规则1", "category": "tactical"}
+
+
+def _writer(index, ops, clients, barrier):
+    barrier.wait()
+    for i in range(ops):
+        db.add_record(RULE, f"cid_{index}_{i % clients}")
+        if i % 10 == 0:
+            db.get_recent_history(10, f"cid_{index}_{i % clients}")
+
+
+def _run(stripes, threads, ops, clients):
+    db._memory_stripes = tuple(db._TimedLock() for _ in range(stripes))
+    db._memory_reset()
+    barrier = threading.Barrier(threads + 1)
+    workers = [threading.Thread(target=_writer, args=(i, ops, clients, barrier)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+    return threads * ops / elapsed, db.get_lock_stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--ops", type=int, default=20000, help="每个线程的写入次数")
+    parser.add_argument("--clients", type=int, default=50, help="每个线程写入的客户端数")
+    parser.add_argument("--stripes", type=int, default=db.MEMORY_LOCK_STRIPES)
+    args = parser.parse_args()
+
+    db.DB_BACKEND = "memory"
+    db.MEMORY_JOURNAL_DIR = ""
+    print(f"threads: {args.threads}  ops/thread: {args.ops:,}  clients/thread: {args.clients}")
+    for stripes in (1, args.stripes):
+        ops_per_sec, stats = _run(stripes, args.threads, args.ops, args.clients)
+        print(f"stripes {stripes:>3}: {ops_per_sec:>10,.0f} ops/s  "
+              f"contended {stats['contended']:>7,} / {stats['acquisitions']:,}  "
+              f"wait total {stats['wait_ms_total']:>9.1f} ms  max {stats['wait_ms_max']:.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+内存记录表示基准 - 比较旧的 6 键 dict 与 db._Record 的每条记录字节数
+
+用法: python benchmarks/bench_memory_records.py [--count 1000000]
+"""
+import argparse
+import datetime
+import json
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import db  # noqa: E402
+
+
+def _load_rules():
+    rules_path = os.path.join(os.path.dirname(__file__), '..', 'assets', 'data', 'rules.json')
+    with open(rules_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _payloads(rules, count, clients):
+    """模拟每次请求独立解析出的 JSON 负载（字符串对象互不共享）"""
+    raw = [json.dumps(rule, ensure_ascii=False) for rule in rules]
+    base = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    for i in range(count):
+        rule = json.loads(raw[i % len(raw)])
+        client_id = f"cid_1700000000000_{i % clients:032x}"
+        timestamp = (base + datetime.timedelta(seconds=i)).isoformat()
+        yield i + 1, rule, client_id, timestamp
+
+
+def build_dicts(rules, count, clients):
+    return [
+        {
+            "id": record_id,
+            "rule_id": rule["id"],
+            "content": rule["content"],
+            "category": rule.get("category", ""),
+            "timestamp": timestamp,
+            "client_id": client_id,
+        }
+        for record_id, rule, client_id, timestamp in _payloads(rules, count, clients)
+    ]
+
+
+def build_records(rules, count, clients):
+    return [
+        db._Record(
+            record_id,
+            rule["id"],
+            rule["content"],
+            rule.get("category", ""),
+            client_id,
+            db._timestamp_to_us(timestamp),
+        )
+        for record_id, rule, client_id, timestamp in _payloads(rules, count, clients)
+    ]
+
+
+def measure(builder, rules, count, clients):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    records = builder(rules, count, clients)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del records
+    return (after - before) / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--count", type=int, default=1000000)
+    parser.add_argument("--clients", type=int, default=1000)
+    args = parser.parse_args()
+
+    rules = _load_rules()
+    dict_bytes = measure(build_dicts, rules, args.count, args.clients)
+    slot_bytes = measure(build_records, rules, args.count, args.clients)
+
+    print(f"records: {args.count:,}  clients: {args.clients:,}  rules: {len(rules)}")
+    print(f"dict    : {dict_bytes:8.1f} bytes/record")
+    print(f"_Record : {slot_bytes:8.1f} bytes/record")
+    print(f"saving  : {(1 - slot_bytes / dict_bytes) * 100:.1f}%  ({dict_bytes / slot_bytes:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
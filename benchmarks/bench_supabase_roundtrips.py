@@ -0,0 +1,139 @@
+"""
+Supabase 往返基准 - 用本地 PostgREST 桩测量写入与撤销的请求数和耗时
+
+桩服务对每个请求加上固定延迟模拟云端往返，对比单请求撤销与旧的“查询 + 删除”两步撤销。
+
+用法: python benchmarks/bench_supabase_roundtrips.py [--actions 200] [--rtt-ms 20]
+"""
+import argparse
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import db  # noqa: E402
+
+
+class _Stub:
+    """只实现 history 表写入、读取和删除的 PostgREST 桩"""
+
+    def __init__(self, rtt_ms):
+        self.rtt = rtt_ms / 1000
+        self.lock = threading.Lock()
+        self.rows = []
+        self.next_id = 1
+        self.requests = 0
+        self.limited_delete = True  # False 时模拟不支持带 limit 的 DELETE 的旧版 PostgREST
+
+
+def _make_handler(stub):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def setup(self):
+            super().setup()
+            # 响应头与响应体分两次写出，关闭 Nagle 避免与延迟确认叠加出 40ms 等待
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        def log_message(self, format, *args):
+            pass
+
+        def _reply(self, status, payload):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _params(self):
+            with stub.lock:
+                stub.requests += 1
+            time.sleep(stub.rtt)
+            return {k: v[0] for k, v in parse_qs(urlsplit(self.path).query).items()}
+
+        def do_POST(self):
+            self._params()
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            batch = body if isinstance(body, list) else [body]
+            with stub.lock:
+                inserted = []
+                for p in batch:
+                    inserted.append(dict(p, id=stub.next_id))
+                    stub.next_id += 1
+                stub.rows.extend(inserted)
+            self._reply(201, inserted)
+
+        def do_GET(self):
+            params = self._params()
+            client = params.get("client_id", "eq.")[3:]
+            with stub.lock:
+                rows = [r for r in reversed(stub.rows) if r["client_id"] == client]
+            self._reply(200, rows[:int(params.get("limit", 1000))])
+
+        def do_DELETE(self):
+            params = self._params()
+            client = params["client_id"][3:]
+            with stub.lock:
+                if "order" in params:
+                    if not stub.limited_delete:
+                        return self._reply(400, {"message": "limit not supported"})
+                    deleted = [r for r in reversed(stub.rows) if r["client_id"] == client][:1]
+                else:
+                    wanted = params["id"][3:].strip("()").split(",")
+                    deleted = [r for r in stub.rows if str(r["id"]) in wanted and r["client_id"] == client]
+                stub.rows = [r for r in stub.rows if r not in deleted]
+            self._reply(200, deleted)
+
+    return Handler
+
+
+def _run(stub, actions, limited_delete):
+    stub.limited_delete = limited_delete
+    db._limited_delete_supported = True
+    db._read_cache.invalidate()
+    rule = {"id": "TAC-01", "content": "bench", "category": "tactical"}
+    timings = {"add": [0.0, 0], "undo": [0.0, 0]}
+    for i in range(actions):
+        for name, fn in (("add", lambda: db.add_record(rule, f"cid_{i}")),
+                         ("undo", lambda: db.delete_last_record(f"cid_{i}"))):
+            before = stub.requests
+            start = time.perf_counter()
+            fn()
+            timings[name][0] += time.perf_counter() - start
+            timings[name][1] += stub.requests - before
+    return {name: (elapsed / actions * 1000, requests / actions) for name, (elapsed, requests) in timings.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--actions", type=int, default=200)
+    parser.add_argument("--rtt-ms", type=float, default=20.0)
+    args = parser.parse_args()
+
+    stub = _Stub(args.rtt_ms)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _make_handler(stub))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    db.SUPABASE_URL = f"http://127.0.0.1:{server.server_address[1]}"
+    db.SUPABASE_ANON_KEY = "bench"
+    db.DB_BACKEND = "supabase"
+
+    print(f"actions: {args.actions}  simulated rtt: {args.rtt_ms:g} ms")
+    for label, limited in (("two-step undo", False), ("single-request", True)):
+        result = _run(stub, args.actions, limited)
+        for name, (ms, requests) in result.items():
+            print(f"{label:>15} {name:<5}: {ms:7.2f} ms/op  {requests:.2f} requests/op")
+
+    server.shutdown()
+    db.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -14,6 +14,10 @@ const isLocalhost = typeof window !== 'undefined'
     && (window.location.hostname === 'localhost' || window.location.hostname === '127.0.0.1');
 
 let remoteAvailable = !!(apiBase && isLocalhost);
+// 旧版服务器没有 /api/history/snapshot，收到 404 后改回分别请求
+let snapshotAvailable = true;
+// 同理，没有 /api/draw 的服务器由前端抽取后再写入
+let drawAvailable = true;
 
 function loadHistory() {
     try {
@@ -142,7 +146,11 @@ async function tryRemoteGet(path, options) {
     const url = new URL(`${apiBase}${path}`);
     url.searchParams.set('client_id', clientId);
     const res = await fetch(url.toString());
-    if (!res.ok) throw new Error(`HTTP ${res.status}`);
+    if (!res.ok) {
+        const err = new Error(`HTTP ${res.status}`);
+        err.status = res.status;
+        throw err;
+    }
     if (onStatusChange) onStatusChange('API 已连接');
     return await res.json();
 }
@@ -154,7 +162,11 @@ async function tryRemotePost(path, payload, options) {
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({ ...(payload || {}), client_id: clientId }),
     });
-    if (!res.ok) throw new Error(`HTTP ${res.status}`);
+    if (!res.ok) {
+        const err = new Error(`HTTP ${res.status}`);
+        err.status = res.status;
+        throw err;
+    }
     if (onStatusChange) onStatusChange('API 已连接');
     return await res.json();
 }
@@ -183,11 +195,73 @@ export async function apiGet(path, options = {}) {
     if (path.startsWith('/api/history/list')) return localList(limit);
     if (path.startsWith('/api/history/recent')) return localRecent(limit);
     if (path.startsWith('/api/history/stats')) return localStats();
+    if (path.startsWith('/api/history/snapshot')) {
+        const recent = url ? parseInt(url.searchParams.get('recent') || '10', 10) : 10;
+        return {
+            ok: true,
+            items: localList(limit).items,
+            ids: localRecent(recent).ids,
+            stats: localStats(),
+        };
+    }
     if (path.startsWith('/api/health')) return { ok: true, db_connected: true, mode: 'local' };
 
     return { ok: false, error: 'not_found' };
 }
 
+/**
+ * History list, recent rule ids and stats in one call.
+ * Falls back to three separate requests when the server has no snapshot endpoint.
+ */
+export async function apiSnapshot(limit = 20, recent = 10, options = {}) {
+    const path = `/api/history/snapshot?limit=${limit}&recent=${recent}`;
+
+    if (remoteAvailable && snapshotAvailable) {
+        try {
+            return await tryRemoteGet(path, options);
+        } catch (err) {
+            if (err.status === 404) {
+                snapshotAvailable = false;
+            } else {
+                console.error('Remote API error, fallback to local:', err);
+                remoteAvailable = false;
+            }
+        }
+    }
+    if (!remoteAvailable) return apiGet(path, options);
+
+    const [list, ids, stats] = await Promise.all([
+        apiGet(`/api/history/list?limit=${limit}`, options),
+        apiGet(`/api/history/recent?limit=${recent}`),
+        apiGet('/api/history/stats'),
+    ]);
+    return {
+        ok: true,
+        items: (list && list.items) || [],
+        ids: (ids && ids.ids) || [],
+        stats,
+    };
+}
+
+/**
+ * Server-side draw: excludes recent rules, picks and records in one request.
+ * Returns null when the draw has to happen in the browser (local mode or old server).
+ */
+export async function apiDraw(count, category, options = {}) {
+    if (!remoteAvailable || !drawAvailable) return null;
+    try {
+        return await tryRemotePost(count === 2 ? '/api/draw2' : '/api/draw', { category }, options);
+    } catch (err) {
+        if (err.status === 404) {
+            drawAvailable = false;
+        } else {
+            console.error('Remote API error, fallback to local:', err);
+            remoteAvailable = false;
+        }
+        return null;
+    }
+}
+
 /**
  * POST handler (local first on non-localhost)
  */
@@ -0,0 +1,184 @@
+"""
+asyncio 版 API 服务器 - API_SERVER_MODE=asyncio 时使用
+
+基于 asyncio streams 的 HTTP/1.1 服务器：连接的读写、keep-alive 和空闲超时都在事件循环中
+协作调度，空闲连接只占一个协程而不是一个线程。接口逻辑与线程池服务器共用 api_server.dispatch，
+数据库调用在线程池中执行，不阻塞事件循环。
+"""
+import asyncio
+import concurrent.futures
+import socket
+import threading
+import time
+
+import api_server
+
+_MAX_HEADER_BYTES = 64 * 1024
+_REASONS = {
+    200: "OK",
+    204: "No Content",
+    304: "Not Modified",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+}
+
+
+class _BadRequest(Exception):
+    pass
+
+
+class AsyncApiServer:
+    """与 HTTPServer 用法一致：构造时绑定端口，serve_forever() 在当前线程运行事件循环"""
+
+    def __init__(self, server_address, workers=api_server.API_WORKERS,
+                 keepalive_timeout=api_server.API_KEEPALIVE_TIMEOUT,
+                 max_requests=api_server.API_KEEPALIVE_MAX_REQUESTS):
+        self.keepalive_timeout = keepalive_timeout
+        self.max_requests = max_requests
+        self.workers = workers
+        self.socket = socket.create_server(server_address, reuse_port=False)
+        self.server_address = self.socket.getsockname()
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="api-async")
+        self._loop = None
+        self._stop = asyncio.Event()
+        self._tasks = set()
+        self._stopped = threading.Event()
+        self._stats_lock = threading.Lock()
+        self._handler_time = api_server._Timing()
+        self._stats = {"connections": 0, "open_connections": 0, "requests": 0, "idle_closed": 0}
+
+    # ---- 生命周期 ----
+
+    def serve_forever(self):
+        loop = asyncio.new_event_loop()
+        self._loop = loop
+        try:
+            loop.run_until_complete(self._serve())
+        finally:
+            loop.run_until_complete(loop.shutdown_asyncgens())
+            loop.close()
+            self._stopped.set()
+
+    async def _serve(self):
+        server = await asyncio.start_server(self._client, sock=self.socket, limit=_MAX_HEADER_BYTES)
+        await self._stop.wait()
+        server.close()
+        # 先取消仍打开的连接，wait_closed() 会等待所有连接结束
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await server.wait_closed()
+
+    def shutdown(self):
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._stop.set)
+            self._stopped.wait(5)
+
+    def server_close(self):
+        self.socket.close()
+        self._executor.shutdown(wait=False)
+
+    # ---- 连接处理 ----
+
+    async def _read_request(self, reader):
+        """读取一个请求，返回 (method, target, version, headers, body)；连接关闭返回 None"""
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), self.keepalive_timeout)
+        except asyncio.TimeoutError:
+            with self._stats_lock:
+                self._stats["idle_closed"] += 1
+            return None
+        except asyncio.IncompleteReadError:
+            return None
+        except asyncio.LimitOverrunError:
+            raise _BadRequest("header too large")
+        lines = head.decode("iso-8859-1").split("\r\n")
+        try:
+            method, target, version = lines[0].split(" ", 2)
+        except ValueError:
+            raise _BadRequest("bad request line")
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+        body = b""
+        length = int(headers.get("content-length") or 0)
+        if length:
+            body = await asyncio.wait_for(reader.readexactly(length), self.keepalive_timeout)
+        return method, target, version, headers, body
+
+    def _response(self, status, body, headers, keep_alive):
+        lines = [f"HTTP/1.1 {status} {_REASONS.get(status, 'OK')}"]
+        lines.extend(f"{name}: {value}" for name, value in headers)
+        if status not in (204, 304):  # 204 / 304 不带 Content-Length（RFC 9110 §8.6）
+            lines.append(f"Content-Length: {len(body or b'')}")
+        lines.append("Connection: keep-alive" if keep_alive else "Connection: close")
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + (body or b"")
+
+    async def _client(self, reader, writer):
+        sock = writer.get_extra_info("socket")
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        task = asyncio.current_task()
+        self._tasks.add(task)
+        with self._stats_lock:
+            self._stats["connections"] += 1
+            self._stats["open_connections"] += 1
+        loop = asyncio.get_running_loop()
+        served = 0
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                except (_BadRequest, ValueError, asyncio.TimeoutError):
+                    writer.write(self._response(400, *api_server.encode_response({"error": "无效的请求", "ok": False}), False))
+                    await writer.drain()
+                    return
+                if request is None:
+                    return
+                method, target, version, headers, body = request
+                served += 1
+                connection = headers.get("connection", "").lower()
+                keep_alive = served < self.max_requests and (
+                    connection == "keep-alive" if version == "HTTP/1.0" else connection != "close"
+                )
+                started = time.perf_counter()
+                if method == "OPTIONS":
+                    status, data, extra = 204, None, api_server.CORS_HEADERS
+                elif method in ("GET", "POST"):
+                    # 序列化与压缩也在线程池中进行，大响应不阻塞事件循环
+                    status, data, extra = await loop.run_in_executor(
+                        self._executor, api_server.respond, method, target, body, self.get_stats,
+                        headers.get("if-none-match"), headers.get("accept-encoding"),
+                    )
+                else:
+                    status = 405
+                    data, extra = api_server.encode_response({"error": "不支持的方法", "ok": False})
+                writer.write(self._response(status, data, extra, keep_alive))
+                await writer.drain()
+                with self._stats_lock:
+                    self._stats["requests"] += 1
+                    self._handler_time.add(time.perf_counter() - started)
+                if not keep_alive:
+                    return
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self._tasks.discard(task)
+            with self._stats_lock:
+                self._stats["open_connections"] -= 1
+            writer.close()
+
+    def get_stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+            stats["handler_time"] = self._handler_time.summary()
+        stats["mode"] = "asyncio"
+        stats["workers"] = self.workers
+        return stats
@@ -0,0 +1,677 @@
+"""
+历史记录 API 服务 - app.py 内嵌的 HTTP 接口
+
+ApiHandler 处理 /api/history/*、/api/draw(2) 与 /api/health；服务器有三种模式（API_SERVER_MODE）：
+    pool    固定数量的工作线程从有界队列取连接处理，队列满时直接返回 503（默认）
+    single  标准库 HTTPServer，逐个处理请求（HTTP/1.0，每个请求一个连接）
+    asyncio 基于 asyncio streams 的事件循环服务器（见 api_async.py）
+工作线程池模式分别统计请求在队列中的等待时间和处理时间。
+
+pool 模式使用 HTTP/1.1 持久连接：工作线程处理完请求后把连接交给 keep-alive 线程，
+由 selector 等待下一个请求到达后再重新入队，空闲连接不占用工作线程。
+
+list / recent / stats / snapshot 按客户端数据版本（db.get_client_version）返回 ETag，
+带 If-None-Match 且版本未变的请求直接得到 304，不查询存储后端。
+JSON 响应按 Accept-Encoding 压缩（见 compression.py）；register_static 注册的静态内容
+（渲染好的页面）在注册时预压缩一次，请求时只选择编码。
+"""
+import collections
+import functools
+import json
+import os
+import queue
+import selectors
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import build_cache
+import catalog
+import compression
+import db
+import draw
+
+try:
+    import orjson  # 可选：更快的 JSON 编码器，未安装时使用标准库 json
+except ImportError:
+    orjson = None
+
+API_SERVER_MODE = os.environ.get("API_SERVER_MODE", "pool").strip().lower()
+# 工作线程数与等待队列深度；队列满时新连接立即得到 503，而不是无限排队
+API_WORKERS = max(1, int(os.environ.get("API_WORKERS", "16")))
+API_QUEUE_DEPTH = max(1, int(os.environ.get("API_QUEUE_DEPTH", "128")))
+# 持久连接空闲超过该秒数后关闭；单个连接最多处理的请求数，达到后响应带 Connection: close
+API_KEEPALIVE_TIMEOUT = float(os.environ.get("API_KEEPALIVE_TIMEOUT", "5"))
+API_KEEPALIVE_MAX_REQUESTS = max(1, int(os.environ.get("API_KEEPALIVE_MAX_REQUESTS", "100")))
+# 缓存的单条记录 JSON 片段数；列表与快照响应由片段拼接而成
+API_FRAGMENT_CACHE = max(0, int(os.environ.get("API_FRAGMENT_CACHE", "10000")))
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    timeout = API_KEEPALIVE_TIMEOUT  # 读取请求的套接字超时
+
+    def setup(self):
+        super().setup()
+        # 响应头与响应体分两次写出，关闭 Nagle 避免与客户端延迟确认叠加出 40ms 等待
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        served = getattr(self.server, "connection_requests", None)
+        self.requests_handled = served(self.connection) if served is not None else 0
+
+    def handle(self):
+        if getattr(self.server, "park_connection", None) is None:
+            return super().handle()
+        # 只处理已到达的请求，连接空闲时交还服务器，由 keep-alive 线程等待下一个请求
+        self.close_connection = True
+        self.handle_one_request()
+        while not self.close_connection and self._has_pending_input():
+            self.handle_one_request()
+
+    def handle_one_request(self):
+        super().handle_one_request()
+        self.requests_handled += 1
+
+    def _has_pending_input(self):
+        """客户端是否已发来下一个请求（流水线），不阻塞"""
+        self.connection.settimeout(0)
+        try:
+            return bool(self.rfile.peek(1))
+        except OSError:
+            return False
+        finally:
+            self.connection.settimeout(self.timeout)
+
+    def log_message(self, format, *args):
+        # 静默日志，避免输出到控制台
+        pass
+
+    def _end_headers(self, length):
+        if length is not None:
+            self.send_header("Content-Length", str(length))
+        if self.requests_handled + 1 >= API_KEEPALIVE_MAX_REQUESTS:
+            self.send_header("Connection", "close")  # send_header 同时设置 close_connection
+        self.end_headers()
+
+    def _send(self, status, body, headers):
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        # 204 / 304 没有响应体，也不带 Content-Length（RFC 9110 §8.6）
+        self._end_headers(len(body) if body is not None and status != 204 else None)
+        if body is not None:
+            self.wfile.write(body)
+
+    def _send_json(self, obj, status=200, headers=()):
+        self._send(status, *encode_response(obj, headers, self.headers.get("Accept-Encoding")))
+
+    def _send_error(self, message, status=500):
+        self._send_json({"error": message, "ok": False}, status=status)
+
+    def _server_stats(self):
+        stats = getattr(self.server, "get_stats", None)
+        return stats() if stats is not None else None
+
+    def do_OPTIONS(self):
+        self.send_response(204)
+        for name, value in CORS_HEADERS:
+            self.send_header(name, value)
+        self._end_headers(None)
+
+    def do_GET(self):
+        self._send(*respond(
+            "GET", self.path, None, self._server_stats,
+            self.headers.get("If-None-Match"), self.headers.get("Accept-Encoding"),
+        ))
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length) if length else b"{}"
+        self._send(*respond("POST", self.path, body, self._server_stats, None, self.headers.get("Accept-Encoding")))
+
+
+CORS_HEADERS = (
+    ("Access-Control-Allow-Origin", "*"),
+    ("Access-Control-Allow-Headers", "Content-Type, If-None-Match"),
+    ("Access-Control-Allow-Methods", "GET, POST, OPTIONS"),
+    ("Access-Control-Expose-Headers", "ETag"),
+)
+
+# 历史读取接口按客户端数据版本生成 ETag：浏览器可以缓存，但每次使用前都要带 If-None-Match
+# 重新验证，版本未变时得到不查询后端的 304。写接口、健康检查和错误响应不缓存。
+_REVALIDATE = "private, no-cache"
+_NO_STORE = (("Cache-Control", "no-store"),)
+
+
+def _error(message, status):
+    return status, {"error": message, "ok": False}, _NO_STORE
+
+
+def _etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # 弱比较：忽略 W/ 前缀
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(","))
+
+
+def _conditional(client_id, if_none_match, build, suffix=""):
+    """按客户端数据版本处理条件请求：版本未变时返回 304 且不调用 build。
+
+    版本号在读取数据之前取得，读取期间发生的写入只会让下一次请求的 ETag 不匹配，
+    不会把新数据标成旧版本。降级（熔断期间）的结果不带 ETag，避免恢复后仍被当作最新。
+    """
+    # 同一版本的压缩与未压缩响应共用 ETag，因此使用弱 ETag
+    etag = f'W/"{db.get_client_version(client_id)}{suffix}"'
+    headers = (("ETag", etag), ("Cache-Control", _REVALIDATE))
+    if _etag_matches(if_none_match, etag):
+        return 304, None, headers
+    obj = build()
+    if obj.get("degraded"):
+        return 200, obj, _NO_STORE
+    return 200, obj, headers
+
+
+def _row_item(r):
+    return {
+        "id": r[0],
+        "rule_id": r[1],
+        "content": r[2],
+        "category": r[3],
+        "timestamp": r[4],
+    }
+
+
+def _dumps(obj):
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+
+class _Raw:
+    """已序列化的 JSON 值，组装响应时原样拼接"""
+
+    __slots__ = ("data",)
+
+    def __init__(self, data):
+        self.data = data
+
+
+@functools.lru_cache(maxsize=API_FRAGMENT_CACHE)
+def _item_fragment(row):
+    """单条记录的 JSON 片段。以整行元组为键，内容相同的行结果必然相同，无需失效"""
+    return _dumps(_row_item(row))
+
+
+def _warm_fragment(item):
+    """写入时编码片段，之后的列表读取直接复用"""
+    _item_fragment((item.get("id"), item.get("rule_id"), item.get("content"), item.get("category"),
+                    item.get("timestamp")))
+
+
+def _items_json(rows):
+    """由缓存的片段拼接 items 数组，每条记录只在首次出现（通常是写入时）编码一次"""
+    return _Raw(b"[" + b",".join([_item_fragment(tuple(r)) for r in rows]) + b"]")
+
+
+def _encode_json(obj):
+    """序列化响应对象；顶层值为 _Raw 时直接拼接已编码的片段"""
+    if not any(type(value) is _Raw for value in obj.values()):
+        return _dumps(obj)
+    parts = [
+        _dumps(key) + b":" + (value.data if type(value) is _Raw else _dumps(value))
+        for key, value in obj.items()
+    ]
+    return b"{" + b",".join(parts) + b"}"
+
+
+_static_lock = threading.Lock()
+_static_payloads = {}  # 路径 -> compression.StaticPayload
+
+
+def register_static(path, data, content_type):
+    """注册静态内容并一次性预压缩，返回 (payload, 是否重新压缩)。
+
+    内容未变时沿用已有的预压缩结果，Streamlit 每次重跑脚本重复注册不会重复压缩。
+    """
+    with _static_lock:
+        payload = _static_payloads.get(path)
+        if payload is not None and payload.data == data:
+            return payload, False
+    payload = compression.StaticPayload(data, content_type)
+    with _static_lock:
+        _static_payloads[path] = payload
+    return payload, True
+
+
+def get_static_report():
+    """各静态内容的原始大小、各编码大小与节省的字节数"""
+    with _static_lock:
+        payloads = list(_static_payloads.items())
+    return {path: payload.report() for path, payload in payloads}
+
+
+def _static_response(path, if_none_match, accept_encoding):
+    with _static_lock:
+        payload = _static_payloads.get(path)
+    if payload is None:
+        return None
+    headers = list(CORS_HEADERS) + [
+        ("ETag", payload.etag),
+        ("Cache-Control", "no-cache"),
+        ("Vary", "Accept-Encoding"),
+    ]
+    if _etag_matches(if_none_match, payload.etag):
+        return 304, None, headers
+    body, encoding = payload.select(accept_encoding)
+    headers.append(("Content-Type", payload.content_type))
+    if encoding:
+        headers.append(("Content-Encoding", encoding))
+    return 200, body, headers
+
+
+def encode_response(obj, headers=(), accept_encoding=None):
+    """把 dispatch 的 JSON 结果编码为 (响应体, 响应头)；超过阈值且客户端接受时压缩，304 没有响应体"""
+    headers = list(CORS_HEADERS) + list(headers) + [("Vary", "Accept-Encoding")]
+    if obj is None:
+        return None, headers
+    body, encoding = compression.encode(_encode_json(obj), accept_encoding)
+    headers.append(("Content-Type", "application/json; charset=utf-8"))
+    if encoding:
+        headers.append(("Content-Encoding", encoding))
+    return body, headers
+
+
+def respond(method, target, body=None, server_stats=None, if_none_match=None, accept_encoding=None):
+    """处理一个 GET / POST 请求并编码响应，返回 (状态码, 响应体或 None, 响应头)，两种服务器共用"""
+    if method == "GET":
+        static = _static_response(urlparse(target).path, if_none_match, accept_encoding)
+        if static is not None:
+            return static
+    status, obj, headers = dispatch(method, target, body, server_stats, if_none_match)
+    return (status, *encode_response(obj, headers, accept_encoding))
+
+
+def dispatch(method, target, body=None, server_stats=None, if_none_match=None):
+    """处理一个 GET / POST 接口请求，返回 (状态码, JSON 对象, 附加响应头)。
+
+    与传输层无关，线程池服务器和 asyncio 服务器共用；server_stats 为返回服务器指标的可调用对象，
+    if_none_match 为请求的 If-None-Match 头。状态码为 304 时 JSON 对象为 None。
+    """
+    parsed = urlparse(target)
+    if method == "GET":
+        try:
+            return _dispatch_get(parsed, server_stats, if_none_match)
+        except Exception as e:
+            print(f"API Error in GET {parsed.path}: {e}")
+            return _error(f"服务器错误: {str(e)}", 500)
+
+    try:
+        payload = json.loads((body or b"{}").decode("utf-8"))
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return _error("无效的JSON数据", 400)
+    try:
+        return _dispatch_post(parsed, payload)
+    except Exception as e:
+        print(f"API Error in POST {parsed.path}: {e}")
+        return _error(f"服务器错误: {str(e)}", 500)
+
+
+def _dispatch_get(parsed, server_stats, if_none_match=None):
+    if parsed.path == "/api/history/list":
+        qs = parse_qs(parsed.query)
+        limit = int(qs.get("limit", ["20"])[0])
+        client_id = qs.get("client_id", [""])[0]
+        if not client_id:
+            return _error("缺少客户端ID", 400)
+        return _conditional(client_id, if_none_match, lambda: {
+            "items": _items_json(db.get_recent_history(limit, client_id)),
+            "ok": True,
+        })
+
+    if parsed.path == "/api/history/recent":
+        qs = parse_qs(parsed.query)
+        limit = int(qs.get("limit", ["10"])[0])
+        client_id = qs.get("client_id", [""])[0]
+        if not client_id:
+            return _error("缺少客户端ID", 400)
+        return _conditional(client_id, if_none_match, lambda: {
+            "ids": db.get_recent_ids(limit, client_id),
+            "ok": True,
+        })
+
+    if parsed.path == "/api/history/stats":
+        qs = parse_qs(parsed.query)
+        client_id = qs.get("client_id", [""])[0]
+        if not client_id:
+            return _error("缺少客户端ID", 400)
+
+        def build():
+            stats = db.get_stats(client_id)
+            stats["ok"] = True
+            return stats
+
+        # 今日计数随 UTC 日期变化，ETag 附带日期
+        return _conditional(client_id, if_none_match, build, time.strftime("-%Y%m%d", time.gmtime()))
+
+    if parsed.path == "/api/history/snapshot":
+        # 一次返回 list、recent 和 stats 三个接口的内容，前端每次操作后只需一个请求
+        qs = parse_qs(parsed.query)
+        limit = int(qs.get("limit", ["20"])[0])
+        recent = int(qs.get("recent", ["10"])[0])
+        client_id = qs.get("client_id", [""])[0]
+        if not client_id:
+            return _error("缺少客户端ID", 400)
+
+        def build():
+            snapshot = db.get_snapshot(client_id, limit, recent)
+            snapshot["items"] = _items_json(snapshot["items"])
+            snapshot["ok"] = True
+            return snapshot
+
+        return _conditional(client_id, if_none_match, build, time.strftime("-%Y%m%d", time.gmtime()))
+
+    if parsed.path == "/api/health":
+        # 检查数据库连接状态
+        try:
+            db_health = db.health_check()
+            backend = db.get_backend()
+            result = {"ok": True, "db_connected": db_health, "mode": backend}
+            if backend == "memory":
+                result["memory"] = db.get_memory_usage()
+            elif backend == "supabase":
+                result["http_pool"] = db.get_http_pool_stats()
+                result["circuit_breaker"] = db.get_circuit_breaker_stats()
+                cache_stats = db.get_read_cache_stats()
+                if cache_stats is not None:
+                    result["read_cache"] = cache_stats
+                write_stats = db.get_write_behind_stats()
+                if write_stats is not None:
+                    result["write_behind"] = write_stats
+            stats = server_stats() if server_stats is not None else None
+            if stats is not None:
+                result["server"] = stats
+            result["compression"] = dict(compression.get_stats(), static=get_static_report())
+            result["catalog"] = catalog.get_stats()
+            build_stats = build_cache.get_stats()
+            if build_stats:
+                result["build_cache"] = build_stats
+            return 200, result, _NO_STORE
+        except Exception as e:
+            return 200, {"ok": True, "db_connected": False, "db_error": str(e)}, _NO_STORE
+
+    return _error("未找到接口", 404)
+
+
+def _dispatch_post(parsed, payload):
+    if parsed.path == "/api/history/add":
+        client_id = payload.get("client_id")
+        if not client_id:
+            return _error("缺少客户端ID", 400)
+        if not payload.get("id") or not payload.get("content"):
+            return _error("缺少必要的字段", 400)
+
+        item = db.add_record(payload, client_id)
+        _warm_fragment(item)
+        return 200, {"ok": True, "item": item}, _NO_STORE
+
+    if parsed.path in ("/api/draw", "/api/draw2"):
+        # 服务端抽取并记录：排除最近抽到的规则、随机选择和写入在一个请求内完成
+        client_id = payload.get("client_id")
+        if not client_id:
+            return _error("缺少客户端ID", 400)
+        category = payload.get("category") or draw.ALL
+        count = 2 if parsed.path == "/api/draw2" else 1
+        rules = catalog.get_catalog()
+        if len(rules.by_category(category)) < count:
+            return 200, {"ok": False, "message": "当前分类规则不足"}, _NO_STORE
+
+        items = db.draw_records(client_id, lambda recent: draw.sample(rules, category, count, recent),
+                                draw.DRAW_RECENT_LIMIT)
+        for item in items:
+            _warm_fragment(item)
+        return 200, {"ok": True, "items": items}, _NO_STORE
+
+    if parsed.path == "/api/history/undo":
+        client_id = payload.get("client_id")
+        if not client_id:
+            return _error("缺少客户端ID", 400)
+
+        ids = payload.get("ids") or []
+        if ids:
+            deleted_count = db.delete_records_by_ids(client_id, ids)
+            return 200, {"ok": True, "deleted_count": deleted_count}, _NO_STORE
+
+        row = db.delete_last_record(client_id)
+        if not row:
+            return 200, {"ok": False, "message": "没有可撤销的记录"}, _NO_STORE
+
+        return 200, {"ok": True, "item": _row_item(row)}, _NO_STORE
+
+    return _error("未找到接口", 404)
+
+
+class _Timing:
+    """耗时统计：次数、累计、最大值，以及最近若干次的分位数"""
+
+    def __init__(self, recent=1024):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent = collections.deque(maxlen=recent)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.recent.append(seconds)
+
+    def summary(self):
+        ordered = sorted(self.recent)
+
+        def pct(p):
+            return round(ordered[min(len(ordered) - 1, int(len(ordered) * p))] * 1000, 3) if ordered else 0.0
+
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total / self.count * 1000, 3) if self.count else 0.0,
+            "p50_ms": pct(0.5),
+            "p95_ms": pct(0.95),
+            "max_ms": round(self.max * 1000, 3),
+        }
+
+
+_REJECT_BODY = json.dumps({"error": "服务器繁忙", "ok": False}, ensure_ascii=False).encode("utf-8")
+_REJECT_RESPONSE = (
+    b"HTTP/1.0 503 Service Unavailable\r\n"
+    b"Content-Type: application/json; charset=utf-8\r\n"
+    b"Access-Control-Allow-Origin: *\r\n"
+    b"Retry-After: 1\r\n"
+    b"Content-Length: " + str(len(_REJECT_BODY)).encode("ascii") + b"\r\n"
+    b"Connection: close\r\n\r\n" + _REJECT_BODY
+)
+
+
+class WorkerPoolHTTPServer(HTTPServer):
+    """有界队列 + 固定工作线程的 HTTP 服务器。
+
+    监听线程只负责 accept 并入队，工作线程处理请求；慢请求只占用一个工作线程，
+    不会阻塞其他客户端。队列满时监听线程直接写回 503 并关闭连接。
+    保持连接的套接字由 keep-alive 线程用 selector 等待，可读时重新入队。
+    """
+
+    def __init__(self, server_address, handler_class, workers=API_WORKERS, queue_depth=API_QUEUE_DEPTH,
+                 keepalive_timeout=API_KEEPALIVE_TIMEOUT):
+        super().__init__(server_address, handler_class)
+        self.workers = workers
+        self.queue_depth = queue_depth
+        self.keepalive_timeout = keepalive_timeout
+        self._queue = queue.Queue(maxsize=queue_depth)
+        self._stats_lock = threading.Lock()
+        self._queue_wait = _Timing()
+        self._handler_time = _Timing()
+        self._rejected = 0
+        self._busy = 0
+        self._requests = {}  # 套接字 -> 已处理的请求数，同一连接同一时刻只在一个线程中
+        self._keepalive = {"connections": 0, "reused": 0, "idle_closed": 0, "parked": 0}
+        self._closing = False
+        self._parking = collections.deque()
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._keepalive_thread = threading.Thread(target=self._keepalive_loop, name="api-keepalive", daemon=True)
+        self._keepalive_thread.start()
+        self._threads = []
+        for i in range(workers):
+            thread = threading.Thread(target=self._worker, name=f"api-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def process_request(self, request, client_address):
+        with self._stats_lock:
+            self._keepalive["connections"] += 1
+        self._dispatch(request, client_address)
+
+    def _dispatch(self, request, client_address):
+        try:
+            self._queue.put_nowait((request, client_address, time.perf_counter()))
+        except queue.Full:
+            with self._stats_lock:
+                self._rejected += 1
+            try:
+                request.sendall(_REJECT_RESPONSE)
+            except OSError:
+                pass
+            self.shutdown_request(request)
+
+    def connection_requests(self, request):
+        return self._requests.get(request, 0)
+
+    def finish_request(self, request, client_address):
+        """处理连接上已到达的请求，返回是否保持连接"""
+        handler = self.RequestHandlerClass(request, client_address, self)
+        self._requests[request] = handler.requests_handled
+        return not handler.close_connection
+
+    def shutdown_request(self, request):
+        self._requests.pop(request, None)
+        super().shutdown_request(request)
+
+    def park_connection(self, request, client_address):
+        """交给 keep-alive 线程等待下一个请求"""
+        self._parking.append((request, client_address))
+        try:
+            self._wake_w.send(b"\0")
+        except OSError:
+            pass
+
+    def _worker(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            request, client_address, enqueued = item
+            started = time.perf_counter()
+            with self._stats_lock:
+                self._queue_wait.add(started - enqueued)
+                self._busy += 1
+            keep = False
+            try:
+                keep = self.finish_request(request, client_address) and not self._closing
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                if keep:
+                    self.park_connection(request, client_address)
+                else:
+                    self.shutdown_request(request)
+                with self._stats_lock:
+                    self._handler_time.add(time.perf_counter() - started)
+                    self._busy -= 1
+
+    def _keepalive_loop(self):
+        selector = selectors.DefaultSelector()
+        selector.register(self._wake_r, selectors.EVENT_READ)
+        parked = {}  # 套接字 -> (client_address, 开始空闲的时间)
+        while not self._closing:
+            for key, _ in selector.select(timeout=min(1.0, self.keepalive_timeout)):
+                if key.fileobj is self._wake_r:
+                    try:
+                        self._wake_r.recv(4096)
+                    except OSError:
+                        pass
+                    continue
+                request = key.fileobj
+                selector.unregister(request)
+                client_address, _ = parked.pop(request)
+                with self._stats_lock:
+                    self._keepalive["reused"] += 1
+                self._dispatch(request, client_address)
+            now = time.monotonic()
+            while self._parking:
+                request, client_address = self._parking.popleft()
+                try:
+                    selector.register(request, selectors.EVENT_READ)
+                except (ValueError, OSError):
+                    self.shutdown_request(request)
+                    continue
+                parked[request] = (client_address, now)
+            for request, (_, since) in list(parked.items()):
+                if now - since >= self.keepalive_timeout:
+                    selector.unregister(request)
+                    del parked[request]
+                    self.shutdown_request(request)
+                    with self._stats_lock:
+                        self._keepalive["idle_closed"] += 1
+            with self._stats_lock:
+                self._keepalive["parked"] = len(parked)
+        for request in parked:
+            self.shutdown_request(request)
+        selector.close()
+
+    def get_stats(self):
+        with self._stats_lock:
+            return {
+                "mode": "pool",
+                "workers": self.workers,
+                "busy_workers": self._busy,
+                "queue_depth": self.queue_depth,
+                "queued": self._queue.qsize(),
+                "rejected": self._rejected,
+                "keepalive": dict(self._keepalive),
+                "queue_wait": self._queue_wait.summary(),
+                "handler_time": self._handler_time.summary(),
+            }
+
+    def server_close(self):
+        super().server_close()
+        self._closing = True
+        try:
+            self._wake_w.send(b"\0")
+        except OSError:
+            pass
+        self._keepalive_thread.join(timeout=2)
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join(timeout=1)
+        self._wake_r.close()
+        self._wake_w.close()
+
+
+class _SingleHandler(ApiHandler):
+    # 单线程服务器上持久连接会独占唯一的处理线程，保持每个请求一个连接
+    protocol_version = "HTTP/1.0"
+
+
+def create_server(server_address, mode=None):
+    """按 API_SERVER_MODE 创建 API 服务器（未启动）"""
+    mode = mode or API_SERVER_MODE
+    if mode == "single":
+        return HTTPServer(server_address, _SingleHandler)
+    if mode == "asyncio":
+        import api_async
+        return api_async.AsyncApiServer(server_address)
+    return WorkerPoolHTTPServer(server_address, ApiHandler)
@@ -0,0 +1,113 @@
+"""
+构建缓存 - 按输入文件的内容哈希缓存页面构建结果，跨 Streamlit rerun 复用
+
+Streamlit 每次交互都会重新执行 app.py，但导入的模块只加载一次，缓存保存在本模块中即可在
+rerun 之间保留。键由各输入文件内容的 SHA-256 和额外参数（端口、规则目录版本等）组成：
+文件的 mtime 与大小未变时沿用上次计算的哈希，不重新读取；任一输入变化都会得到新的键，
+重新构建，最旧的结果按 BUILD_CACHE_ENTRIES 淘汰。
+"""
+import collections
+import hashlib
+import os
+import threading
+import time
+
+# 每个缓存保留的构建结果数
+BUILD_CACHE_ENTRIES = max(1, int(os.environ.get("BUILD_CACHE_ENTRIES", "4")))
+
+
+class BuildCache:
+    """以输入内容哈希为键的构建结果缓存"""
+
+    def __init__(self, max_entries=BUILD_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+        self._files = {}  # 路径 -> (mtime_ns, 大小, 内容哈希)
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "hashed_files": 0,   # 因 mtime 或大小变化而重新计算哈希的文件数
+            "hit_ms_total": 0.0,
+            "hit_ms_last": 0.0,
+            "build_ms_last": 0.0,
+        }
+
+    def _digest(self, path):
+        """文件内容哈希，mtime 与大小未变时直接返回上次的结果；调用方需持有 _lock"""
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            self._files.pop(path, None)
+            return "missing"
+        cached = self._files.get(path)
+        if cached is not None and cached[:2] == (st.st_mtime_ns, st.st_size):
+            return cached[2]
+        with open(path, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        self._files[path] = (st.st_mtime_ns, st.st_size, digest)
+        self._stats["hashed_files"] += 1
+        return digest
+
+    def _key(self, paths, extra):
+        h = hashlib.sha256()
+        for path in paths:
+            h.update(f"{path}\0{self._digest(path)}\0".encode("utf-8"))
+        h.update(repr(tuple(extra)).encode("utf-8"))
+        return h.hexdigest()
+
+    def get(self, paths, build, extra=()):
+        """返回 (结果, 是否命中, 耗时毫秒)；未命中时调用 build() 构建并缓存。
+
+        构建在锁内进行，多个会话同时 rerun 时只构建一次。
+        """
+        started = time.perf_counter()
+        with self._lock:
+            key = self._key(paths, extra)
+            hit = key in self._entries
+            if hit:
+                self._entries.move_to_end(key)
+                value = self._entries[key]
+            else:
+                value = self._entries[key] = build()
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            elapsed = (time.perf_counter() - started) * 1000
+            if hit:
+                self._stats["hits"] += 1
+                self._stats["hit_ms_total"] += elapsed
+                self._stats["hit_ms_last"] = elapsed
+            else:
+                self._stats["misses"] += 1
+                self._stats["build_ms_last"] = elapsed
+        return value, hit, elapsed
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        hit_ms_total = stats.pop("hit_ms_total")
+        stats["hit_ms_avg"] = round(hit_ms_total / stats["hits"], 3) if stats["hits"] else 0.0
+        stats["hit_ms_last"] = round(stats["hit_ms_last"], 3)
+        stats["build_ms_last"] = round(stats["build_ms_last"], 3)
+        return stats
+
+
+_caches_lock = threading.Lock()
+_caches = {}
+
+
+def get_cache(name):
+    """进程内按名称共享的缓存实例"""
+    with _caches_lock:
+        cache = _caches.get(name)
+        if cache is None:
+            cache = _caches[name] = BuildCache()
+        return cache
+
+
+def get_stats():
+    """所有缓存的命中与耗时统计"""
+    with _caches_lock:
+        caches = dict(_caches)
+    return {name: cache.get_stats() for name, cache in caches.items()}
@@ -0,0 +1,186 @@
+"""
+规则目录 - 加载一次 rules.json 并建立按 id / 分类 / 标签 / id 前缀的索引
+
+API 服务器（服务端抽取）、数据验证和页面构建共用 get_catalog() 返回的目录，不再各自读取和解析文件。
+距上次检查超过 CATALOG_CHECK_INTERVAL 秒时 stat 一次文件：mtime 或大小变化才读取内容，
+内容哈希也变化才重新解析。新目录完整构建后才替换引用，读者拿到的总是某个完整版本；
+重新加载失败（文件缺失或 JSON 无效）时打印错误并继续使用上一个版本。
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+RULES_PATH = os.environ.get("RULES_PATH", "").strip() or os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "assets", "data", "rules.json"
+)
+# 检查文件变化的最小间隔（秒）；0 表示每次取目录都检查
+CATALOG_CHECK_INTERVAL = float(os.environ.get("CATALOG_CHECK_INTERVAL", "1"))
+
+ALL = "all"  # 表示全部分类
+
+
+def id_prefix(rule_id):
+    """规则 id 的前缀（TAC-01 -> TAC），没有前缀时为空字符串"""
+    return rule_id.split("-")[0] if "-" in rule_id else ""
+
+
+class Catalog:
+    """某一版本的规则数据及其索引，构建后不再修改"""
+
+    def __init__(self, data, path=None, mtime_ns=0, size=0, digest=""):
+        self.data = data  # 解析出的原始数据，供验证器检查
+        self.path = path
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.digest = digest
+        self.loaded_at = time.time()
+        self._json = None
+
+        rules, by_id = [], {}
+        by_category, by_tag, by_prefix = {}, {}, {}
+        for rule in data if isinstance(data, list) else ():
+            rule_id = rule.get("id") if isinstance(rule, dict) else None
+            # 重复 id 只索引第一条，索引内 id 唯一
+            if not isinstance(rule_id, str) or not rule_id or rule_id in by_id:
+                continue
+            rules.append(rule)
+            by_id[rule_id] = rule
+            by_category.setdefault(rule.get("category", ""), []).append(rule)
+            by_prefix.setdefault(id_prefix(rule_id), []).append(rule)
+            tags = rule.get("tags")
+            for tag in tags if isinstance(tags, list) else ():
+                by_tag.setdefault(tag, []).append(rule)
+        self.rules = tuple(rules)
+        self._by_id = by_id
+        self._by_category = {k: tuple(v) for k, v in by_category.items()}
+        self._by_tag = {k: tuple(v) for k, v in by_tag.items()}
+        self._by_prefix = {k: tuple(v) for k, v in by_prefix.items()}
+
+    def __len__(self):
+        return len(self.rules)
+
+    def get(self, rule_id):
+        return self._by_id.get(rule_id)
+
+    def by_category(self, category):
+        """分类下的规则元组；ALL 返回全部规则"""
+        if category == ALL:
+            return self.rules
+        return self._by_category.get(category, ())
+
+    def by_tag(self, tag):
+        return self._by_tag.get(tag, ())
+
+    def by_prefix(self, prefix):
+        return self._by_prefix.get(prefix, ())
+
+    def categories(self):
+        return list(self._by_category)
+
+    def tags(self):
+        return list(self._by_tag)
+
+    def to_json(self):
+        """原始数据的 JSON 文本（页面内嵌用），每个版本只序列化一次"""
+        if self._json is None:
+            self._json = json.dumps(self.data, ensure_ascii=False)
+        return self._json
+
+    def info(self):
+        return {
+            "path": self.path,
+            "rules": len(self.rules),
+            "digest": self.digest[:16],
+            "loaded_at": self.loaded_at,
+        }
+
+
+def load(path=None):
+    """读取并解析规则文件，返回新的 Catalog（不影响共享目录）。
+
+    文件不存在时抛出 OSError，JSON 无效时抛出 ValueError（json.JSONDecodeError）。
+    """
+    path = path or RULES_PATH
+    st, raw, digest = _read(path)
+    return _parse(path, st, raw, digest)
+
+
+def _read(path):
+    st = os.stat(path)
+    with open(path, "rb") as f:
+        raw = f.read()
+    return st, raw, hashlib.sha256(raw).hexdigest()
+
+
+def _decode(raw):
+    """与原 load_text 相同的编码回退：先按 utf-8-sig 处理 BOM，再尝试 gbk"""
+    for enc in ("utf-8-sig", "gbk"):
+        try:
+            return raw.decode(enc)
+        except UnicodeDecodeError:
+            continue
+    return raw.decode("utf-8", errors="replace")
+
+
+def _parse(path, st, raw, digest):
+    return Catalog(json.loads(_decode(raw)), path, st.st_mtime_ns, st.st_size, digest)
+
+
+_lock = threading.Lock()
+_current = None
+_checked = 0.0
+_stats = {"loads": 0, "reloads": 0, "unchanged": 0, "errors": 0}
+
+
+def get_catalog(force=False):
+    """共享的规则目录，按需检查文件变化并重新加载。
+
+    force=True 时立即检查，且加载失败时抛出异常而不是沿用上一个版本（验证器使用）。
+    """
+    current = _current
+    if current is not None and not force and time.monotonic() - _checked < CATALOG_CHECK_INTERVAL:
+        return current
+    with _lock:
+        return _refresh(force)
+
+
+def _refresh(force):
+    """检查规则文件并在内容变化时替换目录，调用方需持有 _lock"""
+    global _current, _checked
+    current = _current
+    if current is not None and not force and time.monotonic() - _checked < CATALOG_CHECK_INTERVAL:
+        return current  # 等锁期间其他线程已检查过
+    _checked = time.monotonic()
+    same_file = current is not None and current.path == RULES_PATH
+    try:
+        st = os.stat(RULES_PATH)
+        if same_file and (st.st_mtime_ns, st.st_size) == (current.mtime_ns, current.size):
+            return current
+        st, raw, digest = _read(RULES_PATH)
+        if same_file and digest == current.digest:
+            # 只是 mtime 变化（如 touch 或重新保存），内容不变时不重新解析，只记录新的文件状态
+            current.mtime_ns, current.size = st.st_mtime_ns, st.st_size
+            _stats["unchanged"] += 1
+            return current
+        catalog = _parse(RULES_PATH, st, raw, digest)
+    except (OSError, ValueError) as e:
+        if current is None or force:
+            raise
+        _stats["errors"] += 1
+        print(f"规则文件重新加载失败，继续使用已加载的版本: {e}")
+        return current
+    _stats["reloads" if current is not None else "loads"] += 1
+    _current = catalog
+    return catalog
+
+
+def get_stats():
+    """加载次数与当前版本信息"""
+    with _lock:
+        stats = dict(_stats)
+        current = _current
+    if current is not None:
+        stats["current"] = current.info()
+    return stats
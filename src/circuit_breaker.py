@@ -0,0 +1,127 @@
+"""
+熔断器 - 按最近调用的失败率与慢调用率决定是否继续访问后端
+
+closed   正常放行，记录最近 window 次调用的结果
+open     失败率达到阈值后打开，open_seconds 内直接拒绝
+half_open 冷却结束后只放行一个探测调用，成功则关闭、失败则重新打开
+"""
+import collections
+import threading
+import time
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(RuntimeError):
+    """熔断器打开期间拒绝调用"""
+
+
+class CircuitBreaker:
+    """基于滑动窗口失败率的熔断器"""
+
+    def __init__(self, window=20, min_calls=5, failure_rate=0.5, slow_call_ms=2000, open_seconds=15.0,
+                 on_state_change=None):
+        self.window = window
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_ms = slow_call_ms  # 超过该耗时的成功调用也按失败计，0 表示不计慢调用
+        self.open_seconds = open_seconds
+        self.on_state_change = on_state_change  # on_state_change(old, new)，在锁外调用
+
+        self._lock = threading.Lock()
+        self._results = collections.deque(maxlen=window)  # True 表示失败或过慢
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self.stats = {
+            "calls": 0,
+            "failures": 0,
+            "slow_calls": 0,
+            "rejected": 0,
+            "opened": 0,
+            "last_error": None,
+            "last_latency_ms": None,
+        }
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state
+
+    def allow(self):
+        """是否放行本次调用；half_open 时只放行一个探测"""
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+                transition = (OPEN, HALF_OPEN)
+                self._state = HALF_OPEN
+            else:
+                transition = None
+            if self._state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                allowed = True
+            else:
+                self.stats["rejected"] += 1
+                allowed = False
+        if transition:
+            self._notify(*transition)
+        return allowed
+
+    def record(self, elapsed, error=None):
+        """记录一次放行调用的结果；error 为 None 表示成功"""
+        slow = error is None and self.slow_call_ms > 0 and elapsed * 1000 >= self.slow_call_ms
+        failed = error is not None or slow
+        with self._lock:
+            self.stats["calls"] += 1
+            self.stats["last_latency_ms"] = round(elapsed * 1000, 1)
+            if error is not None:
+                self.stats["failures"] += 1
+                self.stats["last_error"] = str(error)
+            if slow:
+                self.stats["slow_calls"] += 1
+            old = self._state
+            if old == HALF_OPEN:
+                self._probe_in_flight = False
+                if failed:
+                    self._trip()
+                else:
+                    self._state = CLOSED
+                    self._results.clear()
+            elif old == CLOSED:
+                self._results.append(failed)
+                if len(self._results) >= self.min_calls and sum(self._results) / len(self._results) >= self.failure_rate:
+                    self._trip()
+            new = self._state
+        if new != old:
+            self._notify(old, new)
+
+    def _trip(self):
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        self._results.clear()
+        self.stats["opened"] += 1
+
+    def _notify(self, old, new):
+        if self.on_state_change is not None:
+            try:
+                self.on_state_change(old, new)
+            except Exception as e:
+                print(f"Circuit breaker listener failed: {e}")
+
+    def reset(self):
+        with self._lock:
+            self._state = CLOSED
+            self._results.clear()
+            self._probe_in_flight = False
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats["state"] = self._state
+            stats["window_failure_rate"] = round(sum(self._results) / len(self._results), 3) if self._results else 0.0
+            if self._state == OPEN:
+                stats["retry_in_seconds"] = round(max(0.0, self.open_seconds - (time.monotonic() - self._opened_at)), 1)
+        return stats
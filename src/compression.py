@@ -0,0 +1,144 @@
+"""
+响应压缩 - 按 Accept-Encoding 协商 gzip / brotli
+
+API 的 JSON 响应超过 COMPRESS_MIN_BYTES 时按请求压缩；静态内容（渲染好的页面）由
+StaticPayload 在注册时一次性压缩出所有编码，之后每个请求只做选择，不再压缩。
+brotli 为可选依赖（pip install brotli），未安装时只使用 gzip。
+"""
+import gzip
+import hashlib
+import os
+import threading
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# 小于该字节数的响应不压缩：压缩收益抵不过额外的 CPU 和响应头
+COMPRESS_MIN_BYTES = int(os.environ.get("COMPRESS_MIN_BYTES", "1024"))
+COMPRESS_GZIP_LEVEL = int(os.environ.get("COMPRESS_GZIP_LEVEL", "6"))
+COMPRESS_BROTLI_QUALITY = int(os.environ.get("COMPRESS_BROTLI_QUALITY", "5"))
+# 静态内容只压缩一次，使用最高压缩级别
+_STATIC_GZIP_LEVEL = 9
+_STATIC_BROTLI_QUALITY = 11
+
+_stats_lock = threading.Lock()
+_stats = {
+    "responses": 0,   # 经过协商的动态响应
+    "compressed": 0,  # 其中实际压缩的
+    "bytes_in": 0,    # 压缩前字节数（仅统计实际压缩的响应）
+    "bytes_out": 0,   # 压缩后字节数
+}
+
+
+def available_encodings():
+    """服务器支持的编码，按优先顺序"""
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def _accepted(accept_encoding):
+    """解析 Accept-Encoding，返回 {编码: q 值}"""
+    accepted = {}
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[name] = q
+    return accepted
+
+
+def choose_encoding(accept_encoding, encodings=None):
+    """客户端接受（q > 0）且服务器支持的首选编码；都不接受时返回 None"""
+    if not accept_encoding:
+        return None
+    accepted = _accepted(accept_encoding)
+    best, best_q = None, 0.0
+    for encoding in encodings if encodings is not None else available_encodings():
+        q = accepted.get(encoding, accepted.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compress(data, encoding, static=False):
+    if encoding == "br":
+        return brotli.compress(data, quality=_STATIC_BROTLI_QUALITY if static else COMPRESS_BROTLI_QUALITY)
+    # mtime=0 保证相同内容压缩结果相同
+    return gzip.compress(data, compresslevel=_STATIC_GZIP_LEVEL if static else COMPRESS_GZIP_LEVEL, mtime=0)
+
+
+def encode(data, accept_encoding):
+    """动态响应：超过阈值且客户端接受时压缩，返回 (响应体, 编码或 None)"""
+    encoding = choose_encoding(accept_encoding) if len(data) >= COMPRESS_MIN_BYTES else None
+    body = compress(data, encoding) if encoding else data
+    if len(body) >= len(data):
+        body, encoding = data, None
+    with _stats_lock:
+        _stats["responses"] += 1
+        if encoding:
+            _stats["compressed"] += 1
+            _stats["bytes_in"] += len(data)
+            _stats["bytes_out"] += len(body)
+    return body, encoding
+
+
+def get_stats():
+    """动态响应的压缩统计"""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["saved_bytes"] = stats["bytes_in"] - stats["bytes_out"]
+    stats["encodings"] = list(available_encodings())
+    stats["min_bytes"] = COMPRESS_MIN_BYTES
+    return stats
+
+
+class StaticPayload:
+    """预先压缩好所有编码的静态内容，按请求选择变体"""
+
+    def __init__(self, data, content_type):
+        self.data = data
+        self.content_type = content_type
+        self.etag = f'W/"{hashlib.sha256(data).hexdigest()[:16]}"'
+        self.variants = {}
+        if len(data) >= COMPRESS_MIN_BYTES:
+            for encoding in available_encodings():
+                body = compress(data, encoding, static=True)
+                if len(body) < len(data):
+                    self.variants[encoding] = body
+        self._lock = threading.Lock()
+        self.served = 0
+        self.saved_bytes = 0
+
+    def select(self, accept_encoding):
+        """返回 (响应体, 编码或 None)"""
+        encoding = choose_encoding(accept_encoding, tuple(self.variants))
+        body = self.variants[encoding] if encoding else self.data
+        with self._lock:
+            self.served += 1
+            self.saved_bytes += len(self.data) - len(body)
+        return body, encoding
+
+    def report(self):
+        """各编码的大小与相对原始内容节省的字节数"""
+        sizes = {encoding: len(body) for encoding, body in self.variants.items()}
+        smallest = min(sizes.values(), default=len(self.data))
+        with self._lock:
+            served, saved = self.served, self.saved_bytes
+        return {
+            "bytes": len(self.data),
+            "encoded_bytes": sizes,
+            "saved_bytes": len(self.data) - smallest,
+            "saved_pct": round((len(self.data) - smallest) / len(self.data) * 100, 1) if self.data else 0.0,
+            "served": served,
+            "served_saved_bytes": saved,
+        }
@@ -1,21 +1,619 @@
 import os
 import json
+import collections
 import datetime
-import urllib.request
 import urllib.parse
+import urllib.error
+import http.client
 import threading
+import itertools
+import contextlib
+import functools
+import time
+import sys
+
+import asyncio
+import atexit
+import concurrent.futures
+
+import circuit_breaker
+import db_journal
+import db_sqlite
+import http_pool
+import read_cache
+import write_behind
 
 SUPABASE_URL = os.environ.get("SUPABASE_URL", "").strip()
 SUPABASE_ANON_KEY = os.environ.get("SUPABASE_ANON_KEY", "").strip()
+# Supabase 请求的连接超时与读取超时（秒），连接空闲超过 SUPABASE_IDLE_TIMEOUT 后不再复用
+SUPABASE_CONNECT_TIMEOUT = float(os.environ.get("SUPABASE_CONNECT_TIMEOUT", "5"))
+SUPABASE_READ_TIMEOUT = float(os.environ.get("SUPABASE_READ_TIMEOUT", "10"))
+SUPABASE_IDLE_TIMEOUT = float(os.environ.get("SUPABASE_IDLE_TIMEOUT", "60"))
+SUPABASE_POOL_SIZE = int(os.environ.get("SUPABASE_POOL_SIZE", "8"))
+# asyncio 接口执行阻塞查询的线程数，决定可同时在途的后端请求数
+DB_ASYNC_WORKERS = int(os.environ.get("DB_ASYNC_WORKERS", "16"))
+# Supabase 写后批量插入：写入先以负数临时 id 应答，攒够条数或等待超过毫秒数后一次批量 POST
+SUPABASE_WRITE_BEHIND = os.environ.get("SUPABASE_WRITE_BEHIND", "0").strip().lower() in ("1", "true", "yes", "on")
+SUPABASE_WRITE_BATCH = max(1, int(os.environ.get("SUPABASE_WRITE_BATCH", "50")))
+SUPABASE_WRITE_FLUSH_MS = int(os.environ.get("SUPABASE_WRITE_FLUSH_MS", "200"))
+# 关闭时等待剩余写入刷出的最长秒数
+SUPABASE_WRITE_SHUTDOWN_TIMEOUT = float(os.environ.get("SUPABASE_WRITE_SHUTDOWN_TIMEOUT", "10"))
+# 撤销时使用 order + limit 的 DELETE 一次删除最新一条；需要 PostgREST 支持带 limit 的 DELETE
+# （旧版本会忽略 limit 而删除该客户端的全部历史），确认服务端支持后再开启
+SUPABASE_LIMITED_DELETE = os.environ.get("SUPABASE_LIMITED_DELETE", "0").strip().lower() in ("1", "true", "yes", "on")
+# Supabase 历史读缓存：最多缓存的客户端数（0 关闭）、过期秒数、每个客户端缓存的最近行数
+SUPABASE_CACHE_CLIENTS = int(os.environ.get("SUPABASE_CACHE_CLIENTS", "1000"))
+SUPABASE_CACHE_TTL = float(os.environ.get("SUPABASE_CACHE_TTL", "30"))
+SUPABASE_CACHE_ROWS = max(1, int(os.environ.get("SUPABASE_CACHE_ROWS", "50")))
+# 启动预热时读取的全局最近行数，按客户端分组填入缓存；0 不预热
+SUPABASE_CACHE_WARM_ROWS = int(os.environ.get("SUPABASE_CACHE_WARM_ROWS", "500"))
+# Supabase 熔断器：最近 WINDOW 次请求中失败（含超过 SLOW_MS 的慢请求）比例达到 FAILURE_RATE
+# 且不少于 MIN_CALLS 次时打开，OPEN_SECONDS 后放行一个探测请求
+SUPABASE_BREAKER_WINDOW = int(os.environ.get("SUPABASE_BREAKER_WINDOW", "20"))
+SUPABASE_BREAKER_MIN_CALLS = int(os.environ.get("SUPABASE_BREAKER_MIN_CALLS", "5"))
+SUPABASE_BREAKER_FAILURE_RATE = float(os.environ.get("SUPABASE_BREAKER_FAILURE_RATE", "0.5"))
+SUPABASE_BREAKER_SLOW_MS = float(os.environ.get("SUPABASE_BREAKER_SLOW_MS", "2000"))
+SUPABASE_BREAKER_OPEN_SECONDS = float(os.environ.get("SUPABASE_BREAKER_OPEN_SECONDS", "15"))
+
+# 存储后端：memory / sqlite / supabase；留空时有 Supabase 凭证用 Supabase，否则用内存
+DB_BACKEND = os.environ.get("DB_BACKEND", "").strip().lower()
+SQLITE_PATH = os.environ.get("SQLITE_PATH", "").strip() or os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "history.sqlite3"
+)
+
+# 内存存储的锁分段数，按 client_id 哈希分配，不同客户端的读写互不阻塞
+MEMORY_LOCK_STRIPES = max(1, int(os.environ.get("MEMORY_LOCK_STRIPES", "16")))
+
+# 内存模式的保留策略，0 表示不限制
+MEMORY_MAX_RECORDS_PER_CLIENT = int(os.environ.get("MEMORY_MAX_RECORDS_PER_CLIENT", "0"))
+MEMORY_MAX_AGE_SECONDS = int(os.environ.get("MEMORY_MAX_AGE_SECONDS", "0"))
+MEMORY_MAX_TOTAL_RECORDS = int(os.environ.get("MEMORY_MAX_TOTAL_RECORDS", "0"))
+MEMORY_MAX_BYTES = int(os.environ.get("MEMORY_MAX_BYTES", "0"))
+# 超出全局预算时淘汰到预算的该比例以下，避免每次写入都触发淘汰
+MEMORY_EVICT_LOW_WATER = 0.9
+# 过期记录的全量清扫间隔（秒），访问客户端时也会顺带清理其过期记录
+MEMORY_SWEEP_INTERVAL = 60
+
+# 内存模式的持久化日志目录，留空则不启用；重启后 init_db() 会从快照和日志恢复
+MEMORY_JOURNAL_DIR = os.environ.get("MEMORY_JOURNAL_DIR", "").strip()
+# 组提交阈值：缓冲达到字节数或距上次提交超过毫秒数时批量 fsync
+MEMORY_JOURNAL_GROUP_BYTES = int(os.environ.get("MEMORY_JOURNAL_GROUP_BYTES", str(64 * 1024)))
+MEMORY_JOURNAL_GROUP_MS = int(os.environ.get("MEMORY_JOURNAL_GROUP_MS", "50"))
+# 每累计多少条日志操作生成一次快照，控制恢复时需要重放的日志量
+MEMORY_SNAPSHOT_EVERY = int(os.environ.get("MEMORY_SNAPSHOT_EVERY", "10000"))
+
+
+class _TimedLock:
+    """带争用统计的互斥锁：记录获取次数、发生等待的次数和累计等待时间"""
+
+    __slots__ = ("_lock", "acquisitions", "contended", "wait_seconds", "max_wait_seconds")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.acquisitions = 0
+        self.contended = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def __enter__(self):
+        if self._lock.acquire(blocking=False):
+            self.acquisitions += 1
+            return self
+        start = time.perf_counter()
+        self._lock.acquire()
+        waited = time.perf_counter() - start
+        # 统计在持锁后更新，无需额外同步
+        self.acquisitions += 1
+        self.contended += 1
+        self.wait_seconds += waited
+        if waited > self.max_wait_seconds:
+            self.max_wait_seconds = waited
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._lock.release()
+        return False
+
 
 # 线程安全的内存存储（当 Supabase 不可用时使用）
-_memory_store_lock = threading.Lock()
+_memory_stripes = tuple(_TimedLock() for _ in range(MEMORY_LOCK_STRIPES))
+# 保护 id 分配、全局索引和用量计数
+_memory_index_lock = threading.Lock()
+
+
+class _ClientHistory:
+    """单个客户端的历史索引：id -> record，并增量维护统计聚合。
+
+    id 全局单调递增且只在尾部追加，dict 的插入顺序即 id 顺序，
+    因此最近 N 条、撤销最后一条、按 id 删除的代价只与本客户端相关。
+    by_category / by_day 随 append、pop 同步更新，读取统计无需扫描历史。
+    """
+
+    __slots__ = ("records", "by_category", "by_day", "last_access")
+
+    def __init__(self):
+        self.records = {}
+        self.by_category = {}  # category -> count
+        self.by_day = {}       # UTC 日期 (YYYY-MM-DD) -> count
+        self.last_access = time.monotonic()
+
+    def __len__(self):
+        return len(self.records)
+
+    def append(self, record):
+        self.records[record.id] = record
+        _bump(self.by_category, record.category, 1)
+        _bump(self.by_day, _record_day(record), 1)
+
+    def recent(self, limit):
+        """按 id 倒序返回最近 limit 条记录"""
+        if limit <= 0:
+            return []
+        return list(itertools.islice(reversed(self.records.values()), limit))
+
+    def last(self):
+        if not self.records:
+            return None
+        return self.records[next(reversed(self.records))]
+
+    def oldest(self):
+        if not self.records:
+            return None
+        return self.records[next(iter(self.records))]
+
+    def pop(self, record_id):
+        record = self.records.pop(record_id, None)
+        if record is not None:
+            _bump(self.by_category, record.category, -1)
+            _bump(self.by_day, _record_day(record), -1)
+        return record
+
+
+def _bump(counter, key, delta):
+    """增减计数，归零时删除键，保证聚合与从头统计的结果完全一致"""
+    if not key:
+        return
+    value = counter.get(key, 0) + delta
+    if value > 0:
+        counter[key] = value
+    else:
+        counter.pop(key, None)
+
+
+_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+_DAY_US = 86400 * 1000000
+
+
+class _Record:
+    """内存模式的紧凑历史记录。
+
+    使用 __slots__ 省去每条记录的 dict；rule_id、content、category、client_id 经
+    sys.intern 驻留，同一规则的所有记录共享同一组字符串对象；时间戳保存为 UTC 微秒整数，
+    读取时再格式化为与 _get_current_timestamp 相同的 ISO 字符串。
+    """
+
+    __slots__ = ("id", "rule_id", "content", "category", "client_id", "ts_us")
+
+    def __init__(self, record_id, rule_id, content, category, client_id, ts_us):
+        self.id = record_id
+        self.rule_id = _intern(rule_id)
+        self.content = _intern(content)
+        self.category = _intern(category)
+        self.client_id = _intern(client_id)
+        self.ts_us = ts_us
+
+    @property
+    def timestamp(self):
+        return (_EPOCH + datetime.timedelta(microseconds=self.ts_us)).isoformat()
+
+    def as_row(self):
+        """与 Supabase 查询结果一致的元组形状"""
+        return (self.id, self.rule_id, self.content, self.category, self.timestamp)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "rule_id": self.rule_id,
+            "content": self.content,
+            "category": self.category,
+            "timestamp": self.timestamp,
+            "client_id": self.client_id,
+        }
+
+
+def _intern(value):
+    return sys.intern(value) if type(value) is str else value
+
+
+def _timestamp_to_us(timestamp):
+    """ISO 时间戳转为 UTC 微秒整数"""
+    moment = datetime.datetime.fromisoformat(timestamp)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=datetime.timezone.utc)
+    return (moment - _EPOCH) // datetime.timedelta(microseconds=1)
+
+
+@functools.lru_cache(maxsize=64)
+def _day_iso(day_number):
+    return (_EPOCH + datetime.timedelta(days=day_number)).date().isoformat()
+
+
+def _record_day(record):
+    """记录所属的 UTC 日期 (YYYY-MM-DD)"""
+    return _day_iso(record.ts_us // _DAY_US)
+
+
+def _record_epoch(record):
+    """记录时间戳对应的 Unix 秒数"""
+    return record.ts_us / 1000000
+
+
+def _record_size(record):
+    """估算单条记录占用的字节数。
+
+    content 来自请求体、长度不受限，字符串必须计入预算；驻留后被多条记录共享的字符串
+    按每条都计入，估算偏大，预算只会提前而不会超出。
+    """
+    return (sys.getsizeof(record) + sys.getsizeof(record.id) + sys.getsizeof(record.ts_us)
+            + sys.getsizeof(record.rule_id) + sys.getsizeof(record.content)
+            + sys.getsizeof(record.category) + sys.getsizeof(record.client_id))
+
+
 _memory_store = {
-    "history": [],
-    "id_counter": 1
+    "clients": {},   # client_id -> _ClientHistory
+    "records": {},   # id -> record，全局按 id 有序，供不带 client_id 的查询使用
+    "id_counter": 1,
+    "bytes": 0,      # 全部记录的估算字节数
+    "last_sweep": 0.0,
+}
+_memory_evictions = {
+    "trimmed": 0,          # 超出单客户端条数上限而丢弃的记录
+    "expired": 0,          # 超过最大保存时长而丢弃的记录
+    "evicted_clients": 0,  # 因全局预算被整体淘汰的空闲客户端
+    "evicted_records": 0,  # 随空闲客户端一起淘汰的记录
 }
 
 
+def _memory_lock(client_id):
+    """返回 client_id 对应的分段锁；不指定客户端时锁住全部分段"""
+    if not client_id:
+        return _memory_lock_all()
+    return _memory_stripes[hash(client_id) % len(_memory_stripes)]
+
+
+@contextlib.contextmanager
+def _memory_lock_all():
+    """按固定顺序获取全部分段锁，用于跨客户端的读写，避免死锁"""
+    with contextlib.ExitStack() as stack:
+        for lock in _memory_stripes:
+            stack.enter_context(lock)
+        yield
+
+
+def _memory_insert(record, restore=False):
+    """分配全局递增 id 并写入索引，调用方需持有该客户端的分段锁。
+
+    id 分配、全局索引写入和日志追加在同一把锁内完成，保证全局索引与日志都按 id 有序；
+    同一客户端的写入由分段锁串行化，客户端索引同样有序。
+    restore=True 时沿用记录已有的 id（从快照或日志恢复），不再写日志。
+    """
+    with _memory_index_lock:
+        if restore:
+            _memory_store["id_counter"] = max(_memory_store["id_counter"], record.id + 1)
+        else:
+            record.id = _memory_store["id_counter"]
+            _memory_store["id_counter"] += 1
+            if _journal is not None:
+                _journal.append(_record_to_op(record))
+        _memory_store["records"][record.id] = record
+        _memory_store["bytes"] += _record_size(record)
+    client_id = record.client_id
+    history = _memory_store["clients"].get(client_id)
+    if history is None:
+        history = _memory_store["clients"][client_id] = _ClientHistory()
+    history.append(record)
+    _bump_client_version(client_id)
+    if MEMORY_MAX_RECORDS_PER_CLIENT > 0:
+        while len(history) > MEMORY_MAX_RECORDS_PER_CLIENT:
+            _memory_remove(client_id, history, history.oldest().id, reason="trimmed")
+    return record
+
+
+def _memory_reset():
+    """清空内存存储（测试与重新初始化使用）"""
+    with _memory_lock_all():
+        _memory_store["clients"] = {}
+        _memory_store["records"] = {}
+        with _memory_index_lock:
+            _memory_store["id_counter"] = 1
+            _memory_store["bytes"] = 0
+            _memory_store["last_sweep"] = 0.0
+            for key in _memory_evictions:
+                _memory_evictions[key] = 0
+    _renew_version_epoch()
+
+
+def get_lock_stats(reset=False):
+    """汇总内存存储分段锁的争用情况（等待时间单位：毫秒）"""
+    stats = {
+        "stripes": len(_memory_stripes),
+        "acquisitions": 0,
+        "contended": 0,
+        "wait_ms_total": 0.0,
+        "wait_ms_max": 0.0,
+    }
+    for lock in _memory_stripes:
+        stats["acquisitions"] += lock.acquisitions
+        stats["contended"] += lock.contended
+        stats["wait_ms_total"] += lock.wait_seconds * 1000
+        stats["wait_ms_max"] = max(stats["wait_ms_max"], lock.max_wait_seconds * 1000)
+        if reset:
+            lock.acquisitions = lock.contended = 0
+            lock.wait_seconds = lock.max_wait_seconds = 0.0
+    stats["wait_ms_total"] = round(stats["wait_ms_total"], 3)
+    stats["wait_ms_max"] = round(stats["wait_ms_max"], 3)
+    return stats
+
+
+def _memory_client(client_id):
+    """取客户端历史并刷新最近访问时间、清理过期记录，调用方需持有该客户端的分段锁"""
+    history = _memory_store["clients"].get(client_id)
+    if history is not None:
+        history.last_access = time.monotonic()
+        _memory_expire(client_id, history)
+    return history
+
+
+def _memory_recent(limit, client_id):
+    """内存模式下按 id 倒序取最近记录，调用方需持有锁"""
+    if client_id:
+        history = _memory_client(client_id)
+        return history.recent(limit) if history else []
+    if limit <= 0:
+        return []
+    return list(itertools.islice(reversed(_memory_store["records"].values()), limit))
+
+
+def _memory_remove(client_id, history, record_id, reason=None):
+    """从客户端索引和全局索引中移除一条记录，调用方需持有该客户端的分段锁。
+
+    reason 为保留策略引起的删除类型，用于淘汰计数；客户端历史删空后一并移除。
+    """
+    record = history.pop(record_id)
+    if record is None:
+        return None
+    with _memory_index_lock:
+        if _journal is not None:
+            _journal.append({"op": "del", "id": record_id, "client_id": client_id})
+        _memory_store["records"].pop(record_id, None)
+        _memory_store["bytes"] -= _record_size(record)
+        if reason:
+            _memory_evictions[reason] += 1
+    # 保留策略引起的删除同样改变客户端可见的数据
+    _bump_client_version(client_id)
+    if not history and _memory_store["clients"].get(client_id) is history:
+        del _memory_store["clients"][client_id]
+    return record
+
+
+def _memory_expire(client_id, history):
+    """丢弃超过最大保存时长的记录；记录按时间追加，从最旧一端检查即可"""
+    if MEMORY_MAX_AGE_SECONDS <= 0:
+        return 0
+    cutoff = time.time() - MEMORY_MAX_AGE_SECONDS
+    expired = 0
+    while history:
+        oldest = history.oldest()
+        epoch = _record_epoch(oldest)
+        if epoch >= cutoff:
+            break
+        _memory_remove(client_id, history, oldest.id, reason="expired")
+        expired += 1
+    return expired
+
+
+def _memory_over_budget(factor=1.0):
+    """全局记录数或估算字节数是否超过预算的 factor 倍"""
+    if MEMORY_MAX_TOTAL_RECORDS > 0 and len(_memory_store["records"]) > MEMORY_MAX_TOTAL_RECORDS * factor:
+        return True
+    if MEMORY_MAX_BYTES > 0 and _memory_store["bytes"] > MEMORY_MAX_BYTES * factor:
+        return True
+    return False
+
+
+def _memory_sweep():
+    """逐个客户端清理过期记录，每次只持有一个分段锁"""
+    _memory_store["last_sweep"] = time.monotonic()
+    expired = 0
+    for client_id in list(_memory_store["clients"]):
+        with _memory_lock(client_id):
+            history = _memory_store["clients"].get(client_id)
+            if history is not None:
+                expired += _memory_expire(client_id, history)
+    return expired
+
+
+def _memory_evict(active_client_id=None):
+    """超出全局预算时按最近访问时间淘汰空闲客户端，直到降到低水位以下。
+
+    当前正在写入的客户端最后处理：其他客户端都淘汰后仍超预算时，
+    只丢弃它最旧的记录，而不是整个清空。
+    """
+    if not _memory_over_budget():
+        return 0
+    evicted = 0
+    candidates = sorted(
+        (history.last_access, client_id)
+        for client_id, history in list(_memory_store["clients"].items())
+        if client_id != active_client_id
+    )
+    for _, client_id in candidates:
+        if not _memory_over_budget(MEMORY_EVICT_LOW_WATER):
+            return evicted
+        with _memory_lock(client_id):
+            history = _memory_store["clients"].get(client_id)
+            if history is None:
+                continue
+            for record_id in list(history.records):
+                _memory_remove(client_id, history, record_id, reason="evicted_records")
+            with _memory_index_lock:
+                _memory_evictions["evicted_clients"] += 1
+            evicted += 1
+    if active_client_id:
+        with _memory_lock(active_client_id):
+            history = _memory_store["clients"].get(active_client_id)
+            while history and _memory_over_budget(MEMORY_EVICT_LOW_WATER) and len(history) > 1:
+                _memory_remove(active_client_id, history, history.oldest().id, reason="trimmed")
+    return evicted
+
+
+def enforce_memory_retention():
+    """立即执行一次过期清扫和全局预算淘汰，返回当前用量"""
+    if get_backend() == "memory":
+        _memory_sweep()
+        _memory_evict()
+    return get_memory_usage()
+
+
+def get_memory_usage():
+    """内存模式的用量、保留策略和淘汰计数，供运维评估进程内存"""
+    with _memory_index_lock:
+        usage = {
+            "clients": len(_memory_store["clients"]),
+            "records": len(_memory_store["records"]),
+            "bytes": _memory_store["bytes"],
+            "evictions": dict(_memory_evictions),
+        }
+    usage["locks"] = get_lock_stats()
+    if _journal is not None:
+        usage["journal"] = dict(_journal.get_stats(), replay=dict(_journal_replay))
+    usage["limits"] = {
+        "max_records_per_client": MEMORY_MAX_RECORDS_PER_CLIENT,
+        "max_age_seconds": MEMORY_MAX_AGE_SECONDS,
+        "max_total_records": MEMORY_MAX_TOTAL_RECORDS,
+        "max_bytes": MEMORY_MAX_BYTES,
+    }
+    return usage
+
+
+_journal = None
+_journal_replay = {}
+_journal_lock = threading.Lock()
+
+
+def _record_to_op(record):
+    return {
+        "op": "add",
+        "id": record.id,
+        "rule_id": record.rule_id,
+        "content": record.content,
+        "category": record.category,
+        "client_id": record.client_id,
+        "ts": record.ts_us,
+    }
+
+
+def _memory_restore(op):
+    """重放一条快照记录或日志操作"""
+    if op.get("op", "add") == "add":
+        record = _Record(op["id"], op["rule_id"], op["content"], op["category"], op["client_id"], op["ts"])
+        with _memory_lock(record.client_id):
+            history = _memory_store["clients"].get(record.client_id)
+            if history is None or record.id not in history.records:
+                _memory_insert(record, restore=True)
+        return
+    client_id = op["client_id"]
+    with _memory_lock(client_id):
+        history = _memory_store["clients"].get(client_id)
+        if history is not None:
+            _memory_remove(client_id, history, op["id"])
+
+
+def _memory_snapshot():
+    """生成快照：持有全部分段锁时复制记录引用并轮转日志，随后在锁外写文件。
+
+    记录对象写入后不再修改，复制引用即得到一致视图；轮转在锁内只交换日志缓冲和文件句柄，
+    旧分段的 fsync 和快照写入都在释放锁之后进行。
+    """
+    journal = _journal
+    if journal is None:
+        return 0
+    with _memory_lock_all():
+        records = list(_memory_store["records"].values())
+        header = {"id_counter": _memory_store["id_counter"]}
+        covered = journal.rotate()
+    journal.finish_rotate()
+    return journal.write_snapshot(covered, header, (_record_to_op(r) for r in records))
+
+
+def _open_journal():
+    """从快照和日志恢复内存存储，然后开启新的日志分段"""
+    global _journal, _journal_replay
+    with _journal_lock:
+        if _journal is not None:
+            return _journal
+        journal = db_journal.Journal(
+            MEMORY_JOURNAL_DIR,
+            group_bytes=MEMORY_JOURNAL_GROUP_BYTES,
+            group_ms=MEMORY_JOURNAL_GROUP_MS,
+            snapshot_every=MEMORY_SNAPSHOT_EVERY,
+            on_snapshot=_memory_snapshot,
+        )
+        start = time.perf_counter()
+        header, snapshot_records, ops = journal.replay(_memory_restore, _memory_restore)
+        with _memory_index_lock:
+            _memory_store["id_counter"] = max(_memory_store["id_counter"], header.get("id_counter", 1))
+        elapsed = time.perf_counter() - start
+        _journal_replay = {
+            "snapshot_records": snapshot_records,
+            "journal_ops": ops,
+            "seconds": round(elapsed, 4),
+            "ops_per_sec": int((snapshot_records + ops) / elapsed) if elapsed > 0 else 0,
+        }
+        journal.open()
+        _journal = journal
+        return journal
+
+
+def shutdown():
+    """进程退出前提交并关闭日志，刷出写后队列中的剩余写入"""
+    global _journal, _write_queue
+    with _journal_lock:
+        journal, _journal = _journal, None
+    if journal is not None:
+        journal.close()
+    with _write_queue_lock:
+        queue, _write_queue = _write_queue, None
+    if queue is not None and not queue.close(SUPABASE_WRITE_SHUTDOWN_TIMEOUT):
+        print(f"Write-behind flush incomplete: {queue.get_stats()}")
+    _http_pool.close()
+    _shutdown_async()
+
+
+atexit.register(shutdown)
+
+
+def _memory_rebuild_aggregates(history):
+    """从原始记录重新计算统计聚合"""
+    by_category = {}
+    by_day = {}
+    for r in history.records.values():
+        _bump(by_category, r.category, 1)
+        _bump(by_day, _record_day(r), 1)
+    return by_category, by_day
+
+
+def _memory_check_aggregates():
+    """校验增量聚合与原始历史是否一致，返回不一致的 client_id 列表"""
+    mismatched = []
+    with _memory_lock_all():
+        for client_id, history in _memory_store["clients"].items():
+            by_category, by_day = _memory_rebuild_aggregates(history)
+            if by_category != history.by_category or by_day != history.by_day:
+                mismatched.append(client_id)
+    return mismatched
+
+
 def _headers():
     return {
         "apikey": SUPABASE_ANON_KEY,
@@ -25,23 +623,292 @@ def _headers():
     }
 
 
-def _request(method, path, params=None, payload=None, count=None, prefer=None):
+_http_pool = http_pool.ConnectionPool(
+    max_idle_per_host=SUPABASE_POOL_SIZE,
+    idle_timeout=SUPABASE_IDLE_TIMEOUT,
+    connect_timeout=SUPABASE_CONNECT_TIMEOUT,
+    read_timeout=SUPABASE_READ_TIMEOUT,
+)
+
+
+def _request(method, path, params=None, payload=None, count=None, prefer=None, headers=None):
     if not SUPABASE_URL or not SUPABASE_ANON_KEY:
         raise RuntimeError("Supabase credentials not set")
     url = SUPABASE_URL.rstrip("/") + path
     if params:
         url += "?" + urllib.parse.urlencode(params)
-    req = urllib.request.Request(url, method=method, headers=_headers())
+    extra_headers = headers
+    headers = _headers()
+    if extra_headers:
+        headers.update(extra_headers)
+    prefs = []
     if count:
-        req.add_header("Prefer", f"count={count}")
+        prefs.append(f"count={count}")
     if prefer:
-        req.add_header("Prefer", prefer)
+        prefs.append(prefer)
+    if prefs:
+        headers["Prefer"] = ", ".join(prefs)
+    data = None
     if payload is not None:
         data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
-        req.data = data
-    with urllib.request.urlopen(req, timeout=10) as resp:
-        body = resp.read().decode("utf-8")
-        return resp.getheaders(), body
+    if not _breaker.allow():
+        raise circuit_breaker.CircuitOpenError("Supabase circuit breaker is open")
+    start = time.perf_counter()
+    try:
+        _, resp_headers, body = _http_pool.request(method, url, headers=headers, body=data)
+    except urllib.error.HTTPError as e:
+        # 4xx 是请求本身的问题，不计入后端故障
+        _breaker.record(time.perf_counter() - start, e if e.code >= 500 else None)
+        raise
+    except Exception as e:
+        _breaker.record(time.perf_counter() - start, e)
+        raise
+    _breaker.record(time.perf_counter() - start)
+    return resp_headers, body.decode("utf-8")
+
+
+def _is_outage(error):
+    """Supabase 不可用（熔断、网络错误、5xx）而非请求错误"""
+    if isinstance(error, urllib.error.HTTPError):
+        return error.code >= 500
+    return isinstance(error, (circuit_breaker.CircuitOpenError, OSError, http.client.HTTPException))
+
+
+def _on_breaker_change(old, new):
+    print(f"Supabase circuit breaker: {old} -> {new}")
+    # 熔断期间读取降级为缓存行，进入和退出降级时让已发出的 ETag 全部失效
+    _renew_version_epoch()
+    queue = _write_queue
+    if new == circuit_breaker.CLOSED and queue is not None:
+        queue.kick()  # 恢复后立即重放缓冲的写入
+
+
+_breaker = circuit_breaker.CircuitBreaker(
+    window=SUPABASE_BREAKER_WINDOW,
+    min_calls=SUPABASE_BREAKER_MIN_CALLS,
+    failure_rate=SUPABASE_BREAKER_FAILURE_RATE,
+    slow_call_ms=SUPABASE_BREAKER_SLOW_MS,
+    open_seconds=SUPABASE_BREAKER_OPEN_SECONDS,
+    on_state_change=_on_breaker_change,
+)
+
+
+def get_circuit_breaker_stats():
+    """Supabase 熔断器状态与失败统计"""
+    return _breaker.get_stats()
+
+
+def get_http_pool_stats():
+    """Supabase 连接池统计：复用命中、新建连接、空闲淘汰等"""
+    return _http_pool.get_stats()
+
+
+_write_queue = None
+_write_queue_lock = threading.Lock()
+
+
+def _flush_batch(payloads):
+    """写后队列的批次：一次 POST 插入多条记录，返回顺序与 payloads 一致的行；墓碑批次执行删除"""
+    if write_behind.is_tombstone(payloads[0]):
+        client_id, ids = payloads[0]["client_id"], payloads[0][write_behind.TOMBSTONE_KEY]
+        _delete_ids_remote(client_id, ids)
+        _on_rows_removed(client_id, ids)  # 排队期间读缓存可能已从远端刷新回这些行
+        return [None]
+    _, body = _request("POST", "/rest/v1/history", payload=payloads, prefer="return=representation")
+    return json.loads(body) if body else []
+
+
+def _get_write_queue(failover=False):
+    """写后队列，首次使用时创建并启动写线程。
+
+    未启用写后批量时只在熔断故障转移（failover=True）时创建，之后一直保留，
+    读取时继续合并其中尚未重放的记录；从未创建过则返回 None。
+    """
+    global _write_queue
+    if not (SUPABASE_WRITE_BEHIND or failover):
+        return _write_queue
+    with _write_queue_lock:
+        if _write_queue is None:
+            _write_queue = write_behind.WriteBehindQueue(
+                _flush_batch,
+                batch_size=SUPABASE_WRITE_BATCH,
+                flush_ms=SUPABASE_WRITE_FLUSH_MS,
+                on_flush=_on_rows_inserted,
+                is_retryable=_is_outage,
+                on_reject=_on_rows_rejected,
+            )
+            _write_queue.start()
+        return _write_queue
+
+
+def _hide_deleted(queue, client_id, rows):
+    """去掉排队待删除的行：删除已应答，重放前读取不应再看到它们"""
+    deleted = queue.deleted_for(client_id) if queue is not None else None
+    return [r for r in rows if r[0] not in deleted] if deleted else rows
+
+
+def _pending_rows(queue, client_id, remote_ids=()):
+    """尚未确认写入的记录（新到旧）。
+
+    已写入但远端查询也已返回的记录按真实 id 去重，避免写入完成瞬间重复出现。
+    """
+    rows = []
+    for r in queue.pending_for(client_id):
+        if queue.resolve(r["id"]) in remote_ids:
+            continue
+        rows.append((r["id"], r["rule_id"], r["content"], r["category"], r["timestamp"]))
+    return rows
+
+
+def get_write_behind_stats():
+    """写后队列统计；未启用时返回 None"""
+    queue = _write_queue
+    return queue.get_stats() if queue is not None else None
+
+
+_read_cache = read_cache.ClientCache(
+    max_clients=max(SUPABASE_CACHE_CLIENTS, 1),
+    ttl=SUPABASE_CACHE_TTL,
+    window=SUPABASE_CACHE_ROWS,
+)
+
+
+def _row_tuple(r):
+    return (r.get("id"), r.get("rule_id"), r.get("content"), r.get("category"), r.get("timestamp"))
+
+
+def _cache_inserted(rows):
+    """写穿：把已写入 Supabase 的行插到各自客户端缓存的头部"""
+    if SUPABASE_CACHE_CLIENTS <= 0:
+        return
+    by_client = {}
+    for r in rows:
+        by_client.setdefault(r.get("client_id"), []).append(_row_tuple(r))
+    for client_id, client_rows in by_client.items():
+        if client_id:
+            _read_cache.prepend(client_id, client_rows[::-1])
+
+
+def _on_rows_inserted(rows):
+    """写后队列刷出完成：临时 id 换成了真实 id，写穿缓存并更新版本号"""
+    _cache_inserted(rows)
+    for client_id in {r.get("client_id") for r in rows}:
+        _bump_client_version(client_id)
+
+
+def _on_rows_rejected(payloads):
+    """写后队列丢弃了被 Supabase 拒绝的记录：已应答的临时记录不会写入，客户端历史已变化"""
+    for client_id in {p.get("client_id") for p in payloads}:
+        _bump_client_version(client_id)
+
+
+def _on_rows_removed(client_id, ids):
+    if SUPABASE_CACHE_CLIENTS > 0:
+        _read_cache.remove(client_id, ids)
+    _bump_client_version(client_id)
+
+
+def _fetch_recent(limit, client_id):
+    """从 Supabase 读取最近的历史行"""
+    params = {
+        "select": "id,rule_id,content,category,timestamp",
+        "order": "id.desc",
+        "limit": str(limit),
+    }
+    if client_id:
+        params["client_id"] = f"eq.{client_id}"
+    _, body = _request("GET", "/rest/v1/history", params=params)
+    rows = json.loads(body) if body else []
+    return [_row_tuple(r) for r in rows]
+
+
+def _cached_recent(limit, client_id):
+    """读穿透：缓存能满足时直接返回，否则按缓存窗口大小查询并回填"""
+    if SUPABASE_CACHE_CLIENTS <= 0 or not client_id:
+        return _fetch_recent(limit, client_id)
+    rows = _read_cache.get(client_id, limit)
+    if rows is not None:
+        return rows
+    token = _read_cache.begin_fill()
+    fetch = max(limit, SUPABASE_CACHE_ROWS)
+    rows = _fetch_recent(fetch, client_id)
+    _read_cache.fill(client_id, rows, len(rows) < fetch, token)
+    return rows[:limit]
+
+
+def _warm_read_cache():
+    """启动时读取全局最近的记录，按客户端分组预热缓存，返回预热的客户端数"""
+    if SUPABASE_CACHE_CLIENTS <= 0 or SUPABASE_CACHE_WARM_ROWS <= 0:
+        return 0
+    token = _read_cache.begin_fill()
+    params = {
+        "select": "id,rule_id,content,category,timestamp,client_id",
+        "order": "id.desc",
+        "limit": str(SUPABASE_CACHE_WARM_ROWS),
+    }
+    _, body = _request("GET", "/rest/v1/history", params=params)
+    rows = json.loads(body) if body else []
+    by_client = {}
+    for r in rows:
+        if r.get("client_id"):
+            by_client.setdefault(r["client_id"], []).append(_row_tuple(r))
+    # 全局倒序的前 N 行里，每个客户端的行就是它最近的行；按最近活跃顺序填入，越活跃越晚被淘汰
+    for client_id in list(by_client)[:SUPABASE_CACHE_CLIENTS][::-1]:
+        _read_cache.fill(client_id, by_client[client_id], len(rows) < SUPABASE_CACHE_WARM_ROWS, token)
+    return len(by_client)
+
+
+def get_read_cache_stats():
+    """Supabase 历史读缓存统计；未启用时返回 None"""
+    if SUPABASE_CACHE_CLIENTS <= 0:
+        return None
+    return _read_cache.get_stats()
+
+
+# 每个客户端的数据版本号，API 据此生成 ETag，条件请求无需查询后端即可判断数据是否变化。
+# 版本号取自全局递增计数器，只对本进程内的写入有效；epoch 区分不同进程，清空内存存储
+# 或熔断状态变化时更换。记录数超过上限时淘汰最久未变更的客户端，未登记的客户端
+# 返回 floor（不小于任何已淘汰的版本号），不会与它们淘汰前的版本号混淆。
+_VERSION_MAX_CLIENTS = 100000
+_version_lock = threading.Lock()
+_versions = collections.OrderedDict()  # client_id -> 最近一次变更时的计数器值
+_version_state = {"counter": 0, "floor": 0, "epoch": os.urandom(4).hex()}
+
+
+def _bump_client_version(client_id):
+    """客户端数据变更完成后调用；先变更后递增，读到旧数据的请求拿到的一定是旧版本号"""
+    if not client_id:
+        return
+    with _version_lock:
+        _version_state["counter"] += 1
+        _versions[client_id] = _version_state["counter"]
+        _versions.move_to_end(client_id)
+        if len(_versions) > _VERSION_MAX_CLIENTS:
+            _, evicted = _versions.popitem(last=False)
+            _version_state["floor"] = max(_version_state["floor"], evicted)
+
+
+def _renew_version_epoch():
+    """更换 epoch，之前发出的版本号全部失效，已登记的客户端可以一并清空"""
+    with _version_lock:
+        _version_state["epoch"] = os.urandom(4).hex()
+        _version_state["floor"] = 0
+        _versions.clear()
+
+
+def get_client_version(client_id):
+    """客户端数据的版本标记（不透明字符串），数据变更后一定不同；只读进程内状态，不访问后端。
+
+    内存模式设置了最大保存时长时先清理该客户端的过期记录：过期只在访问历史时发生，
+    而匹配的条件请求不会访问历史，不先清理会一直对已过期的记录返回 304。
+    """
+    if MEMORY_MAX_AGE_SECONDS > 0 and client_id and get_backend() == "memory":
+        with _memory_lock(client_id):
+            history = _memory_store["clients"].get(client_id)
+            if history is not None:
+                _memory_expire(client_id, history)  # 有记录过期时递增版本
+    with _version_lock:
+        return f"{_version_state['epoch']}-{_versions.get(client_id, _version_state['floor'])}"
 
 
 def _use_supabase():
@@ -49,15 +916,39 @@ def _use_supabase():
     return bool(SUPABASE_URL and SUPABASE_ANON_KEY)
 
 
+def get_backend():
+    """当前生效的存储后端：memory / sqlite / supabase"""
+    if DB_BACKEND in ("memory", "sqlite"):
+        return DB_BACKEND
+    return "supabase" if _use_supabase() else "memory"
+
+
 def init_db():
-    """No-op for Supabase. Ensure table exists in Supabase console."""
+    """初始化存储后端。SQLite 模式建表；Supabase 需在控制台中建表。"""
+    backend = get_backend()
+    if backend == "sqlite":
+        return db_sqlite.configure(SQLITE_PATH)
+    if backend == "memory" and MEMORY_JOURNAL_DIR:
+        _open_journal()
+    if backend == "supabase":
+        try:
+            _warm_read_cache()
+        except Exception as e:
+            print(f"Read cache warm-up failed: {e}")
     return True
 
 
 def health_check():
     """检查数据库连接状态"""
-    if not _use_supabase():
+    backend = get_backend()
+    if backend == "memory":
         return True  # 内存模式总是健康
+    if backend == "sqlite":
+        try:
+            return db_sqlite.health_check()
+        except Exception as e:
+            print(f"Health check failed: {e}")
+            return False
     try:
         # 尝试一个简单的查询来验证连接
         params = {"select": "count", "limit": "1"}
@@ -79,83 +970,159 @@ def _get_today_iso():
 
 
 def add_record(rule_data, client_id):
-    """Insert a new history record into Supabase or memory."""
-    if not _use_supabase():
+    """Insert a new history record into Supabase, SQLite or memory."""
+    backend = get_backend()
+    if backend == "sqlite":
+        row = db_sqlite.add_record(
+            rule_data["id"],
+            rule_data["content"],
+            rule_data.get("category") or "",  # 请求体中的 "category": null 也存为空字符串（列为 NOT NULL）
+            _get_current_timestamp(),
+            client_id,
+        )
+        _bump_client_version(client_id)
+        return row
+    if backend == "memory":
         # 内存模式 - 线程安全
-        with _memory_store_lock:
-            record = {
-                "id": _memory_store["id_counter"],
-                "rule_id": rule_data["id"],
-                "content": rule_data["content"],
-                "category": rule_data.get("category", ""),
-                "timestamp": _get_current_timestamp(),
-                "client_id": client_id,
-            }
-            _memory_store["id_counter"] += 1
-            _memory_store["history"].append(record)
-            return record
-    
-    payload = {
+        with _memory_lock(client_id):
+            _memory_client(client_id)
+            record = _memory_insert(_memory_record(rule_data, client_id, _get_current_timestamp()))
+        _memory_retain(client_id)
+        return record.to_dict()
+
+    return _add_remote([_remote_payload(rule_data, client_id)])[0]
+
+
+def _memory_record(rule_data, client_id, timestamp):
+    return _Record(
+        None,
+        rule_data["id"],
+        rule_data["content"],
+        rule_data.get("category", ""),
+        client_id,
+        _timestamp_to_us(timestamp),
+    )
+
+
+def _memory_retain(client_id):
+    """写入后执行保留策略；在释放分段锁后调用，淘汰其他客户端时不会与本客户端的锁交叉"""
+    if MEMORY_MAX_AGE_SECONDS > 0 and time.monotonic() - _memory_store["last_sweep"] >= MEMORY_SWEEP_INTERVAL:
+        _memory_sweep()
+    _memory_evict(client_id)
+
+
+def _remote_payload(rule_data, client_id):
+    return {
         "rule_id": rule_data["id"],
         "content": rule_data["content"],
         "category": rule_data.get("category", ""),
         "timestamp": _get_current_timestamp(),
         "client_id": client_id,
     }
-    _, body = _request("POST", "/rest/v1/history", payload=payload, prefer="return=representation")
+
+
+def _add_remote(payloads):
+    """写入同一客户端的若干条记录，直接写入时只发一个请求；返回写入的记录"""
+    failover = _breaker.state != circuit_breaker.CLOSED
+    queue = _get_write_queue(failover)
+    # 队列中还有未重放的写入时继续排队，保证同一客户端的写入顺序
+    if queue is not None and (SUPABASE_WRITE_BEHIND or failover or len(queue)):
+        items = [queue.submit(payload) for payload in payloads]
+    else:
+        items = _insert_remote(payloads)
+    # 排队的记录已合并进读取结果，同样算作变更；写入完成换成真实 id 时再递增一次
+    _bump_client_version(payloads[0]["client_id"])
+    return items
+
+
+def _insert_remote(payloads):
+    """直接写入记录；Supabase 不可用时转入写后队列"""
+    try:
+        _, body = _request("POST", "/rest/v1/history", payload=payloads[0] if len(payloads) == 1 else payloads,
+                           prefer="return=representation")
+    except Exception as e:
+        if not _is_outage(e):
+            raise
+        # 转入本地缓冲，恢复后重放；超时的请求可能已在服务端写入，重放时可能产生重复行
+        queue = _get_write_queue(failover=True)
+        return [queue.submit(payload) for payload in payloads]
     rows = json.loads(body) if body else []
     if rows:
-        return rows[0]
-    # Fallback: fetch latest record for this client
-    latest = get_recent_history(1, client_id)
-    if latest:
-        return {
-            "id": latest[0][0],
-            "rule_id": latest[0][1],
-            "content": latest[0][2],
-            "category": latest[0][3],
-            "timestamp": latest[0][4],
-        }
-    return None
+        _cache_inserted(rows)
+        return rows
+    # 行级安全策略不允许读回时没有返回行；不再补查，缓存失效后由下次读取刷新
+    _read_cache.invalidate(payloads[0]["client_id"])
+    return [dict(payload, id=None) for payload in payloads]
+
+
+def draw_records(client_id, choose, recent_limit=10):
+    """抽取并记录：choose(最近规则 id 集合) 返回要记录的规则列表，返回写入的记录。
+
+    内存模式在同一把分段锁内读取最近 id、抽取并写入，SQLite 在同一个写事务内完成，
+    同一客户端的并发抽取不会抽到彼此刚记录的规则。Supabase 模式读取最近 id（通常命中读缓存）
+    后一次请求写入全部记录，两步之间没有事务。
+    """
+    backend = get_backend()
+    if backend == "sqlite":
+        rows = db_sqlite.draw(client_id, recent_limit, choose, _get_current_timestamp())
+        if rows:
+            _bump_client_version(client_id)
+        return rows
+    if backend == "memory":
+        with _memory_lock(client_id):
+            history = _memory_client(client_id)
+            recent = {r.rule_id for r in history.recent(recent_limit)} if history else set()
+            timestamp = _get_current_timestamp()
+            records = [_memory_insert(_memory_record(rule, client_id, timestamp)) for rule in choose(recent) or ()]
+        if records:
+            _memory_retain(client_id)
+        return [r.to_dict() for r in records]
+
+    rules = choose(set(get_recent_ids(recent_limit, client_id)))
+    if not rules:
+        return []
+    return _add_remote([_remote_payload(rule, client_id) for rule in rules])
 
 
 def get_recent_history(limit=20, client_id=None):
     """Get recent history records for a client."""
-    if not _use_supabase():
+    backend = get_backend()
+    if backend == "sqlite":
+        return db_sqlite.get_recent_history(limit, client_id)
+    if backend == "memory":
         # 内存模式 - 线程安全
-        with _memory_store_lock:
-            filtered = [r for r in _memory_store["history"] if not client_id or r.get("client_id") == client_id]
-            sorted_history = sorted(filtered, key=lambda x: x.get("id", 0), reverse=True)
-            result = sorted_history[:limit]
-            return [
-                (r.get("id"), r.get("rule_id"), r.get("content"), r.get("category"), r.get("timestamp"))
-                for r in result
-            ]
+        with _memory_lock(client_id):
+            return [r.as_row() for r in _memory_recent(limit, client_id)]
     
-    params = {
-        "select": "id,rule_id,content,category,timestamp",
-        "order": "id.desc",
-        "limit": str(limit),
-    }
-    if client_id:
-        params["client_id"] = f"eq.{client_id}"
-    _, body = _request("GET", "/rest/v1/history", params=params)
-    rows = json.loads(body) if body else []
-    return [
-        (r.get("id"), r.get("rule_id"), r.get("content"), r.get("category"), r.get("timestamp"))
-        for r in rows
-    ]
+    queue = _get_write_queue() if client_id else None
+    pending = queue.pending_for(client_id) if queue is not None else []
+    try:
+        rows = _cached_recent(limit, client_id)
+    except Exception as e:
+        if not client_id or not _is_outage(e):
+            raise
+        # 故障期间降级为可能过期的缓存行
+        rows = (_read_cache.peek(client_id) or [])[:limit]
+    rows = _hide_deleted(queue, client_id, rows)
+    if pending:
+        # 未写入的记录总是比远端记录新，排在前面
+        rows = _pending_rows(queue, client_id, {r[0] for r in rows}) + rows
+    return rows[:limit]
 
 
 def get_recent_ids(limit=10, client_id=None):
     """Get recent rule ids for de-duplication for a client."""
-    if not _use_supabase():
+    backend = get_backend()
+    if backend == "sqlite":
+        return db_sqlite.get_recent_ids(limit, client_id)
+    if backend == "memory":
         # 内存模式 - 线程安全
-        with _memory_store_lock:
-            filtered = [r for r in _memory_store["history"] if not client_id or r.get("client_id") == client_id]
-            sorted_history = sorted(filtered, key=lambda x: x.get("id", 0), reverse=True)
-            return [r.get("rule_id") for r in sorted_history[:limit] if r.get("rule_id")]
+        with _memory_lock(client_id):
+            return [r.rule_id for r in _memory_recent(limit, client_id) if r.rule_id]
     
+    if client_id and (SUPABASE_CACHE_CLIENTS > 0 or _get_write_queue() is not None):
+        # 走缓存并合并写后队列中的记录，与历史列表共用同一份缓存行
+        return [r[1] for r in get_recent_history(limit, client_id) if r[1]]
     params = {
         "select": "rule_id",
         "order": "id.desc",
@@ -168,25 +1135,82 @@ def get_recent_ids(limit=10, client_id=None):
     return [r.get("rule_id") for r in rows if r.get("rule_id")]
 
 
+_limited_delete_supported = SUPABASE_LIMITED_DELETE
+
+
+def _delete_last_remote(client_id):
+    """一次请求删除该客户端最新的一条记录并返回被删除的行（order + limit 的 DELETE）。
+
+    服务端忽略 limit 时会删除多行：此时大声报错并关闭带 limit 的 DELETE，之后退回查询再删除。
+    """
+    global _limited_delete_supported
+    params = {
+        "select": "id,rule_id,content,category,timestamp",
+        "client_id": f"eq.{client_id}",
+        "order": "id.desc",
+        "limit": "1",
+    }
+    _, body = _request("DELETE", "/rest/v1/history", params=params, prefer="return=representation")
+    rows = json.loads(body) if body else []
+    if not rows:
+        return None
+    if len(rows) > 1:
+        _limited_delete_supported = False
+        print(f"ERROR: Supabase ignored limit=1 on DELETE and removed {len(rows)} rows of client {client_id}; "
+              f"limited DELETE disabled, unset SUPABASE_LIMITED_DELETE for this server. "
+              f"Removed ids: {[r.get('id') for r in rows]}")
+        rows.sort(key=lambda r: r.get("id") or 0, reverse=True)
+    row = _row_tuple(rows[0])
+    _on_rows_removed(client_id, [r.get("id") for r in rows])
+    return row
+
+
 def delete_last_record(client_id):
     """Delete the most recent record for a client and return it."""
-    if not _use_supabase():
+    backend = get_backend()
+    if backend == "sqlite":
+        row = db_sqlite.delete_last_record(client_id)
+        if row:
+            _bump_client_version(client_id)
+        return row
+    if backend == "memory":
         # 内存模式 - 线程安全
-        with _memory_store_lock:
-            filtered = [r for r in _memory_store["history"] if r.get("client_id") == client_id]
-            if not filtered:
+        with _memory_lock(client_id):
+            history = _memory_client(client_id)
+            record = history.last() if history else None
+            if record is None:
                 return None
-            sorted_history = sorted(filtered, key=lambda x: x.get("id", 0), reverse=True)
-            record = sorted_history[0]
-            _memory_store["history"] = [r for r in _memory_store["history"] if r.get("id") != record.get("id")]
-            return (record.get("id"), record.get("rule_id"), record.get("content"), record.get("category"), record.get("timestamp"))
+            _memory_remove(client_id, history, record.id)
+            return record.as_row()
     
+    queue = _get_write_queue()
+    if queue is not None:
+        pending = queue.cancel_last(client_id)
+        if pending is not None:
+            # 尚未写入，直接从队列撤销
+            _bump_client_version(client_id)
+            return (pending["id"], pending["rule_id"], pending["content"], pending["category"], pending["timestamp"])
+        if queue.pending_for(client_id) and not queue.flush(SUPABASE_WRITE_SHUTDOWN_TIMEOUT):
+            return None  # 最新记录仍在写入中且迟迟未完成，无法确定要删除的行
+    global _limited_delete_supported
+    # 有排队待删除的行时远端最新一条可能正是其中之一，改为按降级后的历史确定要删除的行
+    if _limited_delete_supported and _breaker.state == circuit_breaker.CLOSED and not (
+            queue is not None and queue.deleted_for(client_id)):
+        try:
+            return _delete_last_remote(client_id)
+        except urllib.error.HTTPError as e:
+            if e.code in (400, 405, 501):
+                _limited_delete_supported = False  # 旧版 PostgREST 不支持带 limit 的 DELETE
+            elif not _is_outage(e):
+                raise
+        except Exception as e:
+            if not _is_outage(e):
+                raise
     rows = get_recent_history(1, client_id)
     if not rows:
         return None
     row = rows[0]
-    params = {"id": f"eq.{row[0]}", "client_id": f"eq.{client_id}"}
-    _request("DELETE", "/rest/v1/history", params=params)
+    _delete_remote(client_id, [row[0]])
     return row
 
 
@@ -206,34 +1230,75 @@ def delete_records_by_ids(client_id, ids):
     if not valid_ids:
         return 0
     
-    if not _use_supabase():
+    backend = get_backend()
+    if backend == "sqlite":
+        deleted = db_sqlite.delete_records_by_ids(client_id, sorted(set(valid_ids)))
+        if deleted:
+            _bump_client_version(client_id)
+        return deleted
+    if backend == "memory":
         # 内存模式 - 线程安全
-        with _memory_store_lock:
-            original_count = len(_memory_store["history"])
-            _memory_store["history"] = [
-                r for r in _memory_store["history"] 
-                if not (r.get("client_id") == client_id and r.get("id") in valid_ids)
-            ]
-            return original_count - len(_memory_store["history"])
+        with _memory_lock(client_id):
+            history = _memory_client(client_id)
+            if not history:
+                return 0
+            deleted = 0
+            for record_id in set(valid_ids):
+                if _memory_remove(client_id, history, record_id) is not None:
+                    deleted += 1
+            return deleted
     
+    queue = _get_write_queue()
+    if queue is not None and any(i < 0 for i in valid_ids):
+        # 负数为写后队列的临时 id：未写入的直接撤销，已写入的换成真实 id
+        deleted = 0
+        remote_ids = [i for i in valid_ids if i > 0]
+        for provisional_id in set(i for i in valid_ids if i < 0):
+            if queue.cancel(provisional_id, client_id) is not None:
+                _bump_client_version(client_id)
+                deleted += 1
+                continue
+            real_id = queue.resolve(provisional_id)
+            if real_id is None and queue.flush(SUPABASE_WRITE_SHUTDOWN_TIMEOUT):
+                real_id = queue.resolve(provisional_id)
+            if real_id is not None:
+                remote_ids.append(real_id)
+        if not remote_ids:
+            return deleted
+        return deleted + delete_records_by_ids(client_id, remote_ids)
+
+    _delete_remote(client_id, valid_ids)
+    return len(valid_ids)
+
+
+def _delete_ids_remote(client_id, ids):
     # 使用参数化查询，防止SQL注入
-    id_list = ",".join(str(i) for i in valid_ids)
+    id_list = ",".join(str(i) for i in ids)
     params = {"id": f"in.({id_list})", "client_id": f"eq.{client_id}"}
     _request("DELETE", "/rest/v1/history", params=params)
-    return len(valid_ids)
+
+
+def _delete_remote(client_id, ids):
+    """删除已写入的行；Supabase 不可用（含熔断打开）时以墓碑记录转入写后队列，恢复后按顺序重放"""
+    try:
+        _delete_ids_remote(client_id, ids)
+    except Exception as e:
+        if not _is_outage(e):
+            raise
+        _get_write_queue(failover=True).submit_delete(client_id, ids)
+    _on_rows_removed(client_id, ids)
 
 
 def _count_today(client_id):
     """统计今日记录数（使用UTC时间）"""
-    if not _use_supabase():
-        # 内存模式 - 线程安全
-        with _memory_store_lock:
-            today = _get_today_iso()
-            filtered = [
-                r for r in _memory_store["history"] 
-                if r.get("client_id") == client_id and r.get("timestamp", "").startswith(today)
-            ]
-            return len(filtered)
+    backend = get_backend()
+    if backend == "sqlite":
+        return db_sqlite.count_since(client_id, _get_today_iso())
+    if backend == "memory":
+        # 内存模式 - 读取按日聚合，跨日后自然落到新的日期键
+        with _memory_lock(client_id):
+            history = _memory_client(client_id)
+            return history.by_day.get(_get_today_iso(), 0) if history else 0
     
     today = _get_today_iso()
     params = {
@@ -241,47 +1306,177 @@ def _count_today(client_id):
         "timestamp": f"gte.{today}T00:00:00Z",
         "client_id": f"eq.{client_id}",
     }
-    headers, _ = _request("GET", "/rest/v1/history", params=params, count="exact")
+    # HEAD 只返回 Content-Range 中的总数，不传输任何行
+    headers, _ = _request("HEAD", "/rest/v1/history", params=params, count="exact")
+    # 加上尚未写入的今日记录（临时记录的时间戳在入队时生成）
+    queue = _get_write_queue()
+    pending = 0
+    if queue is not None:
+        pending = sum(1 for r in queue.pending_for(client_id) if r["timestamp"][:10] >= today)
     for k, v in headers:
         if k.lower() == "content-range":
             total = v.split("/")[-1]
             try:
-                return int(total)
+                return int(total) + pending
             except ValueError:
-                return 0
-    return 0
+                return pending
+    return pending
 
 
-def _count_by_category(client_id):
-    """按分类统计记录数"""
-    if not _use_supabase():
-        # 内存模式 - 线程安全
-        with _memory_store_lock:
-            filtered = [r for r in _memory_store["history"] if r.get("client_id") == client_id]
-            by_category = {}
-            for r in filtered:
-                cat = r.get("category")
-                if not cat:
-                    continue
-                by_category[cat] = by_category.get(cat, 0) + 1
-            return by_category
-    
-    params = {"select": "category", "limit": "1000", "client_id": f"eq.{client_id}"}
+# Supabase 分类统计的服务端函数，需在 SQL 编辑器中创建：
+#
+#   create or replace function history_category_counts(p_client_id text)
+#   returns table (category text, count bigint)
+#   language sql stable as $$
+#     select category, count(*) from history
+#     where client_id = p_client_id and category <> ''
+#     group by category
+#   $$;
+#
+# 未创建时依次退回 PostgREST 聚合查询（需开启 db-aggregates-enabled）和分页读取。
+_CATEGORY_STRATEGIES = ("rpc", "aggregate", "paged")
+_category_strategy = None  # 首个可用的策略，探测一次后固定
+_CATEGORY_PAGE_SIZE = 1000
+
+
+def _category_counts_rpc(client_id):
+    _, body = _request("POST", "/rest/v1/rpc/history_category_counts", payload={"p_client_id": client_id})
+    return {r["category"]: int(r["count"]) for r in (json.loads(body) if body else []) if r.get("category")}
+
+
+def _category_counts_aggregate(client_id):
+    params = {"select": "category,count:id.count()", "client_id": f"eq.{client_id}", "category": "neq."}
     _, body = _request("GET", "/rest/v1/history", params=params)
-    rows = json.loads(body) if body else []
+    return {r["category"]: int(r["count"]) for r in (json.loads(body) if body else []) if r.get("category")}
+
+
+def _category_counts_paged(client_id):
+    """按 Range 分页读取分类列并计数，结果不受单次返回行数上限影响"""
+    params = {"select": "category", "client_id": f"eq.{client_id}", "category": "neq.", "order": "id.asc"}
     by_category = {}
-    for r in rows:
-        cat = r.get("category")
-        if not cat:
+    start = 0
+    while True:
+        end = start + _CATEGORY_PAGE_SIZE - 1
+        _, body = _request("GET", "/rest/v1/history", params=params,
+                           headers={"Range-Unit": "items", "Range": f"{start}-{end}"})
+        rows = json.loads(body) if body else []
+        for r in rows:
+            cat = r.get("category")
+            if cat:
+                by_category[cat] = by_category.get(cat, 0) + 1
+        if len(rows) < _CATEGORY_PAGE_SIZE:
+            return by_category
+        start += len(rows)
+
+
+def _category_counts_remote(client_id):
+    """依次尝试服务端分组统计，不支持（404 / 400）的策略跳过并不再尝试"""
+    global _category_strategy
+    strategies = _CATEGORY_STRATEGIES
+    if _category_strategy is not None:
+        strategies = strategies[strategies.index(_category_strategy):]
+    for strategy in strategies:
+        fn = {
+            "rpc": _category_counts_rpc,
+            "aggregate": _category_counts_aggregate,
+            "paged": _category_counts_paged,
+        }[strategy]
+        try:
+            result = fn(client_id)
+        except urllib.error.HTTPError as e:
+            if strategy == "paged" or e.code not in (400, 404):
+                raise
             continue
-        by_category[cat] = by_category.get(cat, 0) + 1
+        _category_strategy = strategy
+        return result
+
+
+def _count_by_category(client_id):
+    """按分类统计记录数"""
+    backend = get_backend()
+    if backend == "sqlite":
+        return db_sqlite.count_by_category(client_id)
+    if backend == "memory":
+        # 内存模式 - 读取增量维护的分类计数
+        with _memory_lock(client_id):
+            history = _memory_client(client_id)
+            return dict(history.by_category) if history else {}
+    
+    by_category = _category_counts_remote(client_id)
+    queue = _get_write_queue()
+    if queue is not None:
+        for r in queue.pending_for(client_id):
+            if r["category"]:
+                by_category[r["category"]] = by_category.get(r["category"], 0) + 1
     return by_category
 
 
 def get_stats(client_id):
     """Return basic stats for a client."""
-    today_count = _count_today(client_id)
-    by_category = _count_by_category(client_id)
+    if get_backend() == "supabase":
+        # 两个统计查询互不依赖，并发发出，耗时约为较慢的一个
+        try:
+            return run_sync(async_get_stats(client_id))
+        except Exception as e:
+            if not _is_outage(e):
+                raise
+            return _degraded_stats(client_id)
+    return _build_stats(_count_today(client_id), _count_by_category(client_id))
+
+
+def _degraded_stats(client_id):
+    """Supabase 不可用时由缓存行和未重放的写入近似统计"""
+    rows = []
+    queue = _get_write_queue()
+    if queue is not None:
+        rows = _pending_rows(queue, client_id)
+    rows += _hide_deleted(queue, client_id, _read_cache.peek(client_id) or [])
+    today = _get_today_iso()
+    by_category = {}
+    for r in rows:
+        if r[3]:
+            by_category[r[3]] = by_category.get(r[3], 0) + 1
+    stats = _build_stats(sum(1 for r in rows if str(r[4])[:10] >= today), by_category)
+    stats["degraded"] = True
+    return stats
+
+
+def get_snapshot(client_id, history_limit=20, recent_limit=10):
+    """一次取出历史列表、最近规则 id 和统计，供合并接口使用。
+
+    内存模式在同一把分段锁内读取，SQLite 在同一个读事务内查询，三者互相一致；
+    Supabase 模式并发发出历史与统计查询，最近 id 由历史行得出。
+    """
+    backend = get_backend()
+    limit = max(history_limit, recent_limit)
+    if backend == "sqlite":
+        rows, today_count, by_category = db_sqlite.snapshot(client_id, limit, _get_today_iso())
+    elif backend == "memory":
+        with _memory_lock(client_id):
+            history = _memory_client(client_id)
+            if history:
+                rows = [r.as_row() for r in history.recent(limit)]
+                today_count = history.by_day.get(_get_today_iso(), 0)
+                by_category = dict(history.by_category)
+            else:
+                rows, today_count, by_category = [], 0, {}
+    else:
+        return run_sync(async_get_snapshot(client_id, history_limit, recent_limit))
+    return _snapshot(rows, history_limit, recent_limit, _build_stats(today_count, by_category))
+
+
+def _snapshot(rows, history_limit, recent_limit, stats):
+    snapshot = {
+        "items": rows[:history_limit],
+        "ids": [r[1] for r in rows[:recent_limit] if r[1]],
+        "stats": stats,
+    }
+    if stats.get("degraded"):
+        snapshot["degraded"] = True
+    return snapshot
+
+
+def _build_stats(today_count, by_category):
     total = sum(by_category.values()) or 0
     top_category = None
     top_pct = 0
@@ -295,3 +1490,104 @@ def get_stats(client_id):
         "top_pct": top_pct,
         "ok": True
     }
+
+
+# ---- asyncio 接口 ----
+# 各函数与同名同步函数语义一致；阻塞的后端调用在共享线程池中执行，
+# 互不依赖的查询通过 asyncio.gather 并发发出。
+
+_async_lock = threading.Lock()
+_async_executor = None
+_async_loop = None
+
+
+def _executor():
+    global _async_executor
+    with _async_lock:
+        if _async_executor is None:
+            _async_executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=DB_ASYNC_WORKERS, thread_name_prefix="db-io"
+            )
+        return _async_executor
+
+
+async def _in_thread(fn, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor(), functools.partial(fn, *args))
+
+
+def _background_loop():
+    """供同步调用方使用的常驻事件循环（守护线程）"""
+    global _async_loop
+    with _async_lock:
+        if _async_loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="db-async", daemon=True).start()
+            _async_loop = loop
+        return _async_loop
+
+
+def run_sync(coro):
+    """在后台事件循环上运行协程并阻塞等待结果，供线程式 HTTP 处理器调用"""
+    return asyncio.run_coroutine_threadsafe(coro, _background_loop()).result()
+
+
+def _shutdown_async():
+    global _async_executor, _async_loop
+    with _async_lock:
+        executor, _async_executor = _async_executor, None
+        loop, _async_loop = _async_loop, None
+    if loop is not None:
+        loop.call_soon_threadsafe(loop.stop)
+    if executor is not None:
+        executor.shutdown(wait=False)
+
+
+async def async_add_record(rule_data, client_id):
+    return await _in_thread(add_record, rule_data, client_id)
+
+
+async def async_get_recent_history(limit=20, client_id=None):
+    return await _in_thread(get_recent_history, limit, client_id)
+
+
+async def async_get_recent_ids(limit=10, client_id=None):
+    return await _in_thread(get_recent_ids, limit, client_id)
+
+
+async def async_delete_last_record(client_id):
+    return await _in_thread(delete_last_record, client_id)
+
+
+async def async_delete_records_by_ids(client_id, ids):
+    return await _in_thread(delete_records_by_ids, client_id, ids)
+
+
+async def async_health_check():
+    return await _in_thread(health_check)
+
+
+async def async_get_stats(client_id):
+    today_count, by_category = await asyncio.gather(
+        _in_thread(_count_today, client_id),
+        _in_thread(_count_by_category, client_id),
+    )
+    return _build_stats(today_count, by_category)
+
+
+async def async_get_snapshot(client_id, history_limit=20, recent_limit=10):
+    if get_backend() != "supabase":
+        return await _in_thread(get_snapshot, client_id, history_limit, recent_limit)
+    # 历史行（通常命中读缓存）与两个统计查询并发发出
+    rows, stats = await asyncio.gather(
+        _in_thread(get_recent_history, max(history_limit, recent_limit), client_id),
+        async_get_stats(client_id),
+        return_exceptions=True,
+    )
+    if isinstance(rows, BaseException):
+        raise rows
+    if isinstance(stats, BaseException):
+        if not _is_outage(stats):
+            raise stats
+        stats = _degraded_stats(client_id)
+    return _snapshot(rows, history_limit, recent_limit, stats)
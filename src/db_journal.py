@@ -0,0 +1,241 @@
+"""
+内存模式的追加式日志 - 组提交写入、分段轮转与快照
+
+目录结构:
+    snapshot.jsonl          首行为头信息 {"segment": N, ...}，其后每行一条记录
+    journal-00000001.log    日志分段，每行一个 JSON 操作
+
+写入先进入内存缓冲，由后台线程在缓冲达到 group_bytes 或距上次提交超过
+group_ms 时批量写入并 fsync，一次 fsync 覆盖一批操作。快照覆盖到某个分段为止，
+恢复时加载快照，再按顺序重放更新的分段；快照写完之前旧分段不会删除，
+任一步骤中断都能从磁盘状态完整恢复。
+"""
+import json
+import os
+import re
+import threading
+
+_SEGMENT_RE = re.compile(r"^journal-(\d{8})\.log$")
+SNAPSHOT_NAME = "snapshot.jsonl"
+
+
+def _segment_name(seq):
+    return f"journal-{seq:08d}.log"
+
+
+def _fsync_dir(path):
+    """持久化目录项（rename / 新建文件），不支持的平台忽略"""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class Journal:
+    """组提交的追加式操作日志"""
+
+    def __init__(self, directory, group_bytes=64 * 1024, group_ms=50, snapshot_every=10000, on_snapshot=None):
+        self.directory = directory
+        self.group_bytes = group_bytes
+        self.group_ms = group_ms
+        self.snapshot_every = snapshot_every
+        self.on_snapshot = on_snapshot  # 后台线程在操作数达到阈值时调用
+
+        self._lock = threading.Lock()        # 保护缓冲区
+        self._io_lock = threading.Lock()     # 串行化文件写入与分段轮转
+        self._wakeup = threading.Condition(self._lock)
+        self._buffer = []
+        self._buffer_bytes = 0
+        self._closed = False
+        self._file = None
+        self._segment = 0
+        self._retired = []  # 已轮转出、尚未写入剩余缓冲并 fsync 的旧分段 [(文件, 数据)]
+        self._thread = None
+        self.ops_since_snapshot = 0
+        self.stats = {
+            "appends": 0,
+            "commits": 0,
+            "bytes_written": 0,
+            "snapshots": 0,
+            "last_snapshot_records": 0,
+        }
+
+    # ---- 恢复 ----
+
+    def _segments(self):
+        found = []
+        for name in os.listdir(self.directory):
+            match = _SEGMENT_RE.match(name)
+            if match:
+                found.append(int(match.group(1)))
+        return sorted(found)
+
+    def replay(self, load_snapshot, apply_op):
+        """加载快照并重放其后的日志分段，返回 (快照头, 快照记录数, 重放操作数)"""
+        os.makedirs(self.directory, exist_ok=True)
+        header = {"segment": 0}
+        snapshot_records = 0
+        snapshot_path = os.path.join(self.directory, SNAPSHOT_NAME)
+        if os.path.exists(snapshot_path):
+            with open(snapshot_path, "r", encoding="utf-8") as f:
+                first = f.readline()
+                if first:
+                    header = json.loads(first)
+                    for line in f:
+                        if line.strip():
+                            load_snapshot(json.loads(line))
+                            snapshot_records += 1
+        ops = 0
+        for seq in self._segments():
+            if seq <= header.get("segment", 0):
+                continue
+            with open(os.path.join(self.directory, _segment_name(seq)), "r", encoding="utf-8") as f:
+                for line in f:
+                    if not line.endswith("\n"):
+                        break  # 崩溃时写了一半的尾行，之后不会有完整操作
+                    apply_op(json.loads(line))
+                    ops += 1
+        return header, snapshot_records, ops
+
+    # ---- 写入 ----
+
+    def open(self):
+        """在最新分段之后开启新分段，并启动组提交线程"""
+        os.makedirs(self.directory, exist_ok=True)
+        segments = self._segments()
+        self._segment = (segments[-1] if segments else 0) + 1
+        self._file = open(os.path.join(self.directory, _segment_name(self._segment)), "ab")
+        _fsync_dir(self.directory)
+        self._thread = threading.Thread(target=self._run, name="db-journal", daemon=True)
+        self._thread.start()
+
+    def append(self, op):
+        line = (json.dumps(op, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+        with self._lock:
+            self._buffer.append(line)
+            self._buffer_bytes += len(line)
+            self.stats["appends"] += 1
+            self.ops_since_snapshot += 1
+            if self._buffer_bytes >= self.group_bytes:
+                self._wakeup.notify()
+
+    def _take_buffer(self):
+        with self._lock:
+            data = b"".join(self._buffer)
+            self._buffer = []
+            self._buffer_bytes = 0
+        return data
+
+    def _close_retired(self):
+        """写完并 fsync 轮转出的旧分段后关闭；调用方持有 _io_lock"""
+        while self._retired:
+            f, data = self._retired[0]
+            if data:
+                f.write(data)
+                self.stats["bytes_written"] += len(data)
+            f.flush()
+            os.fsync(f.fileno())
+            f.close()
+            self._retired.pop(0)
+
+    def _commit(self):
+        """把缓冲写入当前分段并 fsync，一批操作只付出一次 fsync"""
+        with self._io_lock:
+            # 旧分段先落盘，新分段中的操作不会先于更早的操作持久化
+            self._close_retired()
+            data = self._take_buffer()
+            if not data or self._file is None:
+                return 0
+            self._file.write(data)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self.stats["commits"] += 1
+            self.stats["bytes_written"] += len(data)
+            return len(data)
+
+    def sync(self):
+        """立即提交缓冲中的全部操作"""
+        return self._commit()
+
+    def _run(self):
+        interval = self.group_ms / 1000
+        while True:
+            with self._lock:
+                if not self._closed and self._buffer_bytes < self.group_bytes:
+                    self._wakeup.wait(interval)
+                closed = self._closed
+            self._commit()
+            if closed:
+                return
+            if self.on_snapshot and self.snapshot_every > 0 and self.ops_since_snapshot >= self.snapshot_every:
+                try:
+                    self.on_snapshot()
+                except Exception as e:
+                    print(f"Journal snapshot failed: {e}")
+
+    def rotate(self):
+        """开启新分段并返回旧分段的序号。
+
+        调用方需保证轮转期间没有并发 append（db 在持有全部分段锁时调用），
+        这样旧分段恰好包含快照之前的所有操作。这里只交换缓冲和文件句柄，
+        旧分段的写入与 fsync 由 finish_rotate 或下一次提交完成，不占用调用方的锁。
+        """
+        with self._io_lock:
+            self._retired.append((self._file, self._take_buffer()))
+            covered = self._segment
+            self._segment += 1
+            self._file = open(os.path.join(self.directory, _segment_name(self._segment)), "ab")
+            self.ops_since_snapshot = 0
+        return covered
+
+    def finish_rotate(self):
+        """写完并 fsync 轮转出的旧分段"""
+        with self._io_lock:
+            self._close_retired()
+
+    def write_snapshot(self, covered_segment, header, records):
+        """原子写入快照（临时文件 + fsync + rename），然后删除已覆盖的分段"""
+        path = os.path.join(self.directory, SNAPSHOT_NAME)
+        tmp_path = path + ".tmp"
+        count = 0
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps(dict(header, segment=covered_segment)) + "\n")
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+                count += 1
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        _fsync_dir(self.directory)
+        for seq in self._segments():
+            if seq <= covered_segment:
+                os.remove(os.path.join(self.directory, _segment_name(seq)))
+        self.stats["snapshots"] += 1
+        self.stats["last_snapshot_records"] = count
+        return count
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            self._wakeup.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self._commit()
+        with self._io_lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats["pending_bytes"] = self._buffer_bytes
+        stats["segment"] = self._segment
+        stats["ops_since_snapshot"] = self.ops_since_snapshot
+        return stats
@@ -0,0 +1,200 @@
+"""
+SQLite 存储后端 - 单机部署的本地持久化存储
+
+与 db.py 的函数接口一一对应，由 db.py 在 DB_BACKEND=sqlite 时调用。
+每个线程持有独立连接（WAL 模式下读写互不阻塞），SQL 语句为固定文本，
+由 sqlite3 的语句缓存复用预编译结果。
+"""
+import os
+import sqlite3
+import threading
+
+_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS history (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        rule_id TEXT NOT NULL,
+        content TEXT NOT NULL,
+        category TEXT NOT NULL DEFAULT '',
+        timestamp TEXT NOT NULL,
+        client_id TEXT NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_history_client_id ON history (client_id, id)",
+    "CREATE INDEX IF NOT EXISTS idx_history_client_ts ON history (client_id, timestamp)",
+)
+
+_SQL_INSERT = (
+    "INSERT INTO history (rule_id, content, category, timestamp, client_id) "
+    "VALUES (?, ?, ?, ?, ?)"
+)
+_SQL_RECENT = (
+    "SELECT id, rule_id, content, category, timestamp FROM history "
+    "WHERE client_id = ? ORDER BY id DESC LIMIT ?"
+)
+_SQL_RECENT_ALL = (
+    "SELECT id, rule_id, content, category, timestamp FROM history "
+    "ORDER BY id DESC LIMIT ?"
+)
+_SQL_RECENT_IDS = "SELECT rule_id FROM history WHERE client_id = ? ORDER BY id DESC LIMIT ?"
+_SQL_RECENT_IDS_ALL = "SELECT rule_id FROM history ORDER BY id DESC LIMIT ?"
+_SQL_DELETE_ID = "DELETE FROM history WHERE id = ? AND client_id = ?"
+_SQL_COUNT_SINCE = "SELECT COUNT(*) FROM history WHERE client_id = ? AND timestamp >= ?"
+_SQL_COUNT_BY_CATEGORY = (
+    "SELECT category, COUNT(*) FROM history "
+    "WHERE client_id = ? AND category != '' GROUP BY category"
+)
+
+_local = threading.local()
+_path_lock = threading.Lock()
+_path = None
+_generation = 0  # 每次 configure 递增，旧线程连接在下次使用时重建
+
+
+def configure(path):
+    """设置数据库文件路径并建表，已打开的线程连接会在下次访问时切换"""
+    global _path, _generation
+    with _path_lock:
+        if path != ":memory:":
+            directory = os.path.dirname(os.path.abspath(path))
+            os.makedirs(directory, exist_ok=True)
+        _path = path
+        _generation += 1
+    conn = _conn()
+    with conn:
+        for statement in _SCHEMA:
+            conn.execute(statement)
+    return True
+
+
+def _conn():
+    """当前线程的连接，首次使用时打开并设置 WAL"""
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.generation == _generation:
+        return conn
+    if conn is not None:
+        conn.close()
+    if _path is None:
+        raise RuntimeError("SQLite backend not configured")
+    conn = sqlite3.connect(_path, timeout=5.0, isolation_level=None, cached_statements=128)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=5000")
+    _local.conn = conn
+    _local.generation = _generation
+    return conn
+
+
+def close():
+    """关闭当前线程的连接"""
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        conn.close()
+        _local.conn = None
+
+
+def health_check():
+    _conn().execute("SELECT 1").fetchone()
+    return True
+
+
+def add_record(rule_id, content, category, timestamp, client_id):
+    conn = _conn()
+    cur = conn.execute(_SQL_INSERT, (rule_id, content, category, timestamp, client_id))
+    return {
+        "id": cur.lastrowid,
+        "rule_id": rule_id,
+        "content": content,
+        "category": category,
+        "timestamp": timestamp,
+        "client_id": client_id,
+    }
+
+
+def get_recent_history(limit, client_id=None):
+    if limit <= 0:
+        return []
+    if client_id:
+        return _conn().execute(_SQL_RECENT, (client_id, limit)).fetchall()
+    return _conn().execute(_SQL_RECENT_ALL, (limit,)).fetchall()
+
+
+def get_recent_ids(limit, client_id=None):
+    if limit <= 0:
+        return []
+    if client_id:
+        rows = _conn().execute(_SQL_RECENT_IDS, (client_id, limit)).fetchall()
+    else:
+        rows = _conn().execute(_SQL_RECENT_IDS_ALL, (limit,)).fetchall()
+    return [r[0] for r in rows if r[0]]
+
+
+def delete_last_record(client_id):
+    """在一个写事务内取出并删除该客户端最新的一条记录"""
+    conn = _conn()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute(_SQL_RECENT, (client_id, 1)).fetchone()
+        if row is not None:
+            conn.execute(_SQL_DELETE_ID, (row[0], client_id))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return row
+
+
+def draw(client_id, recent_limit, choose, timestamp):
+    """在一个写事务内读取最近规则 id、由 choose 抽取并写入，返回写入的记录"""
+    conn = _conn()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        recent = {r[0] for r in conn.execute(_SQL_RECENT_IDS, (client_id, recent_limit)).fetchall()}
+        rows = []
+        for rule in choose(recent) or ():
+            category = rule.get("category") or ""  # 列为 NOT NULL，null 存为空字符串
+            cur = conn.execute(_SQL_INSERT, (rule["id"], rule["content"], category, timestamp, client_id))
+            rows.append({
+                "id": cur.lastrowid,
+                "rule_id": rule["id"],
+                "content": rule["content"],
+                "category": category,
+                "timestamp": timestamp,
+                "client_id": client_id,
+            })
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return rows
+
+
+def delete_records_by_ids(client_id, ids):
+    placeholders = ",".join("?" for _ in ids)
+    cur = _conn().execute(
+        f"DELETE FROM history WHERE client_id = ? AND id IN ({placeholders})",
+        (client_id, *ids),
+    )
+    return cur.rowcount
+
+
+def count_since(client_id, since):
+    """统计 timestamp >= since 的记录数（ISO 字符串按字典序比较）"""
+    return _conn().execute(_SQL_COUNT_SINCE, (client_id, since)).fetchone()[0]
+
+
+def count_by_category(client_id):
+    return dict(_conn().execute(_SQL_COUNT_BY_CATEGORY, (client_id,)).fetchall())
+
+
+def snapshot(client_id, limit, since):
+    """在同一个读事务内取最近记录、since 以来的记录数和分类计数，三者对应同一时刻的数据"""
+    conn = _conn()
+    conn.execute("BEGIN")
+    try:
+        rows = conn.execute(_SQL_RECENT, (client_id, limit)).fetchall() if limit > 0 else []
+        today_count = conn.execute(_SQL_COUNT_SINCE, (client_id, since)).fetchone()[0]
+        by_category = dict(conn.execute(_SQL_COUNT_BY_CATEGORY, (client_id,)).fetchall())
+    finally:
+        conn.execute("COMMIT")
+    return rows, today_count, by_category
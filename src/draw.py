@@ -0,0 +1,38 @@
+"""
+服务端抽取 - /api/draw 与 /api/draw2 的去重随机抽取
+
+规则池来自共享的规则目录（catalog.py）按分类建好的索引，不在请求中重新读取或过滤规则。
+抽取使用拒绝采样：随机取下标，落在客户端最近抽到的规则中则重抽。最近集合只有十来条，
+可选规则足够时期望常数次尝试即可完成；可选规则不足时与前端原有逻辑一致，退回整个分类。
+"""
+import os
+import random
+
+import catalog
+
+# 抽取时排除的最近记录条数，与前端 getRecentIds 一致
+DRAW_RECENT_LIMIT = int(os.environ.get("DRAW_RECENT_LIMIT", "10"))
+
+ALL = catalog.ALL
+
+
+def sample(rules, category, count, exclude=()):
+    """从目录的分类中不重复地抽取 count 条，尽量避开 exclude 中的规则 id；规则不足时返回 None"""
+    pool = rules.by_category(category)
+    if len(pool) < count:
+        return None
+    excluded = set()
+    for rule_id in exclude:
+        rule = rules.get(rule_id)
+        if rule is not None and (category == ALL or rule.get("category", "") == category):
+            excluded.add(rule_id)
+    if len(pool) - len(excluded) < count:
+        excluded = set()
+    picked, taken = [], set()
+    while len(picked) < count:
+        rule = pool[random.randrange(len(pool))]
+        if rule["id"] in excluded or rule["id"] in taken:
+            continue
+        picked.append(rule)
+        taken.add(rule["id"])
+    return picked
@@ -0,0 +1,154 @@
+"""
+HTTP/1.1 keep-alive 连接池 - 复用到 Supabase 的 TCP/TLS 连接
+
+按 (scheme, host, port) 维护空闲连接，线程安全地借出与归还；
+空闲超过 idle_timeout 的连接在借出时关闭丢弃。连接超时与读取超时分别配置。
+"""
+import http.client
+import io
+import ssl
+import threading
+import time
+import urllib.error
+from urllib.parse import urlsplit
+
+# 复用的空闲连接可能已被服务端关闭，表现为以下异常，此时换新连接重试一次
+_STALE_ERRORS = (
+    http.client.RemoteDisconnected,
+    http.client.BadStatusLine,
+    ConnectionResetError,
+    BrokenPipeError,
+    ConnectionAbortedError,
+)
+# 读取响应时连接断开，服务端可能已处理完请求（如已提交插入），只有幂等方法可以重发；
+# 按 limit 删除最新一条的 DELETE 不幂等，不在其中
+_IDEMPOTENT_METHODS = frozenset(("GET", "HEAD", "OPTIONS", "PUT"))
+
+
+class ConnectionPool:
+    """按主机分组的 keep-alive 连接池"""
+
+    def __init__(self, max_idle_per_host=8, idle_timeout=60.0, connect_timeout=5.0, read_timeout=10.0):
+        self.max_idle_per_host = max_idle_per_host
+        self.idle_timeout = idle_timeout
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self._lock = threading.Lock()
+        self._idle = {}  # (scheme, host, port) -> [(conn, last_used), ...]
+        self._ssl_context = None
+        self.stats = {
+            "requests": 0,
+            "hits": 0,             # 复用空闲连接
+            "new_connections": 0,
+            "idle_evictions": 0,   # 空闲超时被关闭
+            "stale_retries": 0,    # 复用连接已失效后的重试
+            "discarded": 0,        # 服务端要求关闭或出错而丢弃
+        }
+
+    def _new_connection(self, scheme, host, port):
+        if scheme == "https":
+            if self._ssl_context is None:
+                self._ssl_context = ssl.create_default_context()
+            conn = http.client.HTTPSConnection(host, port, timeout=self.connect_timeout, context=self._ssl_context)
+        else:
+            conn = http.client.HTTPConnection(host, port, timeout=self.connect_timeout)
+        conn.connect()
+        conn.sock.settimeout(self.read_timeout)
+        with self._lock:
+            self.stats["new_connections"] += 1
+        return conn
+
+    def _checkout(self, key):
+        """取最近归还的空闲连接（LIFO），顺带关闭已超时的连接"""
+        now = time.monotonic()
+        expired = []
+        conn = None
+        with self._lock:
+            idle = self._idle.get(key)
+            while idle:
+                candidate, last_used = idle.pop()
+                if now - last_used > self.idle_timeout:
+                    expired.append(candidate)
+                    self.stats["idle_evictions"] += 1
+                    continue
+                conn = candidate
+                self.stats["hits"] += 1
+                break
+        for stale in expired:
+            stale.close()
+        return conn
+
+    def _checkin(self, key, conn):
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle_per_host:
+                idle.append((conn, time.monotonic()))
+                return
+            self.stats["discarded"] += 1
+        conn.close()
+
+    def request(self, method, url, headers=None, body=None):
+        """发送请求，返回 (status, headers 列表, body bytes)；状态码 >= 400 时抛出 HTTPError"""
+        parts = urlsplit(url)
+        scheme = parts.scheme or "http"
+        port = parts.port or (443 if scheme == "https" else 80)
+        key = (scheme, parts.hostname, port)
+        target = parts.path or "/"
+        if parts.query:
+            target += "?" + parts.query
+        with self._lock:
+            self.stats["requests"] += 1
+
+        conn = self._checkout(key)
+        reused = conn is not None
+        while True:
+            if conn is None:
+                conn = self._new_connection(scheme, parts.hostname, port)
+            sent = False
+            try:
+                conn.request(method, target, body=body, headers=headers or {})
+                sent = True
+                resp = conn.getresponse()
+                data = resp.read()
+            except _STALE_ERRORS:
+                conn.close()
+                if not reused or (sent and method.upper() not in _IDEMPOTENT_METHODS):
+                    with self._lock:
+                        self.stats["discarded"] += 1
+                    raise
+                with self._lock:
+                    self.stats["stale_retries"] += 1
+                conn, reused = None, False
+                continue
+            except Exception:
+                conn.close()
+                with self._lock:
+                    self.stats["discarded"] += 1
+                raise
+            break
+
+        if resp.will_close:
+            conn.close()
+            with self._lock:
+                self.stats["discarded"] += 1
+        else:
+            self._checkin(key, conn)
+
+        response_headers = resp.getheaders()
+        if resp.status >= 400:
+            raise urllib.error.HTTPError(url, resp.status, resp.reason, resp.msg, io.BytesIO(data))
+        return resp.status, response_headers, data
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats["idle"] = sum(len(v) for v in self._idle.values())
+        return stats
+
+    def close(self):
+        """关闭全部空闲连接"""
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn, _ in conns:
+                conn.close()
@@ -0,0 +1,180 @@
+"""
+JS 语法校验 - node --check 的结果按内容缓存到磁盘
+
+app.py 每次执行（包括每次交互触发的 rerun）都要校验合并后的 JS。校验结果以
+SHA-256(JS 内容) 与 node 版本为键保存在 JS_CHECK_CACHE_DIR 中，内容和 node 都未变化时
+直接读取结论，冷启动也不再启动子进程。node 版本按可执行文件的路径、mtime 和大小缓存，
+同样不需要每次运行 node --version。
+
+只缓存 node 给出的明确结论（通过或语法错误），超时和启动失败不缓存。
+JS_CHECK_FORCE=1 时忽略已有结论重新校验；写入新结论时清理超过 JS_CHECK_CACHE_MAX_AGE 天
+或超出 JS_CHECK_CACHE_MAX_ENTRIES 条的旧结论（命中会刷新结论文件的 mtime）。
+"""
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+
+JS_CHECK_CACHE_DIR = os.environ.get("JS_CHECK_CACHE_DIR", "").strip() or os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "js_check"
+)
+JS_CHECK_FORCE = os.environ.get("JS_CHECK_FORCE", "0").strip().lower() in ("1", "true", "yes", "on")
+JS_CHECK_TIMEOUT = float(os.environ.get("JS_CHECK_TIMEOUT", "5"))
+JS_CHECK_CACHE_MAX_ENTRIES = int(os.environ.get("JS_CHECK_CACHE_MAX_ENTRIES", "50"))
+JS_CHECK_CACHE_MAX_AGE = float(os.environ.get("JS_CHECK_CACHE_MAX_AGE", "30"))  # 天
+
+_NODE_INFO_FILE = "node.json"
+
+_lock = threading.Lock()
+_verdicts = {}  # 进程内的结论，键同磁盘文件名
+_stats = {"hits": 0, "disk_hits": 0, "checks": 0, "removed": 0}
+
+
+def _node_version(node_path):
+    """node 版本，按可执行文件的真实路径、mtime 和大小缓存在磁盘上"""
+    real_path = os.path.realpath(node_path)
+    st = os.stat(real_path)
+    stamp = [real_path, st.st_mtime_ns, st.st_size]
+    info_path = os.path.join(JS_CHECK_CACHE_DIR, _NODE_INFO_FILE)
+    try:
+        with open(info_path, "r", encoding="utf-8") as f:
+            info = json.load(f)
+        if info.get("stamp") == stamp:
+            return info["version"]
+    except (OSError, ValueError, KeyError):
+        pass
+    proc = subprocess.run([node_path, "--version"], capture_output=True, text=True, timeout=JS_CHECK_TIMEOUT)
+    version = proc.stdout.strip() or "unknown"
+    _write_json(info_path, {"stamp": stamp, "version": version})
+    return version
+
+
+def _write_json(path, data):
+    """先写临时文件再替换，并发的进程不会读到写了一半的文件"""
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"JS 校验缓存写入失败: {e}")
+
+
+def _run_check(node_path, js_code):
+    """运行 node --check，返回 (通过, 错误信息, 是否为可缓存的明确结论)"""
+    tmp_path = None
+    try:
+        with tempfile.NamedTemporaryFile(mode="w", suffix=".js", delete=False, encoding="utf-8") as f:
+            f.write(js_code)
+            tmp_path = f.name
+        proc = subprocess.run(
+            [node_path, "--check", tmp_path],
+            capture_output=True,
+            text=True,
+            timeout=JS_CHECK_TIMEOUT,
+        )
+        if proc.returncode == 0:
+            return True, "", True
+        # 错误信息中的临时文件路径每次不同，不影响结论
+        return False, (proc.stderr or proc.stdout or "unknown JS syntax error"), True
+    except Exception as e:
+        return False, str(e), False
+    finally:
+        try:
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        except Exception:
+            pass
+
+
+def validate(js_code, force=None):
+    """校验 JS 语法，返回 (通过, 错误信息)；force 为 None 时使用 JS_CHECK_FORCE"""
+    force = JS_CHECK_FORCE if force is None else force
+    node_path = shutil.which("node")
+    if not node_path:
+        return True, "node not found"
+    try:
+        node_version = _node_version(node_path)
+    except (OSError, subprocess.SubprocessError) as e:
+        return False, str(e)
+    key = hashlib.sha256(f"{node_version}\0".encode("utf-8") + js_code.encode("utf-8")).hexdigest()
+    verdict_path = os.path.join(JS_CHECK_CACHE_DIR, f"{key}.json")
+
+    if not force:
+        with _lock:
+            verdict = _verdicts.get(key)
+            if verdict is not None:
+                _stats["hits"] += 1
+                return verdict
+        verdict = _read_verdict(verdict_path)
+        if verdict is not None:
+            with _lock:
+                _verdicts[key] = verdict
+                _stats["disk_hits"] += 1
+            return verdict
+
+    ok, message, definite = _run_check(node_path, js_code)
+    with _lock:
+        _stats["checks"] += 1
+    if definite:
+        with _lock:
+            _verdicts[key] = (ok, message)
+        _write_json(verdict_path, {"ok": ok, "message": message, "node": node_version, "checked_at": time.time()})
+        cleanup()
+    return ok, message
+
+
+def _read_verdict(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        verdict = (bool(data["ok"]), data.get("message", ""))
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    try:
+        os.utime(path)  # 刷新 mtime，清理时按最近使用排序
+    except OSError:
+        pass
+    return verdict
+
+
+def cleanup(max_entries=None, max_age_days=None):
+    """删除过期或超出数量上限的结论文件，返回删除的数量"""
+    max_entries = JS_CHECK_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+    max_age_days = JS_CHECK_CACHE_MAX_AGE if max_age_days is None else max_age_days
+    try:
+        names = [n for n in os.listdir(JS_CHECK_CACHE_DIR) if n.endswith(".json") and n != _NODE_INFO_FILE]
+    except OSError:
+        return 0
+    entries = []
+    for name in names:
+        path = os.path.join(JS_CHECK_CACHE_DIR, name)
+        try:
+            entries.append((os.stat(path).st_mtime, path))
+        except OSError:
+            continue
+    entries.sort(reverse=True)
+    cutoff = time.time() - max_age_days * 86400
+    stale = [path for i, (mtime, path) in enumerate(entries)
+             if (max_entries > 0 and i >= max_entries) or (max_age_days > 0 and mtime < cutoff)]
+    removed = 0
+    for path in stale:
+        try:
+            os.remove(path)
+            removed += 1
+        except OSError:
+            continue
+    if removed:
+        with _lock:
+            _stats["removed"] += removed
+    return removed
+
+
+def get_stats():
+    with _lock:
+        return dict(_stats)
@@ -22,7 +22,7 @@ import {
     attachRipple,
     pickRandom
 } from './utils.js';
-import { apiGet, apiPost } from './api.js';
+import { apiDraw, apiGet, apiPost, apiSnapshot } from './api.js';
 import {
     spawnParticles,
     spawnGlyphStorm,
@@ -84,6 +84,7 @@ async function initApp() {
         const state = {
             isDrawing: false,
             lastDrawIds: [],
+            recentIds: null, // 最近一次刷新面板时取回的规则 ID，抽取去重时复用
             drawCategory: 'all'
         };
 
@@ -119,61 +120,51 @@ async function initApp() {
         }
 
         /**
-         * 鏇存柊鍘嗗彶璁板綍
+         * 鏇存柊缁熻鏁版嵁
          */
-        async function updateHistory() {
-            if (!elements.historyList) return;
-            try {
-                const data = await apiGet('/api/history/list?limit=8', {
-                    onStatusChange: (status) => {
-                        if (elements.historyStatus) elements.historyStatus.textContent = status;
-                    }
-                });
-                if (data && data.items) {
-                    renderHistory(data.items);
-                }
-            } catch (err) {
-                console.error('鏇存柊鍘嗗彶璁板綍澶辫触:', err);
-                if (elements.historyStatus) elements.historyStatus.textContent = '鍔犺浇澶辫触';
+        function renderStats(data) {
+            if (!data) return;
+            if (elements.statsToday) {
+                elements.statsToday.textContent = `今日裁决: ${data.today_count || 0} 次`;
+            }
+            if (elements.statsTop) {
+                const label = data.top_category ? (categoryMap[data.top_category] || data.top_category) : '—';
+                const pct = data.top_pct ? ` (${data.top_pct}%)` : '';
+                elements.statsTop.textContent = `最常出现: ${label}${pct}`;
             }
         }
 
         /**
-         * 鏇存柊缁熻鏁版嵁
+         * 鏇存柊鎵€鏈夐潰鏉?
+         * 一次请求取回历史、统计和最近规则 ID，最近 ID 留给下一次抽取去重
          */
-        async function updateStats() {
+        async function updatePanels() {
             try {
-                const data = await apiGet('/api/history/stats', {
+                const data = await apiSnapshot(8, 10, {
                     onStatusChange: (status) => {
                         if (elements.historyStatus) elements.historyStatus.textContent = status;
                     }
                 });
-                if (!data) return;
-                if (elements.statsToday) {
-                    elements.statsToday.textContent = `今日裁决: ${data.today_count || 0} 次`;
-                }
-                if (elements.statsTop) {
-                    const label = data.top_category ? (categoryMap[data.top_category] || data.top_category) : '—';
-                    const pct = data.top_pct ? ` (${data.top_pct}%)` : '';
-                    elements.statsTop.textContent = `最常出现: ${label}${pct}`;
+                if (!data) return null;
+                if (elements.historyList && data.items) {
+                    renderHistory(data.items);
                 }
+                renderStats(data.stats);
+                state.recentIds = data.ids || null;
+                return data;
             } catch (err) {
-                console.error('鏇存柊缁熻澶辫触:', err);
+                console.error('鏇存柊鍘嗗彶璁板綍澶辫触:', err);
+                if (elements.historyStatus) elements.historyStatus.textContent = '鍔犺浇澶辫触';
+                state.recentIds = null;
+                return null;
             }
         }
 
-        /**
-         * 鏇存柊鎵€鏈夐潰鏉?
-         */
-        async function updatePanels() {
-            await updateHistory();
-            await updateStats();
-        }
-
         /**
          * 鑾峰彇鏈€杩戞娊鍙栫殑瑙勫垯 ID锛堢敤浜庡幓閲嶏級
          */
         async function getRecentIds() {
+            if (state.recentIds) return state.recentIds;
             try {
                 const data = await apiGet('/api/history/recent?limit=10');
                 return data && data.ids ? data.ids : [];
@@ -191,6 +182,44 @@ async function initApp() {
             return store.allRules.filter(r => r.category === state.drawCategory);
         }
 
+        /**
+         * 服务端抽取返回的记录转换为规则对象
+         */
+        function ruleFromItem(item) {
+            return { id: item.rule_id, content: item.content, category: item.category || '' };
+        }
+
+        const historyStatusOptions = {
+            onStatusChange: (status) => {
+                if (elements.historyStatus) elements.historyStatus.textContent = status;
+            }
+        };
+
+        // 与 runDrawSequence 共用的防重入标记，读写都落在 state.isDrawing 上
+        const isDrawingRef = {
+            get value() { return state.isDrawing; },
+            set value(v) { state.isDrawing = v; }
+        };
+
+        /**
+         * 播放抽取动画。点击时已占用 isDrawingRef，这里同步释放后由 runDrawSequence 立即重新占用，
+         * 中间不会插入其他点击；动画结束时由它释放按钮。
+         */
+        function playDraw(label, finalText) {
+            isDrawingRef.value = false;
+            return runDrawSequence(label, finalText, getDrawPool(), elements, {
+                isDrawingRef,
+                setButtonsBusy: setBusy,
+                delay
+            });
+        }
+
+        // 服务器已记录但动画没有播放的抽取：撤销这些记录，不留下用户没看到的历史
+        async function discardDrawn(drawn) {
+            const ids = drawn && drawn.items ? drawn.items.map(i => i.id).filter(Boolean) : [];
+            if (ids.length) await apiPost('/api/history/undo', { ids }, historyStatusOptions);
+        }
+
         /**
          * 鍗曟潯鎶藉彇锛堝甫鍘婚噸锛?
          */
@@ -347,38 +376,40 @@ async function initApp() {
         // 鎵ц瑁佸喅鎸夐挳
         if (elements.btnDraw) {
             elements.btnDraw.addEventListener('click', async (e) => {
+                if (state.isDrawing) return;
+                // 从请求抽取起就占用按钮，连点不会在 apiDraw 往返期间发出第二个 /api/draw
+                state.isDrawing = true;
+                setBusy(true);
+                let handedOff = false;
                 try {
-                    const result = await pickOneWithDedup();
+                    // 服务器在一个请求内完成去重、抽取和记录；不支持时回退到前端抽取
+                    const drawn = await apiDraw(1, state.drawCategory, historyStatusOptions);
+                    const result = drawn
+                        ? (drawn.ok && drawn.items && drawn.items.length ? ruleFromItem(drawn.items[0]) : null)
+                        : await pickOneWithDedup();
                     if (!result) {
                         showError('褰撳墠鍒嗙被涓嬫病鏈夎鍒欙紒');
                         return;
                     }
 
-                    const isDrawingRef = { value: state.isDrawing };
-                    const ran = await runDrawSequence(
+                    handedOff = true;
+                    const ran = await playDraw(
                         `Protocol: ${result.category.toUpperCase()} // ${result.id}`,
-                        result.content,
-                        getDrawPool(),
-                        elements,
-                        {
-                            isDrawingRef,
-                            setButtonsBusy: setBusy,
-                            delay
-                        }
+                        result.content
                     );
+                    if (!ran) {
+                        await discardDrawn(drawn);
+                        return;
+                    }
 
-                    if (!ran) return;
-                    state.isDrawing = isDrawingRef.value;
-
-                    const addRes = await apiPost('/api/history/add', result, {
-                        onStatusChange: (status) => {
-                            if (elements.historyStatus) elements.historyStatus.textContent = status;
-                        }
-                    });
-
-                    if (addRes && addRes.item && addRes.item.id) {
-                        state.lastDrawIds = [addRes.item.id];
+                    if (drawn) {
+                        state.lastDrawIds = drawn.items.map(i => i.id).filter(Boolean);
                     } else {
+                        const addRes = await apiPost('/api/history/add', result, historyStatusOptions);
+                        state.lastDrawIds = addRes && addRes.item && addRes.item.id ? [addRes.item.id] : [];
+                    }
+
+                    if (!state.lastDrawIds.length) {
                         const latest = await apiGet('/api/history/list?limit=1');
                         state.lastDrawIds = (latest && latest.items && latest.items[0] && latest.items[0].id)
                             ? [latest.items[0].id]
@@ -394,6 +425,12 @@ async function initApp() {
                     showError('鎵ц瑁佸喅澶辫触锛岃閲嶈瘯');
                     setBusy(false);
                     state.isDrawing = false;
+                } finally {
+                    // 没有交给动画（规则不足、请求失败）时在这里释放
+                    if (!handedOff) {
+                        setBusy(false);
+                        state.isDrawing = false;
+                    }
                 }
             });
         }
@@ -401,44 +438,41 @@ async function initApp() {
         // 鍙岄噸瑁佸喅鎸夐挳
         if (elements.btnDraw2) {
             elements.btnDraw2.addEventListener('click', async (e) => {
+                if (state.isDrawing) return;
+                state.isDrawing = true;
+                setBusy(true);
+                let handedOff = false;
                 try {
-                    const picks = await pickTwoWithDedup();
+                    const drawn = await apiDraw(2, state.drawCategory, historyStatusOptions);
+                    const picks = drawn
+                        ? (drawn.ok && drawn.items && drawn.items.length === 2 ? drawn.items.map(ruleFromItem) : null)
+                        : await pickTwoWithDedup();
                     if (!picks) {
                         showError('当前分类规则不足两条！');
                         return;
                     }
 
                     const [a, b] = picks;
-                    const isDrawingRef = { value: state.isDrawing };
-                    const ran = await runDrawSequence(
+                    handedOff = true;
+                    const ran = await playDraw(
                         `Protocol: ${a.category.toUpperCase()} // ${a.id} + ${b.id}`,
-                        `${a.content} + ${b.content}`,
-                        getDrawPool(),
-                        elements,
-                        {
-                            isDrawingRef,
-                            setButtonsBusy: setBusy,
-                            delay
-                        }
+                        `${a.content} + ${b.content}`
                     );
+                    if (!ran) {
+                        await discardDrawn(drawn);
+                        return;
+                    }
 
-                    if (!ran) return;
-                    state.isDrawing = isDrawingRef.value;
-
-                    const addA = await apiPost('/api/history/add', a, {
-                        onStatusChange: (status) => {
-                            if (elements.historyStatus) elements.historyStatus.textContent = status;
-                        }
-                    });
-                    const addB = await apiPost('/api/history/add', b, {
-                        onStatusChange: (status) => {
-                            if (elements.historyStatus) elements.historyStatus.textContent = status;
-                        }
-                    });
+                    if (drawn) {
+                        state.lastDrawIds = drawn.items.map(i => i.id).filter(Boolean);
+                    } else {
+                        const addA = await apiPost('/api/history/add', a, historyStatusOptions);
+                        const addB = await apiPost('/api/history/add', b, historyStatusOptions);
 
-                    state.lastDrawIds = [];
-                    if (addA && addA.item && addA.item.id) state.lastDrawIds.push(addA.item.id);
-                    if (addB && addB.item && addB.item.id) state.lastDrawIds.push(addB.item.id);
+                        state.lastDrawIds = [];
+                        if (addA && addA.item && addA.item.id) state.lastDrawIds.push(addA.item.id);
+                        if (addB && addB.item && addB.item.id) state.lastDrawIds.push(addB.item.id);
+                    }
 
                     if (!state.lastDrawIds.length) {
                         const latest = await apiGet('/api/history/list?limit=2');
@@ -456,6 +490,12 @@ async function initApp() {
                     showError('鍙岄噸瑁佸喅澶辫触锛岃閲嶈瘯');
                     setBusy(false);
                     state.isDrawing = false;
+                } finally {
+                    // 没有交给动画（规则不足、请求失败）时在这里释放
+                    if (!handedOff) {
+                        setBusy(false);
+                        state.isDrawing = false;
+                    }
                 }
             });
         }
@@ -501,9 +541,7 @@ async function initApp() {
                     }
 
                     state.lastDrawIds = [];
-                    await updatePanels();
-
-                    const latest = await apiGet('/api/history/list?limit=1');
+                    const latest = await updatePanels();
                     if (latest && latest.items && latest.items.length) {
                         const item = latest.items[0];
                         elements.categoryLabel.innerText = `Protocol: ${item.category.toUpperCase()} // ${item.rule_id}`;
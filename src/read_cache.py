@@ -0,0 +1,128 @@
+"""
+按客户端的读穿透缓存 - 缓存每个客户端最近的若干条历史记录
+
+条目按 LRU 淘汰并带 TTL；写入时直接把新行插到缓存头部，删除时从缓存移除，
+不必重新查询。并发读在查询期间若有同一客户端的写入，查询结果不会覆盖缓存。
+过期条目在被回填或淘汰前保留，后端不可用时作为降级读取的数据来源。
+"""
+import collections
+import itertools
+import threading
+import time
+
+
+class _Entry:
+    __slots__ = ("rows", "complete", "expires_at")
+
+    def __init__(self, rows, complete, expires_at):
+        self.rows = rows          # 新到旧的行元组，首元素为 id
+        self.complete = complete  # True 表示 rows 即该客户端的全部记录
+        self.expires_at = expires_at
+
+
+class ClientCache:
+    """按客户端的 LRU/TTL 历史缓存"""
+
+    def __init__(self, max_clients=1000, ttl=30.0, window=50):
+        self.max_clients = max_clients
+        self.ttl = ttl
+        self.window = window
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+        # 每个客户端最近一次写入的序号，用于丢弃查询期间已过时的结果
+        self._mutations = collections.OrderedDict()
+        self._seq = itertools.count(1)
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expired": 0,
+            "stale_fills": 0,  # 查询期间发生写入而放弃写入缓存
+        }
+
+    def get(self, client_id, limit):
+        """缓存能满足 limit 条时返回行列表，否则返回 None"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(client_id)
+            if entry is not None and entry.expires_at <= now:
+                # 过期条目保留到被回填或淘汰，后端不可用时仍可由 peek() 读取
+                self.stats["expired"] += 1
+                entry = None
+            if entry is None or (len(entry.rows) < limit and not entry.complete):
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(client_id)
+            self.stats["hits"] += 1
+            return entry.rows[:limit]
+
+    def peek(self, client_id):
+        """不论是否过期返回缓存的行，不计入命中统计；没有条目时返回 None"""
+        with self._lock:
+            entry = self._entries.get(client_id)
+            return list(entry.rows) if entry is not None else None
+
+    def begin_fill(self):
+        """查询前取得序号，传给 fill()"""
+        return next(self._seq)
+
+    def fill(self, client_id, rows, complete, token):
+        """写入查询结果；查询开始后该客户端有过写入则放弃"""
+        with self._lock:
+            if self._mutations.get(client_id, 0) > token:
+                self.stats["stale_fills"] += 1
+                return False
+            self._store(client_id, list(rows), complete)
+            return True
+
+    def _store(self, client_id, rows, complete):
+        if len(rows) > self.window:
+            rows = rows[:self.window]
+            complete = False
+        self._entries[client_id] = _Entry(rows, complete, time.monotonic() + self.ttl)
+        self._entries.move_to_end(client_id)
+        while len(self._entries) > self.max_clients:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def _mutated(self, client_id):
+        self._mutations[client_id] = next(self._seq)
+        self._mutations.move_to_end(client_id)
+        while len(self._mutations) > self.max_clients * 4:
+            self._mutations.popitem(last=False)
+
+    def prepend(self, client_id, rows):
+        """写穿：把新写入的行（新到旧）插到缓存头部"""
+        with self._lock:
+            self._mutated(client_id)
+            entry = self._entries.get(client_id)
+            if entry is None:
+                return
+            self._store(client_id, list(rows) + entry.rows, entry.complete)
+
+    def remove(self, client_id, ids):
+        """写穿：从缓存中移除已删除的行"""
+        ids = set(ids)
+        with self._lock:
+            self._mutated(client_id)
+            entry = self._entries.get(client_id)
+            if entry is not None:
+                entry.rows = [r for r in entry.rows if r[0] not in ids]
+
+    def invalidate(self, client_id=None):
+        with self._lock:
+            if client_id is None:
+                for cid in list(self._entries):
+                    self._mutated(cid)
+                self._entries.clear()
+            else:
+                self._mutated(client_id)
+                self._entries.pop(client_id, None)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats["clients"] = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        return stats
@@ -2,9 +2,10 @@
 数据验证模块 - 验证规则数据的 schema
 """
 import json
-import os
 import sys
 
+import catalog
+
 
 class RulesValidator:
     """规则数据验证器"""
@@ -53,7 +54,7 @@ class RulesValidator:
             seen_ids.add(rule_id)
             
             # 检查ID前缀
-            prefix = rule_id.split('-')[0] if '-' in rule_id else ''
+            prefix = catalog.id_prefix(rule_id)
             if prefix not in self.VALID_ID_PREFIXES:
                 self.warnings.append(f"规则 #{idx+1}: ID '{rule_id}' 使用非标准前缀 '{prefix}'")
         
@@ -129,16 +130,14 @@ class RulesValidator:
 
 
 def validate_rules_file(file_path=None):
-    """验证规则文件"""
-    if file_path is None:
-        base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        file_path = os.path.join(base_dir, "assets", "data", "rules.json")
-    
+    """验证规则文件；不指定路径时验证共享规则目录的当前版本"""
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        if file_path is None:
+            data = catalog.get_catalog(force=True).data
+        else:
+            data = catalog.load(file_path).data
     except FileNotFoundError:
-        print(f"错误: 文件不存在 - {file_path}")
+        print(f"错误: 文件不存在 - {file_path or catalog.RULES_PATH}")
         return False
     except json.JSONDecodeError as e:
         print(f"错误: JSON 解析失败 - {e}")
@@ -0,0 +1,301 @@
+"""
+写后缓冲队列 - 先以临时记录应答，再批量写入后端
+
+写入进入单一 FIFO 队列并立即返回带负数临时 id 的记录；后台线程在积累到
+batch_size 条或最早一条等待超过 flush_ms 时，把整批作为一个数组写入后端。
+单队列单写线程保证同一客户端的写入顺序；后端不可用（is_retryable 为真）时整批留在队首
+按指数退避重试。后端明确拒绝（如 4xx）时重试不会成功：逐条重写找出被拒的记录，移出队列
+记入 dead_letters 并调用 on_reject，不阻塞之后的写入。
+
+删除已写入的行也可以排队（submit_delete）：墓碑记录与插入按提交顺序重放，且总是单独成批，
+flush_fn 对墓碑批次执行删除。墓碑不出现在 pending_for 中，读方用 deleted_for 隐藏被删除的 id。
+"""
+import collections
+import itertools
+import threading
+import time
+
+TOMBSTONE_KEY = "delete_ids"  # 墓碑记录的 payload：{"client_id": ..., TOMBSTONE_KEY: [真实 id, ...]}
+
+
+def is_tombstone(payload):
+    return TOMBSTONE_KEY in payload
+
+
+class WriteBehindQueue:
+    """按批刷新的写后队列"""
+
+    def __init__(self, flush_fn, batch_size=50, flush_ms=200, retry_base=0.5, retry_max=30.0, resolved_limit=10000,
+                 on_flush=None, is_retryable=None, on_reject=None, dead_letter_limit=100):
+        # flush_fn(payloads) -> 与 payloads 顺序一致的行列表；墓碑批次只含一条，执行删除后返回 [None]
+        self.flush_fn = flush_fn
+        # on_flush(rows) 在移出队列的同一临界区内调用，读方不会看到记录既不在队列也不在下游
+        self.on_flush = on_flush
+        # is_retryable(error) 为假的失败视为后端拒绝，不再重试；未提供时所有失败都重试
+        self.is_retryable = is_retryable or (lambda error: True)
+        self.on_reject = on_reject        # on_reject(payloads)：被拒记录移出队列时调用
+        self.batch_size = batch_size
+        self.flush_ms = flush_ms
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.resolved_limit = resolved_limit
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._drained = threading.Condition(self._lock)
+        self._pending = []        # [(provisional_id, payload, enqueued_at)]，含正在写入的批次
+        self._inflight = 0        # 队首正在写入的条数
+        self._resolved = {}       # provisional_id -> 真实 id
+        self._ids = itertools.count(1)
+        self._closed = False
+        self._flush_requested = False  # flush() 期间不再等待批次凑满
+        self._kicked = False           # kick() 打断重试退避
+        self._thread = None
+        self.dead_letters = collections.deque(maxlen=dead_letter_limit)  # 最近被拒的记录
+        self.stats = {
+            "submitted": 0,
+            "flushed": 0,
+            "batches": 0,
+            "retries": 0,
+            "cancelled": 0,
+            "tombstones": 0,
+            "rejected": 0,
+            "last_error": None,
+        }
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+                self._thread.start()
+
+    def submit(self, payload):
+        """加入队列并返回临时记录（id 为负数）"""
+        with self._lock:
+            provisional_id = -next(self._ids)
+            self._pending.append((provisional_id, payload, time.monotonic()))
+            self.stats["submitted"] += 1
+            waiting = len(self._pending) - self._inflight
+            # 第一条开始计时，攒满一批立即写入；其余情况写线程已在按时限等待
+            if waiting == 1 or waiting >= self.batch_size:
+                self._wakeup.notify()
+        return dict(payload, id=provisional_id)
+
+    def submit_delete(self, client_id, ids):
+        """排队删除已写入的行，恢复后在此前提交的写入之后执行"""
+        with self._lock:
+            self._pending.append((-next(self._ids), {"client_id": client_id, TOMBSTONE_KEY: list(ids)}, time.monotonic()))
+            self.stats["tombstones"] += 1
+            if len(self._pending) - self._inflight == 1:
+                self._wakeup.notify()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._pending)
+
+    def pending_for(self, client_id):
+        """该客户端尚未确认写入的记录，按新到旧排列"""
+        with self._lock:
+            return [
+                dict(payload, id=pid)
+                for pid, payload, _ in reversed(self._pending)
+                if payload.get("client_id") == client_id and not is_tombstone(payload)
+            ]
+
+    def deleted_for(self, client_id):
+        """该客户端排队待删除的真实 id"""
+        with self._lock:
+            return {
+                record_id
+                for _, payload, _ in self._pending
+                if payload.get("client_id") == client_id and is_tombstone(payload)
+                for record_id in payload[TOMBSTONE_KEY]
+            }
+
+    def cancel(self, provisional_id, client_id):
+        """撤销尚未开始写入的记录，返回被撤销的记录；已在写入中或已写入则返回 None"""
+        with self._lock:
+            for index in range(self._inflight, len(self._pending)):
+                pid, payload, _ = self._pending[index]
+                if pid == provisional_id and payload.get("client_id") == client_id and not is_tombstone(payload):
+                    del self._pending[index]
+                    self.stats["cancelled"] += 1
+                    return dict(payload, id=pid)
+        return None
+
+    def cancel_last(self, client_id):
+        """撤销该客户端最新的一条记录（若它尚未开始写入）"""
+        with self._lock:
+            for index in range(len(self._pending) - 1, -1, -1):
+                pid, payload, _ = self._pending[index]
+                if payload.get("client_id") != client_id or is_tombstone(payload):
+                    continue
+                if index < self._inflight:
+                    return None  # 最新一条已在写入中
+                del self._pending[index]
+                self.stats["cancelled"] += 1
+                return dict(payload, id=pid)
+        return None
+
+    def resolve(self, provisional_id):
+        """临时 id 对应的真实 id，尚未写入时返回 None"""
+        with self._lock:
+            return self._resolved.get(provisional_id)
+
+    def _take_batch(self):
+        """等待到达刷新条件，返回待写入批次；调用方持有锁"""
+        while True:
+            waiting = len(self._pending) - self._inflight
+            if waiting and (self._flush_requested or self._closed or waiting >= self.batch_size):
+                break
+            if waiting:
+                age = time.monotonic() - self._pending[self._inflight][2]
+                remaining = self.flush_ms / 1000 - age
+                if remaining <= 0:
+                    break
+                self._wakeup.wait(remaining)
+            elif self._closed:
+                return None
+            else:
+                self._wakeup.wait()
+        batch = self._pending[self._inflight:self._inflight + self.batch_size]
+        # 墓碑单独成批，失败重试时不会重复同批中已完成的插入
+        if is_tombstone(batch[0][1]):
+            batch = batch[:1]
+        else:
+            for index, (_, payload, _) in enumerate(batch):
+                if is_tombstone(payload):
+                    batch = batch[:index]
+                    break
+        self._inflight += len(batch)
+        return batch
+
+    def _run(self):
+        delay = self.retry_base
+        while True:
+            with self._lock:
+                batch = self._take_batch()
+            if batch is None:
+                return
+            try:
+                rows = self.flush_fn([payload for _, payload, _ in batch])
+            except Exception as e:
+                if self.is_retryable(e):
+                    done, written, rejected, error = 0, [], [], e
+                else:
+                    done, written, rejected, error = self._write_each(batch, e)
+            else:
+                done, written, rejected, error = len(batch), list(zip([pid for pid, _, _ in batch], rows or [])), [], None
+            with self._lock:
+                self._finish(batch, done, written, rejected)
+                if error is None:
+                    delay = self.retry_base
+                    continue
+                self.stats["retries"] += 1
+                self.stats["last_error"] = str(error)
+                if self._closed:
+                    return  # 关闭后不再重试，剩余条数留在 pending 统计中
+                # 新写入的通知不打断退避，只有 kick() / close 提前结束等待
+                deadline = time.monotonic() + delay
+                while not (self._kicked or self._closed):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._wakeup.wait(remaining)
+                kicked, self._kicked = self._kicked, False
+            delay = self.retry_base if kicked else min(delay * 2, self.retry_max)
+
+    def _write_each(self, batch, error):
+        """整批被拒后逐条写入，找出被拒的记录。
+
+        返回 (已处理条数, [(临时 id, 行)], [(条目, 错误)], 可重试的错误)；逐条写入中途
+        遇到可重试的错误时停在该条，其余留在队首等待重试。
+        """
+        if len(batch) == 1:
+            return 1, [], [(batch[0], error)], None
+        written, rejected = [], []
+        for index, entry in enumerate(batch):
+            try:
+                rows = self.flush_fn([entry[1]])
+            except Exception as e:
+                if self.is_retryable(e):
+                    return index, written, rejected, e
+                rejected.append((entry, e))
+                continue
+            written.extend((entry[0], row) for row in (rows or [])[:1])
+        return len(batch), written, rejected, None
+
+    def _finish(self, batch, done, written, rejected):
+        """移出队首已处理的 done 条并释放整批的写入中标记；调用方持有锁"""
+        del self._pending[:done]
+        self._inflight -= len(batch)
+        for pid, row in written:
+            if isinstance(row, dict) and row.get("id") is not None:
+                self._resolved[pid] = row["id"]
+        while len(self._resolved) > self.resolved_limit:
+            self._resolved.pop(next(iter(self._resolved)))
+        rows = [row for _, row in written if row is not None]
+        if self.on_flush is not None and rows:
+            try:
+                self.on_flush(rows)
+            except Exception as e:
+                print(f"Write-behind on_flush failed: {e}")
+        if rejected:
+            for (pid, payload, _), e in rejected:
+                print(f"Write-behind dropped rejected record {pid} (client {payload.get('client_id')}): {e}")
+                self.dead_letters.append({"id": pid, "payload": payload, "error": str(e), "at": time.time()})
+            self.stats["rejected"] += len(rejected)
+            self.stats["last_error"] = str(rejected[-1][1])
+            if self.on_reject is not None:
+                try:
+                    self.on_reject([payload for (_, payload, _), _ in rejected])
+                except Exception as e:
+                    print(f"Write-behind on_reject failed: {e}")
+        if done:
+            self.stats["flushed"] += done - len(rejected)
+            self.stats["batches"] += 1
+            if not rejected and done == len(batch):
+                self.stats["last_error"] = None
+        if not self._pending:
+            self._drained.notify_all()
+
+    def kick(self):
+        """下游恢复时调用：立即重试，不再等待退避"""
+        with self._lock:
+            self._kicked = True
+            self._wakeup.notify()
+
+    def flush(self, timeout=None):
+        """唤醒写线程并等待队列清空，返回是否已清空"""
+        self.start()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            self._flush_requested = True
+            self._wakeup.notify()
+            try:
+                while self._pending:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return False
+                    self._drained.wait(remaining)
+                return True
+            finally:
+                self._flush_requested = False
+
+    def close(self, timeout=10.0):
+        """关闭钩子：刷新剩余写入后停止写线程"""
+        drained = self.flush(timeout)
+        with self._lock:
+            self._closed = True
+            self._wakeup.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+        return drained
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats["pending"] = len(self._pending)
+            stats["inflight"] = self._inflight
+            stats["dead_letters"] = len(self.dead_letters)
+        return stats
@@ -0,0 +1,459 @@
+"""
+API 服务测试
+"""
+import unittest
+import sys
+import os
+import json
+import gzip
+import http.client
+import socket
+import threading
+import time
+from unittest.mock import patch
+
+# 添加 src 到路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import db
+import catalog
+import api_server
+
+
+class _ServerTestCase(unittest.TestCase):
+    """在随机端口启动 API 服务器（内存模式）"""
+
+    mode = "pool"
+    workers = 4
+    queue_depth = 8
+
+    def setUp(self):
+        patcher = patch.object(db, '_use_supabase', return_value=False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        db._memory_reset()
+        if self.mode == "pool":
+            self.server = api_server.WorkerPoolHTTPServer(
+                ("127.0.0.1", 0), api_server.ApiHandler, workers=self.workers, queue_depth=self.queue_depth,
+            )
+        else:
+            self.server = api_server.create_server(("127.0.0.1", 0), mode=self.mode)
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.port = self.server.server_address[1]
+
+    def request(self, method, path, payload=None):
+        conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=5)
+        body = json.dumps(payload).encode("utf-8") if payload is not None else None
+        conn.request(method, path, body=body)
+        resp = conn.getresponse()
+        data = resp.read()
+        conn.close()
+        return resp.status, json.loads(data) if data else None
+
+    def get(self, path, etag=None, headers=None):
+        conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=5)
+        headers = dict(headers or {})
+        if etag:
+            headers["If-None-Match"] = etag
+        conn.request("GET", path, headers=headers)
+        resp = conn.getresponse()
+        data = resp.read()
+        conn.close()
+        return resp, data
+
+
+class TestApiHandler(_ServerTestCase):
+    """测试各接口的行为"""
+
+    def test_history_flow(self):
+        """测试写入、读取、统计与撤销"""
+        status, body = self.request("POST", "/api/history/add",
+                                    {"client_id": "c1", "id": "TAC-01", "content": "规则1", "category": "tactical"})
+        self.assertEqual(status, 200)
+        self.assertEqual(body["item"]["rule_id"], "TAC-01")
+
+        _, body = self.request("GET", "/api/history/list?client_id=c1&limit=5")
+        self.assertEqual([i["rule_id"] for i in body["items"]], ["TAC-01"])
+        _, body = self.request("GET", "/api/history/recent?client_id=c1")
+        self.assertEqual(body["ids"], ["TAC-01"])
+        _, body = self.request("GET", "/api/history/stats?client_id=c1")
+        self.assertEqual(body["by_category"], {"tactical": 1})
+        _, body = self.request("GET", "/api/history/snapshot?client_id=c1&limit=5&recent=3")
+        self.assertEqual([i["rule_id"] for i in body["items"]], ["TAC-01"])
+        self.assertEqual(body["ids"], ["TAC-01"])
+        self.assertEqual(body["stats"]["by_category"], {"tactical": 1})
+
+        _, body = self.request("POST", "/api/history/undo", {"client_id": "c1"})
+        self.assertEqual(body["item"]["rule_id"], "TAC-01")
+        _, body = self.request("POST", "/api/history/undo", {"client_id": "c1"})
+        self.assertFalse(body["ok"])
+
+    def test_items_assembled_from_cached_fragments(self):
+        """测试列表由写入时编码的片段拼接，结果与直接序列化一致"""
+        api_server._item_fragment.cache_clear()
+        for i in range(3):
+            self.request("POST", "/api/history/add",
+                         {"client_id": "c1", "id": f"TAC-0{i}", "content": f"规则{i}", "category": "tactical"})
+        misses = api_server._item_fragment.cache_info().misses
+        _, body = self.request("GET", "/api/history/list?client_id=c1")
+        self.assertEqual(api_server._item_fragment.cache_info().misses, misses)
+        rows = db.get_recent_history(20, "c1")
+        self.assertEqual(body, {"items": [api_server._row_item(r) for r in rows], "ok": True})
+
+        obj = {"ok": True, "items": api_server._items_json(rows), "stats": {"a": "类别"}}
+        decoded = json.loads(api_server._encode_json(obj))
+        self.assertEqual(decoded, {"ok": True, "items": body["items"], "stats": {"a": "类别"}})
+        self.assertEqual(list(decoded), ["ok", "items", "stats"])
+
+    def test_draw(self):
+        """测试服务端抽取排除最近记录、写入历史，规则不足时返回 ok=False"""
+        rules = [{"id": f"TAC-0{i}", "content": f"规则{i}", "category": "tactical"} for i in range(4)]
+        rules.append({"id": "SOC-01", "content": "社交", "category": "social"})
+        with patch.object(catalog, 'get_catalog', return_value=catalog.Catalog(rules)):
+            for i in range(2):
+                self.request("POST", "/api/history/add", dict(rules[i], client_id="c1"))
+            status, body = self.request("POST", "/api/draw2", {"client_id": "c1", "category": "tactical"})
+            self.assertEqual(status, 200)
+            self.assertEqual(sorted(i["rule_id"] for i in body["items"]), ["TAC-02", "TAC-03"])
+            _, recent = self.request("GET", "/api/history/recent?client_id=c1")
+            self.assertEqual(sorted(recent["ids"]), ["TAC-00", "TAC-01", "TAC-02", "TAC-03"])
+            self.assertEqual(recent["ids"][:2][::-1], [i["rule_id"] for i in body["items"]])
+
+            _, body = self.request("POST", "/api/draw", {"client_id": "c1"})
+            self.assertEqual(body["items"][0]["rule_id"], "SOC-01")
+            _, body = self.request("POST", "/api/draw2", {"client_id": "c1", "category": "social"})
+            self.assertFalse(body["ok"])
+            self.assertEqual(self.request("POST", "/api/draw", {})[0], 400)
+
+    def test_errors(self):
+        """测试缺少参数、无效 JSON 与未知接口"""
+        self.assertEqual(self.request("GET", "/api/history/list")[0], 400)
+        self.assertEqual(self.request("POST", "/api/history/add", {"client_id": "c1"})[0], 400)
+        self.assertEqual(self.request("GET", "/api/missing")[0], 404)
+        conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=5)
+        conn.request("POST", "/api/history/add", body=b"{not json")
+        self.assertEqual(conn.getresponse().status, 400)
+        conn.close()
+
+    def test_health_reports_server_metrics(self):
+        """测试健康检查包含队列等待与处理耗时"""
+        self.request("GET", "/api/history/recent?client_id=c1")
+        # 处理耗时在响应发出后才记录
+        deadline = time.monotonic() + 2
+        while self.server.get_stats()["handler_time"]["count"] < 1 and time.monotonic() < deadline:
+            time.sleep(0.005)
+        _, body = self.request("GET", "/api/health")
+        self.assertEqual(body["mode"], "memory")
+        self.assertGreaterEqual(body["memory"]["locks"]["acquisitions"], 1)
+        server = body["server"]
+        self.assertEqual(server["workers"], 4)
+        self.assertGreaterEqual(server["handler_time"]["count"], 1)
+        self.assertIn("p95_ms", server["queue_wait"])
+
+
+class TestConditionalGet(_ServerTestCase):
+    """测试 ETag 条件请求"""
+
+    def test_not_modified_until_write(self):
+        """测试版本未变时返回 304 且不查询后端，写入或撤销后返回新数据"""
+        for path in ("/api/history/list?client_id=c1", "/api/history/recent?client_id=c1",
+                     "/api/history/stats?client_id=c1", "/api/history/snapshot?client_id=c1"):
+            resp, _ = self.get(path)
+            etag = resp.getheader("ETag")
+            self.assertEqual(resp.getheader("Cache-Control"), "private, no-cache")
+            with patch.object(db, 'get_recent_history') as history, patch.object(db, 'get_recent_ids') as ids, \
+                    patch.object(db, 'get_stats') as stats, patch.object(db, 'get_snapshot') as snapshot:
+                resp, data = self.get(path, etag)
+            self.assertEqual(resp.status, 304)
+            self.assertEqual(data, b"")
+            self.assertEqual(resp.getheader("ETag"), etag)
+            for mock in (history, ids, stats, snapshot):
+                mock.assert_not_called()
+
+            self.request("POST", "/api/history/add", {"client_id": "c1", "id": "TAC-01", "content": "规则1"})
+            resp, data = self.get(path, etag)
+            self.assertEqual(resp.status, 200)
+            self.assertNotEqual(resp.getheader("ETag"), etag)
+            etag = resp.getheader("ETag")
+            self.request("POST", "/api/history/undo", {"client_id": "c1"})
+            self.assertEqual(self.get(path, etag)[0].status, 200)
+
+    def test_versions_are_per_client(self):
+        """测试其他客户端的写入不使缓存失效，写接口与健康检查不缓存"""
+        resp, _ = self.get("/api/history/list?client_id=c1")
+        etag = resp.getheader("ETag")
+        self.request("POST", "/api/history/add", {"client_id": "c2", "id": "TAC-01", "content": "规则1"})
+        self.assertTrue(etag.startswith('W/"'))
+        # 弱比较：不带 W/ 前缀的同一标签也匹配
+        self.assertEqual(self.get("/api/history/list?client_id=c1", f'"other", {etag[2:]}')[0].status, 304)
+        self.assertEqual(self.get("/api/health")[0].getheader("Cache-Control"), "no-store")
+        self.assertIsNone(self.get("/api/health")[0].getheader("ETag"))
+
+    def test_degraded_stats_not_cached(self):
+        """测试降级的统计结果不带 ETag"""
+        degraded = {"today_count": 0, "by_category": {}, "degraded": True}
+        with patch.object(db, 'get_stats', return_value=degraded):
+            resp, _ = self.get("/api/history/stats?client_id=c1")
+        self.assertIsNone(resp.getheader("ETag"))
+        self.assertEqual(resp.getheader("Cache-Control"), "no-store")
+
+
+class TestCompression(_ServerTestCase):
+    """测试响应压缩"""
+
+    def test_large_json_gzipped(self):
+        """测试超过阈值的 JSON 按 Accept-Encoding 压缩，小响应不压缩"""
+        for i in range(50):
+            db.add_record({"id": f"TAC-{i:02d}", "content": "规则内容" * 10, "category": "tactical"}, "c1")
+        path = "/api/history/list?client_id=c1&limit=50"
+        resp, data = self.get(path, headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(resp.getheader("Content-Encoding"), "gzip")
+        self.assertEqual(resp.getheader("Vary"), "Accept-Encoding")
+        self.assertEqual(len(json.loads(gzip.decompress(data))["items"]), 50)
+        resp, data = self.get(path)
+        self.assertIsNone(resp.getheader("Content-Encoding"))
+        self.assertEqual(len(json.loads(data)["items"]), 50)
+        resp, _ = self.get("/api/history/recent?client_id=nobody", headers={"Accept-Encoding": "gzip"})
+        self.assertIsNone(resp.getheader("Content-Encoding"))
+
+    def test_static_payload(self):
+        """测试注册的静态页面以预压缩形式提供，并支持条件请求"""
+        page = ("<html>" + "<p>规则</p>" * 1000 + "</html>").encode("utf-8")
+        payload, compressed = api_server.register_static("/test-page.html", page, "text/html; charset=utf-8")
+        self.addCleanup(api_server._static_payloads.pop, "/test-page.html", None)
+        self.assertTrue(compressed)
+        self.assertFalse(api_server.register_static("/test-page.html", page, "text/html; charset=utf-8")[1])
+
+        resp, data = self.get("/test-page.html", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(resp.status, 200)
+        self.assertEqual(resp.getheader("Content-Type"), "text/html; charset=utf-8")
+        self.assertEqual(gzip.decompress(data), page)
+        resp, data = self.get("/test-page.html", resp.getheader("ETag"))
+        self.assertEqual((resp.status, data), (304, b""))
+
+        _, body = self.request("GET", "/api/health")
+        report = body["compression"]["static"]["/test-page.html"]
+        self.assertEqual(report["bytes"], len(page))
+        self.assertGreater(report["served_saved_bytes"], 0)
+
+
+class TestWorkerPool(_ServerTestCase):
+    """测试并发处理与队列上限"""
+
+    workers = 4
+    queue_depth = 8
+
+    def _slow_stats(self, client_id):
+        time.sleep(0.3)
+        return {"today_count": 0, "by_category": {}, "ok": True}
+
+    def test_slow_requests_run_concurrently(self):
+        """测试慢请求并行处理，不阻塞其他客户端"""
+        results = []
+        with patch.object(db, 'get_stats', side_effect=self._slow_stats):
+            threads = [
+                threading.Thread(target=lambda i=i: results.append(
+                    self.request("GET", f"/api/history/stats?client_id=c{i}")[0]))
+                for i in range(4)
+            ]
+            start = time.perf_counter()
+            for t in threads:
+                t.start()
+            fast_status, _ = self.request("GET", "/api/history/recent?client_id=other")
+            for t in threads:
+                t.join()
+            elapsed = time.perf_counter() - start
+        self.assertEqual(results, [200] * 4)
+        self.assertEqual(fast_status, 200)
+        self.assertLess(elapsed, 0.9)  # 串行处理需要 1.2s
+
+    def test_full_queue_rejected(self):
+        """测试工作线程和队列都占满时返回 503"""
+        release = threading.Event()
+
+        def blocked(client_id):
+            release.wait(5)
+            return {"today_count": 0, "by_category": {}, "ok": True}
+
+        def occupied():
+            stats = self.server.get_stats()
+            return stats["busy_workers"] + stats["queued"]
+
+        with patch.object(db, 'get_stats', side_effect=blocked):
+            socks = []
+            # 逐个占满工作线程和队列，等前一个连接被接收后再发下一个
+            for i in range(self.workers + self.queue_depth):
+                s = socket.create_connection(("127.0.0.1", self.port))
+                s.sendall(f"GET /api/history/stats?client_id=c{i} HTTP/1.0\r\n\r\n".encode())
+                socks.append(s)
+                deadline = time.monotonic() + 2
+                while occupied() < i + 1 and time.monotonic() < deadline:
+                    time.sleep(0.005)
+            status, body = self.request("GET", "/api/history/recent?client_id=c1")
+            release.set()
+            for s in socks:
+                s.recv(65536)
+                s.close()
+        self.assertEqual(status, 503)
+        self.assertFalse(body["ok"])
+        self.assertEqual(self.server.get_stats()["rejected"], 1)
+
+
+class TestKeepAlive(_ServerTestCase):
+    """测试 HTTP/1.1 持久连接"""
+
+    def test_draw_sequence_reuses_connection(self):
+        """测试 recent -> add -> list -> stats 复用同一连接，且空闲时不占用工作线程"""
+        conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=5)
+        sequence = [
+            ("GET", "/api/history/recent?client_id=c1", None),
+            ("POST", "/api/history/add", {"client_id": "c1", "id": "TAC-01", "content": "规则1"}),
+            ("GET", "/api/history/list?client_id=c1", None),
+            ("GET", "/api/history/stats?client_id=c1", None),
+            ("OPTIONS", "/api/history/add", None),
+            ("GET", "/api/missing", None),
+        ]
+        for method, path, payload in sequence:
+            conn.request(method, path, body=json.dumps(payload).encode("utf-8") if payload else None)
+            resp = conn.getresponse()
+            resp.read()
+            if method == "OPTIONS":
+                self.assertEqual(resp.status, 204)
+                self.assertIsNone(resp.getheader("Content-Length"))
+            else:
+                self.assertIsNotNone(resp.getheader("Content-Length"))
+            self.assertFalse(resp.will_close)
+            # 稍作停顿让连接交还 keep-alive 线程；否则下一个请求可能在交还前到达，
+            # 由同一工作线程直接处理而不计入 reused
+            time.sleep(0.02)
+        conn.close()
+        stats = self.server.get_stats()
+        self.assertEqual(stats["keepalive"]["connections"], 1)
+        self.assertGreaterEqual(stats["keepalive"]["reused"], 1)
+
+    def test_max_requests_per_connection(self):
+        """测试达到单连接请求上限后关闭连接"""
+        with patch.object(api_server, 'API_KEEPALIVE_MAX_REQUESTS', 3):
+            conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=5)
+            closes = []
+            for _ in range(3):
+                conn.request("GET", "/api/history/recent?client_id=c1")
+                resp = conn.getresponse()
+                resp.read()
+                closes.append(resp.will_close)
+            conn.close()
+        self.assertEqual(closes, [False, False, True])
+
+    def test_idle_connection_closed(self):
+        """测试空闲超时后服务器关闭连接"""
+        self.server.keepalive_timeout = 0.2
+        sock = socket.create_connection(("127.0.0.1", self.port))
+        sock.settimeout(3)
+        sock.sendall(b"GET /api/history/recent?client_id=c1 HTTP/1.1\r\nHost: x\r\n\r\n")
+        data = b""
+        while b"\r\n\r\n" not in data or not data.endswith(b"}"):
+            data += sock.recv(65536)
+        start = time.monotonic()
+        self.assertEqual(sock.recv(65536), b"")  # 服务器关闭
+        self.assertLess(time.monotonic() - start, 2.5)
+        sock.close()
+        deadline = time.monotonic() + 1
+        while self.server.get_stats()["keepalive"]["idle_closed"] == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.server.get_stats()["keepalive"]["idle_closed"], 1)
+
+    def test_pipelined_requests(self):
+        """测试一次发出的多个请求都得到响应"""
+        sock = socket.create_connection(("127.0.0.1", self.port))
+        sock.settimeout(3)
+        request = b"GET /api/history/recent?client_id=c1 HTTP/1.1\r\nHost: x\r\n\r\n"
+        sock.sendall(request * 3)
+        data = b""
+        while data.count(b"HTTP/1.1 200") < 3:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            data += chunk
+        sock.close()
+        self.assertEqual(data.count(b"HTTP/1.1 200"), 3)
+
+
+class TestSingleServer(_ServerTestCase):
+    """测试单线程模式仍可用"""
+
+    mode = "single"
+
+    def test_single_mode_serves(self):
+        status, body = self.request("GET", "/api/health")
+        self.assertEqual(status, 200)
+        self.assertNotIn("server", body)
+
+
+class TestAsyncServer(_ServerTestCase):
+    """测试 asyncio 服务器与线程池服务器行为一致"""
+
+    mode = "asyncio"
+
+    test_history_flow = TestApiHandler.test_history_flow
+    test_errors = TestApiHandler.test_errors
+    test_not_modified_until_write = TestConditionalGet.test_not_modified_until_write
+    test_large_json_gzipped = TestCompression.test_large_json_gzipped
+
+    def test_connection_reused(self):
+        """测试同一连接上连续请求，204 的 OPTIONS 不带 Content-Length"""
+        conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=5)
+        for method, path in (("GET", "/api/history/recent?client_id=c1"),
+                             ("OPTIONS", "/api/history/add"),
+                             ("GET", "/api/missing"),
+                             ("GET", "/api/health")):
+            conn.request(method, path)
+            resp = conn.getresponse()
+            data = resp.read()
+            if method == "OPTIONS":
+                self.assertEqual((resp.status, data), (204, b""))
+                self.assertIsNone(resp.getheader("Content-Length"))
+            else:
+                self.assertEqual(resp.getheader("Content-Length"), str(len(data)))
+            self.assertFalse(resp.will_close)
+        conn.close()
+        server = json.loads(data)["server"]
+        self.assertEqual(server["mode"], "asyncio")
+        self.assertEqual(server["connections"], 1)
+        self.assertEqual(server["requests"], 3)
+
+    def test_slow_request_does_not_block_loop(self):
+        """测试慢的数据库调用在线程池中执行，不阻塞其他连接"""
+        def slow_stats(client_id):
+            time.sleep(0.5)
+            return {"today_count": 0, "by_category": {}, "ok": True}
+
+        with patch.object(db, 'get_stats', side_effect=slow_stats):
+            thread = threading.Thread(target=self.request, args=("GET", "/api/history/stats?client_id=c1"))
+            thread.start()
+            time.sleep(0.05)
+            start = time.perf_counter()
+            status, _ = self.request("GET", "/api/history/recent?client_id=c2")
+            elapsed = time.perf_counter() - start
+            thread.join()
+        self.assertEqual(status, 200)
+        self.assertLess(elapsed, 0.3)
+
+    def test_idle_connection_closed(self):
+        """测试空闲超时后关闭连接"""
+        self.server.keepalive_timeout = 0.2
+        sock = socket.create_connection(("127.0.0.1", self.port))
+        sock.settimeout(3)
+        sock.sendall(b"GET /api/history/recent?client_id=c1 HTTP/1.1\r\nHost: x\r\n\r\n")
+        data = b""
+        while not data.endswith(b"}"):
+            data += sock.recv(65536)
+        self.assertEqual(sock.recv(65536), b"")
+        sock.close()
+        self.assertEqual(self.server.get_stats()["idle_closed"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+"""
+构建缓存测试
+"""
+import unittest
+import sys
+import os
+import tempfile
+from unittest.mock import patch
+
+# 添加 src 到路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import build_cache
+
+
+class TestBuildCache(unittest.TestCase):
+    """测试按输入内容哈希缓存构建结果"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.paths = [os.path.join(self.tmpdir.name, name) for name in ("a.js", "b.css")]
+        for path in self.paths:
+            self._write(path, "v1")
+        self.cache = build_cache.BuildCache(max_entries=2)
+        self.builds = 0
+
+    def _write(self, path, text):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        # 保证 mtime 变化，不依赖文件系统的时间精度
+        st = os.stat(path)
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1000000))
+
+    def _build(self):
+        self.builds += 1
+        return f"page-{self.builds}"
+
+    def test_hit_until_input_changes(self):
+        """测试输入不变时命中，任一文件或额外参数变化时重新构建"""
+        self.assertEqual(self.cache.get(self.paths, self._build)[:2], ("page-1", False))
+        self.assertEqual(self.cache.get(self.paths, self._build)[:2], ("page-1", True))
+
+        self._write(self.paths[1], "v2")
+        self.assertEqual(self.cache.get(self.paths, self._build)[:2], ("page-2", False))
+        self.assertEqual(self.cache.get(self.paths, self._build, extra=(8503,))[:2], ("page-3", False))
+
+        # 内容改回原样：键与第一次相同，但该结果已按容量淘汰
+        self._write(self.paths[1], "v1")
+        self.assertEqual(self.cache.get(self.paths, self._build)[:2], ("page-4", False))
+
+        stats = self.cache.get_stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["entries"]), (1, 4, 2))
+        self.assertGreaterEqual(stats["hit_ms_avg"], 0.0)
+
+    def test_touch_without_change_hits(self):
+        """测试 mtime 变化但内容不变时仍然命中，未变化的文件不重新读取"""
+        self.cache.get(self.paths, self._build)
+        self._write(self.paths[0], "v1")
+        with patch('builtins.open', wraps=open) as mock_open:
+            self.assertTrue(self.cache.get(self.paths, self._build)[1])
+        self.assertEqual(mock_open.call_count, 1)
+        self.assertEqual(self.builds, 1)
+
+    def test_missing_file(self):
+        """测试缺失的输入文件也参与键，出现后重新构建"""
+        missing = os.path.join(self.tmpdir.name, "missing.js")
+        self.cache.get(self.paths + [missing], self._build)
+        self.assertTrue(self.cache.get(self.paths + [missing], self._build)[1])
+        self._write(missing, "new")
+        self.assertFalse(self.cache.get(self.paths + [missing], self._build)[1])
+
+    def test_shared_by_name(self):
+        """测试按名称取得同一个实例"""
+        patcher = patch.object(build_cache, '_caches', {})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.assertIs(build_cache.get_cache("test-page"), build_cache.get_cache("test-page"))
+        self.assertIn("test-page", build_cache.get_stats())
+
+
+if __name__ == '__main__':
+    unittest.main()
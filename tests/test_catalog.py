@@ -0,0 +1,107 @@
+"""
+规则目录测试
+"""
+import unittest
+import sys
+import os
+import json
+import tempfile
+from unittest.mock import patch
+
+# 添加 src 到路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import catalog
+import validate_data
+
+
+class TestCatalogIndexes(unittest.TestCase):
+    """测试各索引"""
+
+    def test_indexes(self):
+        """测试按 id、分类、标签和前缀查找，重复 id 与无效条目不进入索引"""
+        rules = catalog.Catalog([
+            {"id": "TAC-01", "content": "a", "category": "tactical", "tags": ["团队", "经济"]},
+            {"id": "SOC-01", "content": "b", "category": "social", "tags": ["团队"]},
+            {"id": "SPE-01", "content": "c", "category": "social"},
+            {"id": "TAC-01", "content": "重复", "category": "tactical"},
+            "not a rule",
+        ])
+        self.assertEqual(len(rules), 3)
+        self.assertEqual(rules.get("TAC-01")["content"], "a")
+        self.assertIsNone(rules.get("TAC-02"))
+        self.assertEqual([r["id"] for r in rules.by_category("social")], ["SOC-01", "SPE-01"])
+        self.assertEqual(len(rules.by_category(catalog.ALL)), 3)
+        self.assertEqual([r["id"] for r in rules.by_tag("团队")], ["TAC-01", "SOC-01"])
+        self.assertEqual([r["id"] for r in rules.by_prefix("SPE")], ["SPE-01"])
+        self.assertEqual(rules.by_category("missing"), ())
+        self.assertEqual(len(json.loads(rules.to_json())), 5)
+
+    def test_bundled_rules(self):
+        """测试仓库自带的 rules.json 可加载"""
+        rules = catalog.load()
+        self.assertGreater(len(rules), 0)
+        self.assertEqual(sum(len(rules.by_category(c)) for c in rules.categories()), len(rules))
+
+    def test_load_with_bom(self):
+        """测试带 BOM 的 UTF-8 文件可加载"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "rules.json")
+            with open(path, "w", encoding="utf-8-sig", newline="\r\n") as f:
+                json.dump([{"id": "TAC-01", "content": "规则", "category": "tactical"}], f, ensure_ascii=False, indent=2)
+            rules = catalog.load(path)
+        self.assertEqual(rules.get("TAC-01")["content"], "规则")
+
+
+class TestHotReload(unittest.TestCase):
+    """测试文件变化时重新加载"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.path = os.path.join(self.tmpdir.name, "rules.json")
+        self._write([{"id": "TAC-01", "content": "a", "category": "tactical"}])
+        for p in (
+            patch.object(catalog, 'RULES_PATH', self.path),
+            patch.object(catalog, 'CATALOG_CHECK_INTERVAL', 0),
+            patch.object(catalog, '_current', None),
+            patch.object(catalog, '_stats', dict.fromkeys(catalog._stats, 0)),
+        ):
+            p.start()
+            self.addCleanup(p.stop)
+
+    def _write(self, data, text=None):
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write(text if text is not None else json.dumps(data))
+        # 保证 mtime 变化，不依赖文件系统的时间精度
+        st = os.stat(self.path)
+        os.utime(self.path, ns=(st.st_atime_ns, st.st_mtime_ns + 1000000))
+
+    def test_reload_on_change(self):
+        """测试内容不变不重新解析，内容变化时替换为新版本"""
+        first = catalog.get_catalog()
+        self.assertIs(catalog.get_catalog(), first)
+        self._write([{"id": "TAC-01", "content": "a", "category": "tactical"}])
+        with patch.object(catalog, '_parse', side_effect=AssertionError("reparsed")):
+            self.assertIs(catalog.get_catalog(), first)
+
+        self._write([{"id": "TAC-02", "content": "b", "category": "tactical"}])
+        second = catalog.get_catalog()
+        self.assertIsNot(second, first)
+        self.assertIsNone(second.get("TAC-01"))
+        self.assertEqual(first.get("TAC-01")["content"], "a")
+        stats = catalog.get_stats()
+        self.assertEqual((stats["loads"], stats["reloads"], stats["unchanged"]), (1, 1, 1))
+
+    def test_invalid_file_keeps_previous(self):
+        """测试新内容无效时沿用上一个版本，force 时报错"""
+        first = catalog.get_catalog()
+        self._write(None, text="{not json")
+        self.assertIs(catalog.get_catalog(), first)
+        with self.assertRaises(ValueError):
+            catalog.get_catalog(force=True)
+        self.assertFalse(validate_data.validate_rules_file())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,170 @@
+"""
+熔断器测试
+"""
+import unittest
+import sys
+import os
+import json
+import time
+from unittest.mock import patch
+from urllib.parse import urlsplit, parse_qs
+
+# 添加 src 到路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import api_server
+import circuit_breaker
+import db
+import read_cache
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    """测试状态转换与统计"""
+
+    def setUp(self):
+        self.transitions = []
+        self.breaker = circuit_breaker.CircuitBreaker(
+            window=4, min_calls=4, failure_rate=0.5, slow_call_ms=100, open_seconds=0.05,
+            on_state_change=lambda old, new: self.transitions.append((old, new)),
+        )
+
+    def _fail(self, times=1):
+        for _ in range(times):
+            self.assertTrue(self.breaker.allow())
+            self.breaker.record(0.01, ConnectionError("down"))
+
+    def test_opens_at_failure_rate(self):
+        """测试窗口内失败率达到阈值后打开并拒绝调用"""
+        self.breaker.record(0.01)
+        self.breaker.record(0.01)
+        self._fail(1)
+        self.assertEqual(self.breaker.state, circuit_breaker.CLOSED)  # 未达到最少调用数
+        self._fail(1)
+        self.assertEqual(self.breaker.state, circuit_breaker.OPEN)
+        self.assertFalse(self.breaker.allow())
+        stats = self.breaker.get_stats()
+        self.assertEqual(stats["rejected"], 1)
+        self.assertEqual(stats["opened"], 1)
+        self.assertEqual(stats["last_error"], "down")
+
+    def test_slow_calls_count_as_failures(self):
+        """测试慢调用计入失败率"""
+        for _ in range(4):
+            self.breaker.record(0.2)
+        self.assertEqual(self.breaker.state, circuit_breaker.OPEN)
+        self.assertEqual(self.breaker.get_stats()["slow_calls"], 4)
+
+    def test_half_open_single_probe(self):
+        """测试冷却后只放行一个探测，成功则关闭"""
+        self._fail(4)
+        time.sleep(0.06)
+        self.assertTrue(self.breaker.allow())
+        self.assertFalse(self.breaker.allow())  # 探测进行中
+        self.breaker.record(0.01)
+        self.assertEqual(self.breaker.state, circuit_breaker.CLOSED)
+        self.assertEqual(self.transitions, [
+            ("closed", "open"), ("open", "half_open"), ("half_open", "closed"),
+        ])
+
+    def test_failed_probe_reopens(self):
+        """测试探测失败后重新打开"""
+        self._fail(4)
+        time.sleep(0.06)
+        self._fail(1)
+        self.assertEqual(self.breaker.state, circuit_breaker.OPEN)
+        self.assertFalse(self.breaker.allow())
+        self.assertEqual(self.breaker.get_stats()["opened"], 2)
+
+
+
+class TestUndoFailover(unittest.TestCase):
+    """测试熔断打开时撤销已写入的记录：先应答，恢复后重放删除"""
+
+    def setUp(self):
+        self.rows = []
+        self.requests = []
+        self.down = False
+
+        def fake_pool_request(method, url, headers=None, body=None):
+            if self.down:
+                raise ConnectionRefusedError("connection refused")
+            parts = urlsplit(url)
+            params = {k: v[0] for k, v in parse_qs(parts.query).items()}
+            self.requests.append((method, params))
+            if method == "POST":
+                payload = json.loads(body)
+                inserted = [dict(p, id=len(self.rows) + i + 1) for i, p in enumerate(
+                    payload if isinstance(payload, list) else [payload])]
+                self.rows.extend(inserted)
+                return 201, [], json.dumps(inserted).encode("utf-8")
+            if method == "DELETE":
+                wanted = params["id"][3:].strip("()").split(",")
+                self.rows = [r for r in self.rows if str(r["id"]) not in wanted]
+                return 204, [], b""
+            rows = [r for r in reversed(self.rows) if params.get("client_id") in (None, "eq." + r["client_id"])]
+            return 200, [], json.dumps(rows[:int(params.get("limit", 1000))]).encode("utf-8")
+
+        breaker = circuit_breaker.CircuitBreaker(
+            window=4, min_calls=2, failure_rate=0.5, open_seconds=0.1,
+            on_state_change=db._on_breaker_change,
+        )
+        patches = [
+            patch.object(db, 'SUPABASE_URL', "http://supabase.test"),
+            patch.object(db, 'SUPABASE_ANON_KEY', "key"),
+            patch.object(db, 'DB_BACKEND', ""),
+            patch.object(db, 'SUPABASE_WRITE_BEHIND', False),
+            patch.object(db, 'SUPABASE_WRITE_FLUSH_MS', 10),
+            patch.object(db, '_limited_delete_supported', False),
+            patch.object(db._http_pool, 'request', side_effect=fake_pool_request),
+            patch.object(db, '_breaker', breaker),
+            patch.object(db, '_read_cache', read_cache.ClientCache(max_clients=10, ttl=30, window=50)),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+        self.addCleanup(self._close_queue)
+
+    def _close_queue(self):
+        with db._write_queue_lock:
+            queue, db._write_queue = db._write_queue, None
+        if queue is not None:
+            queue.close(2)
+
+    def _post(self, path, payload):
+        return api_server.dispatch("POST", path, json.dumps(payload).encode("utf-8"))
+
+    def test_undo_while_open_replays_delete(self):
+        """测试熔断打开时撤销返回 200，读取不再包含该行，恢复后重放 DELETE"""
+        for rule_id in ("TAC-01", "TAC-02"):
+            status, body, _ = self._post("/api/history/add", {"client_id": "c1", "id": rule_id, "content": "规则"})
+            self.assertEqual(status, 200)
+        self.assertEqual(db.get_recent_ids(10, "c1"), ["TAC-02", "TAC-01"])
+
+        self.down = True
+        for _ in range(4):
+            self.assertFalse(db.health_check())
+        self.assertEqual(db._breaker.state, circuit_breaker.OPEN)
+
+        status, body, _ = self._post("/api/history/undo", {"client_id": "c1"})
+        self.assertEqual(status, 200)
+        self.assertEqual(body["item"]["rule_id"], "TAC-02")
+        self.assertEqual(db.get_recent_ids(10, "c1"), ["TAC-01"])
+        status, body, _ = self._post("/api/history/undo", {"client_id": "c1"})
+        self.assertEqual(body["item"]["rule_id"], "TAC-01")
+        self.assertEqual(db.get_recent_ids(10, "c1"), [])
+        self.assertEqual(len(self.rows), 2)  # 故障期间未发出删除
+
+        self.down = False
+        time.sleep(0.15)
+        self.assertTrue(db.health_check())
+        self.assertTrue(db._write_queue.flush(2))
+        deletes = [params["id"] for method, params in self.requests if method == "DELETE"]
+        self.assertEqual(deletes, ["in.(2)", "in.(1)"])
+        self.assertEqual(self.rows, [])
+        self.assertEqual(db.get_write_behind_stats()["tombstones"], 2)
+        db._read_cache.invalidate()
+        self.assertEqual(db.get_recent_ids(10, "c1"), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+"""
+响应压缩测试
+"""
+import unittest
+import sys
+import os
+import gzip
+from unittest.mock import patch
+
+# 添加 src 到路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import compression
+
+
+class TestNegotiation(unittest.TestCase):
+    """测试 Accept-Encoding 协商"""
+
+    def test_choose_encoding(self):
+        """测试 q 值、通配符与不支持的编码"""
+        with patch.object(compression, 'brotli', None):
+            self.assertEqual(compression.choose_encoding("gzip, deflate, br"), "gzip")
+            self.assertEqual(compression.choose_encoding("*"), "gzip")
+            self.assertIsNone(compression.choose_encoding("gzip;q=0, deflate"))
+            self.assertIsNone(compression.choose_encoding("*, gzip;q=0"))
+            self.assertIsNone(compression.choose_encoding(""))
+            self.assertIsNone(compression.choose_encoding(None))
+        self.assertEqual(compression.choose_encoding("br;q=0.5, gzip", ("br", "gzip")), "gzip")
+        self.assertEqual(compression.choose_encoding("br, gzip", ("br", "gzip")), "br")
+
+    def test_threshold(self):
+        """测试小响应不压缩，大响应压缩且可还原"""
+        small = b'{"ok": true}'
+        self.assertEqual(compression.encode(small, "gzip"), (small, None))
+        large = b'{"items": [' + b",".join(b'{"rule_id": "TAC-01"}' for _ in range(200)) + b"]}"
+        body, encoding = compression.encode(large, "gzip")
+        self.assertEqual(encoding, "gzip")
+        self.assertLess(len(body), len(large))
+        self.assertEqual(gzip.decompress(body), large)
+        self.assertEqual(compression.encode(large, "identity"), (large, None))
+
+
+class TestStaticPayload(unittest.TestCase):
+    """测试静态内容预压缩"""
+
+    def test_precompressed_once(self):
+        """测试注册时压缩一次，之后选择变体不再压缩"""
+        data = b"<html>" + b"<div class='rule'>rule</div>" * 500 + b"</html>"
+        with patch.object(compression, 'brotli', None):
+            payload = compression.StaticPayload(data, "text/html")
+            with patch.object(compression, 'compress', side_effect=AssertionError("compressed per request")):
+                body, encoding = payload.select("gzip, br")
+                self.assertEqual(payload.select("identity"), (data, None))
+        self.assertEqual(encoding, "gzip")
+        self.assertEqual(gzip.decompress(body), data)
+
+        report = payload.report()
+        self.assertEqual(report["bytes"], len(data))
+        self.assertEqual(report["encoded_bytes"], {"gzip": len(body)})
+        self.assertEqual(report["saved_bytes"], len(data) - len(body))
+        self.assertEqual(report["served"], 2)
+        self.assertEqual(report["served_saved_bytes"], len(data) - len(body))
+
+    @unittest.skipUnless(compression.brotli is not None, "brotli not installed")
+    def test_brotli_preferred(self):
+        """测试安装 brotli 时优先使用"""
+        data = b"rule " * 1000
+        payload = compression.StaticPayload(data, "text/plain")
+        body, encoding = payload.select("gzip, br")
+        self.assertEqual(encoding, "br")
+        self.assertEqual(compression.brotli.decompress(body), data)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,6 +5,7 @@ import unittest
 import sys
 import os
 import json
+import threading
 from unittest.mock import patch, MagicMock
 
 # 添加 src 到路径
@@ -49,9 +50,7 @@ class TestDBFunctions(unittest.TestCase):
     def test_add_record_memory_mode(self, mock_use_supabase):
         """测试内存模式下添加记录"""
         # 重置内存存储
-        with db._memory_store_lock:
-            db._memory_store["history"] = []
-            db._memory_store["id_counter"] = 1
+        db._memory_reset()
         
         result = db.add_record(self.sample_rule, self.client_id)
         
@@ -65,9 +64,7 @@ class TestDBFunctions(unittest.TestCase):
     def test_get_recent_history_memory_mode(self, mock_use_supabase):
         """测试内存模式下获取历史记录"""
         # 重置并添加测试数据
-        with db._memory_store_lock:
-            db._memory_store["history"] = []
-            db._memory_store["id_counter"] = 1
+        db._memory_reset()
         
         db.add_record(self.sample_rule, self.client_id)
         
@@ -79,9 +76,7 @@ class TestDBFunctions(unittest.TestCase):
     def test_delete_last_record_memory_mode(self, mock_use_supabase):
         """测试内存模式下删除最后一条记录"""
         # 重置并添加测试数据
-        with db._memory_store_lock:
-            db._memory_store["history"] = []
-            db._memory_store["id_counter"] = 1
+        db._memory_reset()
         
         db.add_record(self.sample_rule, self.client_id)
         
@@ -97,9 +92,7 @@ class TestDBFunctions(unittest.TestCase):
     def test_delete_records_by_ids_memory_mode(self, mock_use_supabase):
         """测试内存模式下按ID删除记录"""
         # 重置并添加测试数据
-        with db._memory_store_lock:
-            db._memory_store["history"] = []
-            db._memory_store["id_counter"] = 1
+        db._memory_reset()
         
         record = db.add_record(self.sample_rule, self.client_id)
         
@@ -111,6 +104,1011 @@ class TestDBFunctions(unittest.TestCase):
         self.assertEqual(len(history), 0)
 
 
+@patch.object(db, '_use_supabase', return_value=False)
+class TestMemoryClientIndex(unittest.TestCase):
+    """测试内存模式的按客户端索引"""
+
+    def setUp(self):
+        db._memory_reset()
+        self.rules = [
+            {"id": "TAC-01", "content": "规则1", "category": "tactical"},
+            {"id": "SOC-01", "content": "规则2", "category": "social"},
+            {"id": "WEP-01", "content": "规则3", "category": "weaponry"},
+        ]
+
+    def test_recent_history_is_per_client_and_id_desc(self, mock_use_supabase):
+        """测试最近记录按客户端隔离且按 id 倒序"""
+        for rule in self.rules:
+            db.add_record(rule, "client-a")
+            db.add_record(rule, "client-b")
+
+        rows = db.get_recent_history(2, "client-a")
+        self.assertEqual([r[1] for r in rows], ["WEP-01", "SOC-01"])
+        self.assertGreater(rows[0][0], rows[1][0])
+        self.assertEqual(db.get_recent_ids(10, "client-b"), ["WEP-01", "SOC-01", "TAC-01"])
+        self.assertEqual(db.get_recent_history(10, "unknown"), [])
+
+    def test_recent_history_without_client_spans_all(self, mock_use_supabase):
+        """测试不指定客户端时返回全局最近记录"""
+        db.add_record(self.rules[0], "client-a")
+        db.add_record(self.rules[1], "client-b")
+
+        rows = db.get_recent_history(10)
+        self.assertEqual([r[1] for r in rows], ["SOC-01", "TAC-01"])
+
+    def test_delete_only_touches_own_client(self, mock_use_supabase):
+        """测试删除不会影响其他客户端"""
+        a = db.add_record(self.rules[0], "client-a")
+        b = db.add_record(self.rules[1], "client-b")
+
+        self.assertEqual(db.delete_records_by_ids("client-a", [a["id"], b["id"]]), 1)
+        self.assertEqual(db.get_recent_ids(10, "client-b"), ["SOC-01"])
+
+        last = db.delete_last_record("client-b")
+        self.assertEqual(last[0], b["id"])
+        self.assertIsNone(db.delete_last_record("client-b"))
+        self.assertEqual(db.get_recent_history(10), [])
+
+
+@patch.object(db, '_use_supabase', return_value=False)
+class TestMemoryStatsAggregates(unittest.TestCase):
+    """测试内存模式增量统计聚合"""
+
+    def setUp(self):
+        db._memory_reset()
+
+    def test_aggregates_follow_add_and_delete(self, mock_use_supabase):
+        """测试聚合随增删同步更新且与原始历史一致"""
+        rules = [
+            {"id": "TAC-01", "content": "规则1", "category": "tactical"},
+            {"id": "TAC-02", "content": "规则2", "category": "tactical"},
+            {"id": "SOC-01", "content": "规则3", "category": "social"},
+            {"id": "SPE-01", "content": "规则4", "category": ""},
+        ]
+        records = [db.add_record(rule, "client-a") for rule in rules]
+        db.add_record(rules[2], "client-b")
+
+        stats = db.get_stats("client-a")
+        self.assertEqual(stats["by_category"], {"tactical": 2, "social": 1})
+        self.assertEqual(stats["today_count"], 4)
+        self.assertEqual(stats["top_category"], "tactical")
+
+        db.delete_records_by_ids("client-a", [records[0]["id"]])
+        db.delete_last_record("client-a")
+        stats = db.get_stats("client-a")
+        self.assertEqual(stats["by_category"], {"tactical": 1, "social": 1})
+        self.assertEqual(stats["today_count"], 2)
+        self.assertEqual(db._memory_check_aggregates(), [])
+
+    def test_today_count_rolls_over(self, mock_use_supabase):
+        """测试跨 UTC 日期后今日计数归零，删除旧记录扣减对应日期"""
+        rule = {"id": "TAC-01", "content": "规则1", "category": "tactical"}
+        with patch.object(db, '_get_current_timestamp', return_value="2024-01-01T23:59:59+00:00"):
+            old = db.add_record(rule, "client-a")
+        with patch.object(db, '_get_current_timestamp', return_value="2024-01-02T00:00:01+00:00"):
+            db.add_record(rule, "client-a")
+
+        with patch.object(db, '_get_today_iso', return_value="2024-01-01"):
+            self.assertEqual(db.get_stats("client-a")["today_count"], 1)
+        with patch.object(db, '_get_today_iso', return_value="2024-01-02"):
+            self.assertEqual(db.get_stats("client-a")["today_count"], 1)
+            db.delete_records_by_ids("client-a", [old["id"]])
+            self.assertEqual(db.get_stats("client-a")["today_count"], 1)
+        with patch.object(db, '_get_today_iso', return_value="2024-01-03"):
+            self.assertEqual(db.get_stats("client-a")["today_count"], 0)
+        self.assertEqual(db._memory_check_aggregates(), [])
+
+
+@patch.object(db, '_use_supabase', return_value=False)
+class TestMemoryLocking(unittest.TestCase):
+    """测试内存模式分段锁"""
+
+    def setUp(self):
+        db._memory_reset()
+
+    def test_concurrent_writes_keep_indexes_consistent(self, mock_use_supabase):
+        """测试多线程并发写入后索引与聚合保持一致"""
+        import threading
+
+        rule = {"id": "TAC-01", "content": "规则1", "category": "tactical"}
+
+        def worker(n):
+            for _ in range(50):
+                db.add_record(rule, f"client-{n % 4}")
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        all_ids = [r[0] for r in db.get_recent_history(1000)]
+        self.assertEqual(len(all_ids), 400)
+        self.assertEqual(all_ids, sorted(all_ids, reverse=True))
+        for n in range(4):
+            ids = [r[0] for r in db.get_recent_history(1000, f"client-{n}")]
+            self.assertEqual(len(ids), 100)
+            self.assertEqual(ids, sorted(ids, reverse=True))
+        self.assertEqual(db._memory_check_aggregates(), [])
+
+    def test_lock_stats(self, mock_use_supabase):
+        """测试另一线程持有分段锁时，写入的等待次数和等待时间增加，并出现在内存用量中"""
+        db.get_lock_stats(reset=True)
+        held = threading.Event()
+        release = threading.Event()
+
+        def hold():
+            with db._memory_lock("client-a"):
+                held.set()
+                release.wait(5)
+
+        holder = threading.Thread(target=hold)
+        holder.start()
+        self.assertTrue(held.wait(5))
+        threading.Timer(0.05, release.set).start()
+        db.add_record({"id": "TAC-01", "content": "规则1"}, "client-a")
+        holder.join(5)
+
+        stats = db.get_memory_usage()["locks"]
+        self.assertEqual(stats["stripes"], db.MEMORY_LOCK_STRIPES)
+        self.assertGreaterEqual(stats["contended"], 1)
+        self.assertGreaterEqual(stats["wait_ms_total"], 40)
+        self.assertGreaterEqual(stats["wait_ms_max"], 40)
+
+
+@patch.object(db, '_use_supabase', return_value=False)
+class TestMemoryRetention(unittest.TestCase):
+    """测试内存模式保留与淘汰策略"""
+
+    def setUp(self):
+        db._memory_reset()
+        self.rule = {"id": "TAC-01", "content": "规则1", "category": "tactical"}
+
+    def test_max_records_per_client(self, mock_use_supabase):
+        """测试单客户端条数上限只保留最新记录"""
+        with patch.object(db, 'MEMORY_MAX_RECORDS_PER_CLIENT', 3):
+            records = [db.add_record(self.rule, "client-a") for _ in range(5)]
+
+        ids = [r[0] for r in db.get_recent_history(10, "client-a")]
+        self.assertEqual(ids, [r["id"] for r in reversed(records[-3:])])
+        usage = db.get_memory_usage()
+        self.assertEqual(usage["records"], 3)
+        self.assertEqual(usage["evictions"]["trimmed"], 2)
+        self.assertEqual(db.get_stats("client-a")["by_category"], {"tactical": 3})
+
+    def test_max_age_expires_old_records(self, mock_use_supabase):
+        """测试超过最大保存时长的记录在访问时被清理"""
+        with patch.object(db, '_get_current_timestamp', return_value="2020-01-01T00:00:00+00:00"):
+            db.add_record(self.rule, "client-a")
+            db.add_record(self.rule, "client-b")
+        db.add_record(self.rule, "client-a")
+
+        with patch.object(db, 'MEMORY_MAX_AGE_SECONDS', 3600):
+            self.assertEqual(len(db.get_recent_history(10, "client-a")), 1)
+            usage = db.enforce_memory_retention()
+        self.assertEqual(usage["records"], 1)
+        self.assertEqual(usage["clients"], 1)
+        self.assertEqual(usage["evictions"]["expired"], 2)
+
+    def test_expiry_changes_client_version(self, mock_use_supabase):
+        """测试取版本号时先清理过期记录，条件请求不会对已过期的记录返回 304"""
+        with patch.object(db, '_get_current_timestamp', return_value="2020-01-01T00:00:00+00:00"):
+            db.add_record(self.rule, "client-a")
+        version = db.get_client_version("client-a")
+
+        with patch.object(db, 'MEMORY_MAX_AGE_SECONDS', 3600):
+            self.assertNotEqual(db.get_client_version("client-a"), version)
+            version = db.get_client_version("client-a")
+            self.assertEqual(db.get_client_version("client-a"), version)
+        self.assertEqual(db.get_memory_usage()["records"], 0)
+
+    def test_lru_eviction_under_record_budget(self, mock_use_supabase):
+        """测试超出全局记录预算时淘汰最久未访问的客户端"""
+        with patch.object(db, 'MEMORY_MAX_TOTAL_RECORDS', 4):
+            for cid in ("client-a", "client-b"):
+                db.add_record(self.rule, cid)
+                db.add_record(self.rule, cid)
+            db.get_recent_history(10, "client-a")  # client-a 变为最近访问
+            db.add_record(self.rule, "client-c")
+
+        self.assertEqual(db.get_recent_history(10, "client-b"), [])
+        self.assertEqual(len(db.get_recent_history(10, "client-a")), 2)
+        usage = db.get_memory_usage()
+        self.assertEqual(usage["records"], 3)
+        self.assertEqual(usage["evictions"]["evicted_clients"], 1)
+        self.assertEqual(usage["evictions"]["evicted_records"], 2)
+
+    def test_byte_budget_and_usage_accounting(self, mock_use_supabase):
+        """测试字节预算与用量计数"""
+        db.add_record(self.rule, "client-a")
+        per_record = db.get_memory_usage()["bytes"]
+        self.assertGreater(per_record, 0)
+
+        with patch.object(db, 'MEMORY_MAX_BYTES', per_record * 2):
+            db.add_record(self.rule, "client-b")
+            db.add_record(self.rule, "client-c")
+        self.assertLessEqual(db.get_memory_usage()["bytes"], per_record * 2)
+
+        db._memory_reset()
+        self.assertEqual(db.get_memory_usage()["bytes"], 0)
+
+    def test_byte_usage_counts_content(self, mock_use_supabase):
+        """测试用量计入记录内容，超长内容不会被低估"""
+        for i in range(10):
+            db.add_record(dict(self.rule, content=f"{i}" + "x" * 100000), "client-a")
+        self.assertGreater(db.get_memory_usage()["bytes"], 10 * 100000)
+
+
+@patch.object(db, '_use_supabase', return_value=False)
+class TestClientVersion(unittest.TestCase):
+    """测试客户端数据版本号"""
+
+    def setUp(self):
+        db._memory_reset()
+        self.rule = {"id": "TAC-01", "content": "规则1", "category": "tactical"}
+
+    def test_changes_on_write_only(self, mock_use_supabase):
+        """测试写入和删除改变版本，读取和其他客户端的写入不改变"""
+        seen = [db.get_client_version("client-a")]
+        record = db.add_record(self.rule, "client-a")
+        seen.append(db.get_client_version("client-a"))
+        db.get_recent_history(10, "client-a")
+        db.get_stats("client-a")
+        db.add_record(self.rule, "client-b")
+        self.assertEqual(db.get_client_version("client-a"), seen[-1])
+
+        db.delete_records_by_ids("client-a", [record["id"]])
+        seen.append(db.get_client_version("client-a"))
+        self.assertIsNone(db.delete_last_record("client-a"))
+        self.assertEqual(db.get_client_version("client-a"), seen[-1])
+        self.assertEqual(len(set(seen)), 3)
+
+    def test_retention_and_reset_change_version(self, mock_use_supabase):
+        """测试保留策略删除记录、清空存储后版本都会变化"""
+        db.add_record(self.rule, "client-a")
+        with patch.object(db, 'MEMORY_MAX_RECORDS_PER_CLIENT', 1):
+            before = db.get_client_version("client-a")
+            db.add_record(self.rule, "client-b")
+            self.assertEqual(db.get_client_version("client-a"), before)
+            db.add_record(self.rule, "client-a")
+        after = db.get_client_version("client-a")
+        self.assertNotEqual(after, before)
+        db._memory_reset()
+        self.assertNotEqual(db.get_client_version("client-a"), after)
+
+    def test_evicted_clients_never_reuse_versions(self, mock_use_supabase):
+        """测试超出登记上限后，被淘汰客户端的版本不会回到淘汰前发出过的值"""
+        with patch.object(db, '_VERSION_MAX_CLIENTS', 2):
+            db.add_record(self.rule, "client-a")
+            issued = db.get_client_version("client-a")
+            db.add_record(self.rule, "client-a")
+            db.add_record(self.rule, "client-b")
+            db.add_record(self.rule, "client-c")
+            self.assertNotIn("client-a", db._versions)
+            self.assertNotEqual(db.get_client_version("client-a"), issued)
+
+
+class TestCompactRecord(unittest.TestCase):
+    """测试紧凑记录表示"""
+
+    def test_timestamp_round_trip(self):
+        """测试微秒时间戳还原为相同的 ISO 字符串"""
+        for ts in ("2024-01-01T23:59:59+00:00", "2024-06-30T08:15:42.123456+00:00"):
+            record = db._Record(1, "TAC-01", "规则", "tactical", "client-a", db._timestamp_to_us(ts))
+            self.assertEqual(record.timestamp, ts)
+            self.assertEqual(db._record_day(record), ts[:10])
+
+    def test_row_and_dict_shapes(self):
+        """测试对外返回的元组与字典形状不变"""
+        ts = "2024-01-01T00:00:00.000001+00:00"
+        record = db._Record(7, "TAC-01", "规则", "tactical", "client-a", db._timestamp_to_us(ts))
+        self.assertEqual(record.as_row(), (7, "TAC-01", "规则", "tactical", ts))
+        self.assertEqual(record.to_dict(), {
+            "id": 7, "rule_id": "TAC-01", "content": "规则",
+            "category": "tactical", "timestamp": ts, "client_id": "client-a",
+        })
+
+    def test_strings_are_shared(self):
+        """测试同一规则的记录共享字符串对象"""
+        a = db._Record(1, "".join(["TAC", "-01"]), "".join(["规", "则"]), "tactical", "c", 0)
+        b = db._Record(2, "".join(["TAC", "-01"]), "".join(["规", "则"]), "tactical", "c", 0)
+        self.assertIs(a.rule_id, b.rule_id)
+        self.assertIs(a.content, b.content)
+        self.assertFalse(hasattr(a, "__dict__"))
+
+
+class TestSQLiteBackend(unittest.TestCase):
+    """测试 SQLite 存储后端"""
+
+    def setUp(self):
+        import tempfile
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "history.sqlite3")
+        patchers = [
+            patch.object(db, 'DB_BACKEND', 'sqlite'),
+            patch.object(db, 'SQLITE_PATH', self.path),
+        ]
+        for p in patchers:
+            p.start()
+            self.addCleanup(p.stop)
+        self.assertTrue(db.init_db())
+        self.rules = [
+            {"id": "TAC-01", "content": "规则1", "category": "tactical"},
+            {"id": "SOC-01", "content": "规则2", "category": "social"},
+        ]
+
+    def tearDown(self):
+        import db_sqlite
+        db_sqlite.close()
+        self.tmpdir.cleanup()
+
+    def test_schema_wal_and_indexes(self):
+        """测试 WAL 模式与索引"""
+        import db_sqlite
+        conn = db_sqlite._conn()
+        self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+        indexes = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        self.assertIn("idx_history_client_id", indexes)
+        self.assertIn("idx_history_client_ts", indexes)
+        self.assertEqual(db.get_backend(), "sqlite")
+        self.assertTrue(db.health_check())
+
+    def test_add_list_and_stats(self):
+        """测试写入、查询与统计"""
+        first = db.add_record(self.rules[0], "client-a")
+        db.add_record(self.rules[1], "client-a")
+        db.add_record(self.rules[0], "client-b")
+
+        self.assertEqual(first["rule_id"], "TAC-01")
+        self.assertEqual(first["client_id"], "client-a")
+        rows = db.get_recent_history(10, "client-a")
+        self.assertEqual([r[1] for r in rows], ["SOC-01", "TAC-01"])
+        self.assertEqual(rows[1], (first["id"], "TAC-01", "规则1", "tactical", first["timestamp"]))
+        self.assertEqual(db.get_recent_ids(1, "client-a"), ["SOC-01"])
+        self.assertEqual(len(db.get_recent_history(10)), 3)
+
+        stats = db.get_stats("client-a")
+        self.assertEqual(stats["today_count"], 2)
+        self.assertEqual(stats["by_category"], {"tactical": 1, "social": 1})
+
+    def test_null_category_stored_as_empty(self):
+        """测试 category 为 null 的请求体按空分类写入，不违反 NOT NULL 约束"""
+        record = db.add_record({"id": "TAC-01", "content": "规则1", "category": None}, "client-a")
+        self.assertEqual(record["category"], "")
+        rows = db.draw_records("client-a", lambda recent: [{"id": "SOC-01", "content": "规则2", "category": None}])
+        self.assertEqual(rows[0]["category"], "")
+        self.assertEqual([r[3] for r in db.get_recent_history(10, "client-a")], ["", ""])
+        self.assertEqual(db.get_stats("client-a")["by_category"], {})
+
+    def test_undo_semantics(self):
+        """测试撤销与按 ID 删除"""
+        a = db.add_record(self.rules[0], "client-a")
+        b = db.add_record(self.rules[1], "client-a")
+        other = db.add_record(self.rules[0], "client-b")
+
+        self.assertEqual(db.delete_last_record("client-a")[0], b["id"])
+        self.assertEqual(db.delete_records_by_ids("client-a", [a["id"], other["id"], "x"]), 1)
+        self.assertIsNone(db.delete_last_record("client-a"))
+        self.assertEqual(db.get_recent_ids(10, "client-b"), ["TAC-01"])
+
+    def test_snapshot_matches_separate_reads(self):
+        """测试合并读取与分别读取的结果一致"""
+        for rule in self.rules * 2:
+            db.add_record(rule, "client-a")
+        snapshot = db.get_snapshot("client-a", 3, 2)
+        self.assertEqual(snapshot["items"], db.get_recent_history(3, "client-a"))
+        self.assertEqual(snapshot["ids"], db.get_recent_ids(2, "client-a"))
+        self.assertEqual(snapshot["stats"], db.get_stats("client-a"))
+
+    def test_draw_records_in_one_transaction(self):
+        """测试抽取时看到最近记录，写入结果与普通写入一致"""
+        db.add_record(self.rules[0], "client-a")
+        seen = []
+
+        def choose(recent):
+            seen.append(recent)
+            return [self.rules[1]]
+
+        version = db.get_client_version("client-a")
+        rows = db.draw_records("client-a", choose)
+        self.assertEqual(seen, [{"TAC-01"}])
+        self.assertEqual(rows[0]["rule_id"], "SOC-01")
+        self.assertEqual(db.get_recent_ids(10, "client-a"), ["SOC-01", "TAC-01"])
+        self.assertNotEqual(db.get_client_version("client-a"), version)
+
+    def test_persists_across_connections(self):
+        """测试数据在重新打开连接后仍然存在"""
+        import db_sqlite
+        db.add_record(self.rules[0], "client-a")
+        db_sqlite.close()
+        db.init_db()
+        self.assertEqual(db.get_recent_ids(10, "client-a"), ["TAC-01"])
+
+
+@patch.object(db, '_use_supabase', return_value=False)
+class TestMemoryJournal(unittest.TestCase):
+    """测试内存模式日志与快照恢复"""
+
+    def setUp(self):
+        import tempfile
+        self.tmpdir = tempfile.TemporaryDirectory()
+        patchers = [
+            patch.object(db, 'MEMORY_JOURNAL_DIR', self.tmpdir.name),
+            patch.object(db, 'MEMORY_JOURNAL_GROUP_MS', 10),
+            patch.object(db, 'MEMORY_SNAPSHOT_EVERY', 0),
+        ]
+        for p in patchers:
+            p.start()
+            self.addCleanup(p.stop)
+        db.shutdown()
+        db._memory_reset()
+        self.rules = [
+            {"id": "TAC-01", "content": "规则1", "category": "tactical"},
+            {"id": "SOC-01", "content": "规则2", "category": "social"},
+        ]
+
+    def tearDown(self):
+        db.shutdown()
+        db._memory_reset()
+        self.tmpdir.cleanup()
+
+    def _restart(self):
+        db.shutdown()
+        db._memory_reset()
+        db.init_db()
+
+    def test_replay_restores_history(self, mock_use_supabase):
+        """测试重启后从日志恢复增删操作"""
+        db.init_db()
+        a = db.add_record(self.rules[0], "client-a")
+        db.add_record(self.rules[1], "client-a")
+        db.add_record(self.rules[1], "client-b")
+        db.delete_records_by_ids("client-a", [a["id"]])
+        before = db.get_recent_history(10)
+
+        self._restart()
+        self.assertEqual(db.get_recent_history(10), before)
+        self.assertEqual(db.get_stats("client-a")["by_category"], {"social": 1})
+        self.assertEqual(db._memory_check_aggregates(), [])
+        replay = db.get_memory_usage()["journal"]["replay"]
+        self.assertEqual(replay["journal_ops"], 4)
+
+        # 新记录的 id 不会与恢复前的记录重复
+        new = db.add_record(self.rules[0], "client-a")
+        self.assertGreater(new["id"], before[0][0])
+
+    def test_snapshot_compacts_journal(self, mock_use_supabase):
+        """测试快照后旧分段被删除，恢复结果不变"""
+        db.init_db()
+        for _ in range(5):
+            db.add_record(self.rules[0], "client-a")
+        db.delete_last_record("client-a")
+        self.assertEqual(db._memory_snapshot(), 4)
+        db.add_record(self.rules[1], "client-b")
+        before = db.get_recent_history(10)
+
+        logs = [n for n in os.listdir(self.tmpdir.name) if n.startswith("journal-")]
+        self.assertEqual(len(logs), 1)
+
+        self._restart()
+        self.assertEqual(db.get_recent_history(10), before)
+        replay = db.get_memory_usage()["journal"]["replay"]
+        self.assertEqual(replay["snapshot_records"], 4)
+        self.assertEqual(replay["journal_ops"], 1)
+
+    def test_snapshot_fsync_outside_locks(self, mock_use_supabase):
+        """测试快照时旧分段的 fsync 不在持有分段锁时进行"""
+        import db_journal
+        with patch.object(db, 'MEMORY_JOURNAL_GROUP_MS', 1000):
+            db.init_db()
+            for _ in range(3):
+                db.add_record(self.rules[0], "client-a")
+            held = []
+            real_fsync = db_journal.os.fsync
+
+            def fsync(fd):
+                held.append(any(lock._lock.locked() for lock in db._memory_stripes))
+                return real_fsync(fd)
+
+            with patch.object(db_journal.os, 'fsync', side_effect=fsync):
+                self.assertEqual(db._memory_snapshot(), 3)
+        self.assertTrue(held)
+        self.assertFalse(any(held))
+        self._restart()
+        self.assertEqual(len(db.get_recent_history(10)), 3)
+
+    def test_group_commit_batches_fsync(self, mock_use_supabase):
+        """测试组提交：多次写入合并为少量 fsync"""
+        with patch.object(db, 'MEMORY_JOURNAL_GROUP_MS', 1000):
+            db.init_db()
+            for _ in range(50):
+                db.add_record(self.rules[0], "client-a")
+            db._journal.sync()
+        stats = db.get_memory_usage()["journal"]
+        self.assertEqual(stats["appends"], 50)
+        self.assertLess(stats["commits"], 5)
+        self.assertEqual(stats["pending_bytes"], 0)
+
+
+class TestAsyncAPI(unittest.TestCase):
+    """测试 asyncio 接口"""
+
+    @patch.object(db, '_use_supabase', return_value=False)
+    def test_async_functions_match_sync(self, mock_use_supabase):
+        """测试异步接口与同步接口结果一致"""
+        import asyncio
+        db._memory_reset()
+        rule = {"id": "TAC-01", "content": "规则1", "category": "tactical"}
+
+        async def scenario():
+            added = await asyncio.gather(
+                db.async_add_record(rule, "client-a"),
+                db.async_add_record(rule, "client-a"),
+            )
+            rows = await db.async_get_recent_history(10, "client-a")
+            ids = await db.async_get_recent_ids(10, "client-a")
+            stats = await db.async_get_stats("client-a")
+            last = await db.async_delete_last_record("client-a")
+            deleted = await db.async_delete_records_by_ids("client-a", [a["id"] for a in added])
+            return rows, ids, stats, last, deleted
+
+        rows, ids, stats, last, deleted = asyncio.run(scenario())
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(ids, ["TAC-01", "TAC-01"])
+        self.assertEqual(stats["by_category"], {"tactical": 2})
+        self.assertEqual(last, rows[0])
+        self.assertEqual(deleted, 1)
+
+    @patch.object(db, '_use_supabase', return_value=False)
+    def test_memory_snapshot(self, mock_use_supabase):
+        """测试内存模式合并读取与分别读取的结果一致"""
+        db._memory_reset()
+        for i in range(5):
+            db.add_record({"id": f"TAC-0{i}", "content": "规则", "category": "tactical"}, "client-a")
+        snapshot = db.get_snapshot("client-a", 2, 4)
+        self.assertEqual(snapshot["items"], db.get_recent_history(2, "client-a"))
+        self.assertEqual(snapshot["ids"], db.get_recent_ids(4, "client-a"))
+        self.assertEqual(snapshot["stats"], db.get_stats("client-a"))
+        self.assertEqual(db.get_snapshot("nobody"), {"items": [], "ids": [], "stats": db.get_stats("nobody")})
+
+    @patch.object(db, '_use_supabase', return_value=True)
+    def test_supabase_snapshot_fan_out(self, mock_use_supabase):
+        """测试 Supabase 模式下历史与统计查询并发执行，统计不可用时降级"""
+        import time
+        rows = [(2, "SOC-01", "规则2", "social", "2024-01-01"), (1, "TAC-01", "规则1", "tactical", "2024-01-01")]
+
+        def slow(result):
+            def fn(*args):
+                time.sleep(0.2)
+                return result
+            return fn
+
+        with patch.object(db, 'get_recent_history', side_effect=slow(rows)), \
+                patch.object(db, '_count_today', side_effect=slow(1)), \
+                patch.object(db, '_count_by_category', side_effect=slow({"social": 1, "tactical": 1})):
+            start = time.perf_counter()
+            snapshot = db.get_snapshot("client-a", 1, 10)
+            elapsed = time.perf_counter() - start
+        self.assertLess(elapsed, 0.35)
+        self.assertEqual(snapshot["items"], rows[:1])
+        self.assertEqual(snapshot["ids"], ["SOC-01", "TAC-01"])
+        self.assertEqual(snapshot["stats"]["today_count"], 1)
+        self.assertNotIn("degraded", snapshot)
+
+        with patch.object(db, 'get_recent_history', return_value=rows), \
+                patch.object(db, '_count_today', side_effect=OSError("down")), \
+                patch.object(db, '_degraded_stats', return_value={"degraded": True}):
+            snapshot = db.get_snapshot("client-a")
+        self.assertTrue(snapshot["degraded"])
+
+    @patch.object(db, '_use_supabase', return_value=True)
+    def test_supabase_stats_fan_out(self, mock_use_supabase):
+        """测试 Supabase 模式下统计查询并发执行"""
+        import time
+
+        def slow_today(client_id):
+            time.sleep(0.2)
+            return 3
+
+        def slow_category(client_id):
+            time.sleep(0.2)
+            return {"tactical": 2, "social": 1}
+
+        with patch.object(db, '_count_today', side_effect=slow_today), \
+                patch.object(db, '_count_by_category', side_effect=slow_category):
+            start = time.perf_counter()
+            stats = db.get_stats("client-a")
+            elapsed = time.perf_counter() - start
+
+        self.assertLess(elapsed, 0.35)
+        self.assertEqual(stats["today_count"], 3)
+        self.assertEqual(stats["top_category"], "tactical")
+        self.assertEqual(stats["top_pct"], 67)
+
+
+class _FakeSupabase:
+    """模拟 PostgREST history 表的 _request 替身，记录每次请求"""
+
+    def __init__(self):
+        self.rows = []
+        self.posts = []
+        self.calls = []
+        self.next_id = 1
+
+    def __call__(self, method, path, params=None, payload=None, count=None, prefer=None, headers=None):
+        self.calls.append((method, params))
+        if path.endswith("/rpc/history_category_counts"):
+            counts = {}
+            for r in self.rows:
+                if r["client_id"] == payload["p_client_id"] and r["category"]:
+                    counts[r["category"]] = counts.get(r["category"], 0) + 1
+            return [], json.dumps([{"category": c, "count": n} for c, n in counts.items()])
+        if method == "POST":
+            batch = payload if isinstance(payload, list) else [payload]
+            self.posts.append(batch)
+            inserted = []
+            for p in batch:
+                inserted.append(dict(p, id=self.next_id))
+                self.next_id += 1
+            self.rows.extend(inserted)
+            return [], json.dumps(inserted)
+        if method == "GET":
+            rows = list(reversed(self.rows))
+            if "client_id" in params:
+                rows = [r for r in rows if r["client_id"] == params["client_id"][3:]]
+            return [], json.dumps(rows[:int(params.get("limit", 1000))])
+        if method == "DELETE":
+            if "order" in params:
+                # 带 order + limit 的 DELETE，返回被删除的行
+                client = params["client_id"][3:]
+                latest = [r for r in reversed(self.rows) if r["client_id"] == client][:int(params["limit"])]
+                self.rows = [r for r in self.rows if r not in latest]
+                return [], json.dumps(latest)
+            wanted = params["id"][3:].strip("()").split(",")
+            self.rows = [r for r in self.rows if str(r["id"]) not in wanted]
+            return [], ""
+        raise AssertionError(method)
+
+    def gets(self):
+        return sum(1 for method, _ in self.calls if method == "GET")
+
+
+class TestReadCache(unittest.TestCase):
+    """测试 Supabase 历史读缓存"""
+
+    def setUp(self):
+        self.supabase = _FakeSupabase()
+        patches = [
+            patch.object(db, '_use_supabase', return_value=True),
+            patch.object(db, '_request', side_effect=self.supabase),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+        db._read_cache.invalidate()
+
+    def test_reads_served_from_cache(self):
+        """测试去重读和列表读共用缓存，写入与删除写穿缓存"""
+        rule = {"id": "TAC-01", "content": "规则1", "category": "tactical"}
+        db.add_record(rule, "client-a")
+        self.assertEqual(db.get_recent_ids(10, "client-a"), ["TAC-01"])
+        gets = self.supabase.gets()
+
+        added = db.add_record(dict(rule, id="TAC-02"), "client-a")
+        self.assertEqual(db.get_recent_ids(10, "client-a"), ["TAC-02", "TAC-01"])
+        self.assertEqual([r[0] for r in db.get_recent_history(20, "client-a")], [added["id"], 1])
+        self.assertEqual(db.delete_last_record("client-a")[0], added["id"])
+        self.assertEqual(db.get_recent_ids(10, "client-a"), ["TAC-01"])
+        self.assertEqual(self.supabase.gets(), gets)  # 首次之后不再查询
+
+        stats = db.get_read_cache_stats()
+        self.assertEqual(stats["misses"], 1)
+        self.assertGreaterEqual(stats["hits"], 3)
+
+    def test_warm_up_fills_recent_clients(self):
+        """测试启动预热按客户端填充缓存"""
+        for i, client in enumerate(["client-a", "client-b", "client-a"]):
+            self.supabase.rows.append({"id": i + 1, "rule_id": f"R{i}", "content": "c",
+                                       "category": "", "timestamp": "t", "client_id": client})
+        self.assertEqual(db._warm_read_cache(), 2)
+        gets = self.supabase.gets()
+        self.assertEqual(db.get_recent_ids(10, "client-a"), ["R2", "R0"])
+        self.assertEqual(db.get_recent_ids(10, "client-b"), ["R1"])
+        self.assertEqual(self.supabase.gets(), gets)
+
+
+class TestSupabaseRoundTrips(unittest.TestCase):
+    """测试 Supabase 写入与撤销各只需一次请求"""
+
+    def setUp(self):
+        self.supabase = _FakeSupabase()
+        patches = [
+            patch.object(db, '_use_supabase', return_value=True),
+            patch.object(db, '_request', side_effect=self.supabase),
+            patch.object(db, '_limited_delete_supported', True),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+        db._read_cache.invalidate()
+
+    def test_add_and_undo_single_request(self):
+        """测试写入与撤销各发一次请求"""
+        rule = {"id": "TAC-01", "content": "规则1", "category": "tactical"}
+        added = db.add_record(rule, "client-a")
+        db.add_record(dict(rule, id="TAC-02"), "client-b")
+        self.assertEqual(len(self.supabase.calls), 2)
+
+        row = db.delete_last_record("client-a")
+        self.assertEqual(row[0], added["id"])
+        self.assertEqual([m for m, _ in self.supabase.calls], ["POST", "POST", "DELETE"])
+        self.assertEqual([r["rule_id"] for r in self.supabase.rows], ["TAC-02"])
+        self.assertIsNone(db.delete_last_record("client-a"))
+
+    def test_undo_falls_back_without_limited_delete(self):
+        """测试服务端不支持带 limit 的 DELETE 时退回查询再删除"""
+        import io
+        import urllib.error
+        rule = {"id": "TAC-01", "content": "规则1", "category": "tactical"}
+        db.add_record(rule, "client-a")
+        db.add_record(dict(rule, id="TAC-02"), "client-a")
+
+        def reject_limited(method, path, params=None, **kwargs):
+            if method == "DELETE" and "order" in params:
+                raise urllib.error.HTTPError("url", 400, "error", {}, io.BytesIO(b"{}"))
+            return self.supabase(method, path, params=params, **kwargs)
+
+        with patch.object(db, '_request', side_effect=reject_limited):
+            self.assertEqual(db.delete_last_record("client-a")[1], "TAC-02")
+            self.assertEqual(db.delete_last_record("client-a")[1], "TAC-01")
+        self.assertFalse(db._limited_delete_supported)
+        self.assertEqual(self.supabase.rows, [])
+
+    def test_undo_detects_ignored_limit(self):
+        """测试服务端忽略 limit 删除多行时报错并关闭带 limit 的 DELETE"""
+        rule = {"id": "TAC-01", "content": "规则1", "category": "tactical"}
+        db.add_record(rule, "client-a")
+        db.add_record(dict(rule, id="TAC-02"), "client-a")
+        db.add_record(dict(rule, id="TAC-03"), "client-a")
+
+        def ignore_limit(method, path, params=None, **kwargs):
+            if method == "DELETE" and "order" in params:
+                params = dict(params, limit="1000")
+            return self.supabase(method, path, params=params, **kwargs)
+
+        with patch.object(db, '_request', side_effect=ignore_limit), patch('builtins.print') as mock_print:
+            self.assertEqual(db.delete_last_record("client-a")[1], "TAC-03")
+        self.assertFalse(db._limited_delete_supported)
+        self.assertIn("ignored limit", mock_print.call_args[0][0])
+        self.assertEqual(db.get_recent_history(10, "client-a"), [])
+
+    def test_limited_delete_off_by_default(self):
+        """测试默认不使用带 limit 的 DELETE"""
+        self.assertFalse(db.SUPABASE_LIMITED_DELETE)
+
+    def test_draw_records_single_request(self):
+        """测试抽取两条记录：最近 id 来自缓存，两条记录一个请求写入"""
+        db.add_record({"id": "TAC-01", "content": "规则1", "category": "tactical"}, "client-a")
+        db.get_recent_ids(10, "client-a")
+        calls = len(self.supabase.calls)
+        rules = [{"id": "TAC-02", "content": "规则2"}, {"id": "TAC-03", "content": "规则3"}]
+        items = db.draw_records("client-a", lambda recent: rules if recent == {"TAC-01"} else [])
+        self.assertEqual([m for m, _ in self.supabase.calls[calls:]], ["POST"])
+        self.assertEqual(len(self.supabase.posts[-1]), 2)
+        self.assertEqual([i["rule_id"] for i in items], ["TAC-02", "TAC-03"])
+        self.assertEqual(db.get_recent_ids(10, "client-a"), ["TAC-03", "TAC-02", "TAC-01"])
+
+    def test_insert_without_representation(self):
+        """测试写入未返回行时不补查"""
+        with patch.object(db, '_request', return_value=([], "")) as mock_request:
+            item = db.add_record({"id": "TAC-01", "content": "规则1"}, "client-a")
+        self.assertIsNone(item["id"])
+        self.assertEqual(item["rule_id"], "TAC-01")
+        self.assertEqual(mock_request.call_count, 1)
+
+
+class TestSupabaseAggregation(unittest.TestCase):
+    """测试 Supabase 分类统计的服务端聚合与退回路径"""
+
+    def setUp(self):
+        import io
+        import urllib.error
+        self.calls = []
+        self.supported = {"rpc", "aggregate"}
+        categories = ["tactical"] * 1500 + ["social"] * 700
+
+        def fail(code):
+            raise urllib.error.HTTPError("url", code, "error", {}, io.BytesIO(b"{}"))
+
+        def fake_request(method, path, params=None, payload=None, count=None, prefer=None, headers=None):
+            if path.endswith("/rpc/history_category_counts"):
+                self.calls.append("rpc")
+                if "rpc" not in self.supported:
+                    fail(404)
+                return [], json.dumps([{"category": "tactical", "count": 1500}, {"category": "social", "count": 700}])
+            if method == "HEAD":
+                self.calls.append("head")
+                return [("Content-Range", "*/42")], ""
+            if "count()" in params["select"]:
+                self.calls.append("aggregate")
+                if "aggregate" not in self.supported:
+                    fail(400)
+                return [], json.dumps([{"category": "tactical", "count": 1500}, {"category": "social", "count": 700}])
+            self.calls.append("page")
+            start, end = (int(x) for x in headers["Range"].split("-"))
+            return [], json.dumps([{"category": c} for c in categories[start:end + 1]])
+
+        patches = [
+            patch.object(db, '_use_supabase', return_value=True),
+            patch.object(db, '_request', side_effect=fake_request),
+            patch.object(db, '_category_strategy', None),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def test_rpc_preferred(self):
+        """测试优先使用 RPC 分组统计"""
+        self.assertEqual(db._count_by_category("client-a"), {"tactical": 1500, "social": 700})
+        self.assertEqual(self.calls, ["rpc"])
+
+    def test_falls_back_and_remembers_strategy(self):
+        """测试 RPC 不存在时退回聚合查询，之后直接使用聚合查询"""
+        self.supported = {"aggregate"}
+        db._count_by_category("client-a")
+        db._count_by_category("client-a")
+        self.assertEqual(self.calls, ["rpc", "aggregate", "aggregate"])
+
+    def test_paged_fallback_counts_all_rows(self):
+        """测试分页读取超过 1000 行时计数仍准确"""
+        self.supported = set()
+        self.assertEqual(db._count_by_category("client-a"), {"tactical": 1500, "social": 700})
+        self.assertEqual(self.calls.count("page"), 3)
+
+    def test_count_today_uses_head(self):
+        """测试今日计数只发 HEAD 请求"""
+        self.assertEqual(db._count_today("client-a"), 42)
+        self.assertEqual(self.calls, ["head"])
+
+
+class TestSupabaseFailover(unittest.TestCase):
+    """测试熔断打开后的故障转移与恢复后重放"""
+
+    def setUp(self):
+        import circuit_breaker
+        from urllib.parse import urlsplit, parse_qs
+        self.supabase = _FakeSupabase()
+        self.down = False
+
+        def fake_pool_request(method, url, headers=None, body=None):
+            if self.down:
+                raise ConnectionRefusedError("connection refused")
+            parts = urlsplit(url)
+            params = {k: v[0] for k, v in parse_qs(parts.query).items()}
+            payload = json.loads(body) if body else None
+            resp_headers, text = self.supabase(method, parts.path, params=params, payload=payload)
+            return 200, resp_headers, text.encode("utf-8")
+
+        breaker = circuit_breaker.CircuitBreaker(
+            window=4, min_calls=2, failure_rate=0.5, open_seconds=0.1,
+            on_state_change=db._on_breaker_change,
+        )
+        patches = [
+            patch.object(db, 'SUPABASE_URL', "http://supabase.test"),
+            patch.object(db, 'SUPABASE_ANON_KEY', "key"),
+            patch.object(db, 'DB_BACKEND', ""),
+            patch.object(db._http_pool, 'request', side_effect=fake_pool_request),
+            patch.object(db, '_breaker', breaker),
+            patch.object(db, 'SUPABASE_WRITE_BEHIND', False),
+            patch.object(db, 'SUPABASE_WRITE_FLUSH_MS', 10),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+        self.addCleanup(TestWriteBehind._close_queue, self)
+        db._read_cache.invalidate()
+
+    def test_failover_and_replay(self):
+        """测试故障期间写入进入缓冲、读取降级，恢复后按顺序重放"""
+        import circuit_breaker
+        import time
+        rule = {"id": "TAC-01", "content": "规则1", "category": "tactical"}
+        db.add_record(rule, "client-a")
+        self.assertEqual(db.get_recent_ids(10, "client-a"), ["TAC-01"])
+
+        self.down = True
+        second = db.add_record(dict(rule, id="TAC-02"), "client-a")
+        self.assertLess(second["id"], 0)
+        deadline = time.monotonic() + 2
+        while db._breaker.state == circuit_breaker.CLOSED and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(db._breaker.state, circuit_breaker.OPEN)
+
+        start = time.perf_counter()
+        db.add_record(dict(rule, id="TAC-03"), "client-a")
+        self.assertEqual(db.get_recent_ids(10, "client-a"), ["TAC-03", "TAC-02", "TAC-01"])
+        stats = db.get_stats("client-a")
+        self.assertTrue(stats["degraded"])
+        self.assertEqual(stats["by_category"], {"tactical": 3})
+        self.assertLess(time.perf_counter() - start, 0.5)  # 熔断期间不等待超时
+        self.assertFalse(db.health_check())
+
+        self.down = False
+        time.sleep(0.15)
+        self.assertTrue(db.health_check())  # 探测成功，熔断关闭并触发重放
+        self.assertTrue(db._write_queue.flush(2))
+        self.assertEqual([r["rule_id"] for r in self.supabase.rows], ["TAC-01", "TAC-02", "TAC-03"])
+        self.assertEqual(db.get_circuit_breaker_stats()["state"], circuit_breaker.CLOSED)
+        self.assertEqual(db.get_recent_ids(10, "client-a"), ["TAC-03", "TAC-02", "TAC-01"])
+
+
+class TestWriteBehind(unittest.TestCase):
+    """测试 Supabase 写后批量插入"""
+
+    def setUp(self):
+        self.supabase = _FakeSupabase()
+        self.rows = self.supabase.rows
+        self.posts = self.supabase.posts
+        db._read_cache.invalidate()
+
+        patches = [
+            patch.object(db, '_use_supabase', return_value=True),
+            patch.object(db, '_request', side_effect=self.supabase),
+            patch.object(db, 'SUPABASE_WRITE_BEHIND', True),
+            patch.object(db, 'SUPABASE_WRITE_BATCH', 3),
+            patch.object(db, 'SUPABASE_WRITE_FLUSH_MS', 10000),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+        self.addCleanup(self._close_queue)
+
+    def _close_queue(self):
+        with db._write_queue_lock:
+            queue, db._write_queue = db._write_queue, None
+        if queue is not None:
+            queue.close(2)
+
+    def test_batches_inserts_and_merges_reads(self):
+        """测试写入先返回临时记录、读时合并未写入记录，批满后一次 POST"""
+        rule = {"id": "TAC-01", "content": "规则1", "category": "tactical"}
+        first = db.add_record(rule, "client-a")
+        second = db.add_record(dict(rule, id="TAC-02"), "client-a")
+        self.assertLess(first["id"], 0)
+        self.assertEqual(self.posts, [])
+
+        self.assertEqual(db.get_recent_ids(10, "client-a"), ["TAC-02", "TAC-01"])
+        self.assertEqual(db._count_by_category("client-a"), {"tactical": 2})
+
+        db.add_record(dict(rule, id="TAC-03"), "client-a")
+        self.assertTrue(db._write_queue.flush(2))
+        self.assertEqual(len(self.posts), 1)
+        self.assertEqual([p["rule_id"] for p in self.posts[0]], ["TAC-01", "TAC-02", "TAC-03"])
+        rows = db.get_recent_history(10, "client-a")
+        self.assertEqual([r[1] for r in rows], ["TAC-03", "TAC-02", "TAC-01"])
+        self.assertTrue(all(r[0] > 0 for r in rows))
+
+        # 已写入记录的临时 id 仍可用于删除
+        self.assertEqual(db.delete_records_by_ids("client-a", [second["id"]]), 1)
+        self.assertEqual([r["rule_id"] for r in self.supabase.rows], ["TAC-01", "TAC-03"])
+
+    def test_undo_cancels_pending_record(self):
+        """测试撤销未写入的记录不产生任何请求"""
+        rule = {"id": "TAC-01", "content": "规则1", "category": "tactical"}
+        record = db.add_record(rule, "client-a")
+        row = db.delete_last_record("client-a")
+        self.assertEqual(row[0], record["id"])
+        self.assertTrue(db._write_queue.flush(2))
+        self.assertEqual(self.posts, [])
+
+    def test_flush_changes_version(self):
+        """测试写入完成、临时 id 换成真实 id 后版本变化"""
+        db.add_record({"id": "TAC-01", "content": "规则1", "category": "tactical"}, "client-a")
+        queued = db.get_client_version("client-a")
+        self.assertTrue(db._write_queue.flush(2))
+        self.assertNotEqual(db.get_client_version("client-a"), queued)
+
+
 class TestStatsCalculation(unittest.TestCase):
     """测试统计计算"""
 
@@ -153,9 +1151,7 @@ class TestSecurity(unittest.TestCase):
 
     def test_delete_records_by_ids_with_invalid_ids(self):
         """测试删除记录时过滤无效ID"""
-        with db._memory_store_lock:
-            db._memory_store["history"] = []
-            db._memory_store["id_counter"] = 1
+        db._memory_reset()
         
         # 测试无效ID被过滤
         deleted_count = db.delete_records_by_ids("test-client", ["invalid", "123", None, ""])
@@ -0,0 +1,37 @@
+"""
+服务端抽取测试
+"""
+import unittest
+import sys
+import os
+
+# 添加 src 到路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import catalog
+import draw
+
+
+class TestSample(unittest.TestCase):
+    """测试按分类去重抽取"""
+
+    def setUp(self):
+        rules = [{"id": f"TAC-0{i}", "content": f"规则{i}", "category": "tactical"} for i in range(3)]
+        rules.append({"id": "SOC-01", "content": "社交", "category": "social"})
+        self.rules = catalog.Catalog(rules)
+
+    def test_sample_excludes_recent(self):
+        """测试排除最近规则；可选规则不足时退回整个分类"""
+        for _ in range(20):
+            self.assertEqual(draw.sample(self.rules, "tactical", 1, {"TAC-00", "TAC-01"})[0]["id"], "TAC-02")
+            picked = draw.sample(self.rules, "tactical", 2, {"TAC-00", "TAC-01", "SOC-01"})
+            self.assertEqual(len({r["id"] for r in picked}), 2)
+            picked = draw.sample(self.rules, draw.ALL, 2, {"TAC-00", "TAC-01"})
+            self.assertEqual({r["id"] for r in picked}, {"TAC-02", "SOC-01"})
+        self.assertEqual(draw.sample(self.rules, "social", 1, {"SOC-01"})[0]["id"], "SOC-01")
+        self.assertIsNone(draw.sample(self.rules, "social", 2))
+        self.assertIsNone(draw.sample(self.rules, "missing", 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,155 @@
+"""
+HTTP 连接池测试
+"""
+import unittest
+import sys
+import os
+import json
+import threading
+import time
+import urllib.error
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 添加 src 到路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import http_pool
+
+
+class _KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    timeout = 0.3  # 服务端关闭空闲超过 0.3s 的连接
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.startswith("/missing"):
+            body = b'{"message":"not found"}'
+            self.send_response(404)
+        else:
+            body = json.dumps({"path": self.path, "port": self.client_address[1]}).encode("utf-8")
+            self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if self.path.startswith("/close"):
+            self.send_header("Connection", "close")
+            self.close_connection = True
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header("Content-Range", "*/42")
+        self.send_header("Content-Length", "17")
+        self.end_headers()
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        if self.path.startswith("/drop"):
+            # 已处理请求但未应答就断开，模拟提交后连接被重置
+            self.server.dropped += 1
+            self.close_connection = True
+            return
+        self.send_response(201)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class TestConnectionPool(unittest.TestCase):
+    """测试 keep-alive 连接池"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), _KeepAliveHandler)
+        cls.server.daemon_threads = True
+        cls.server.dropped = 0
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+        cls.base = f"http://127.0.0.1:{cls.server.server_address[1]}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.pool = http_pool.ConnectionPool(idle_timeout=30)
+
+    def tearDown(self):
+        self.pool.close()
+
+    def test_connection_reused(self):
+        """测试连续请求复用同一连接"""
+        _, _, first = self.pool.request("GET", self.base + "/a?x=1")
+        _, _, second = self.pool.request("GET", self.base + "/b")
+        self.assertEqual(json.loads(first)["path"], "/a?x=1")
+        self.assertEqual(json.loads(first)["port"], json.loads(second)["port"])
+        stats = self.pool.get_stats()
+        self.assertEqual(stats["new_connections"], 1)
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["idle"], 1)
+
+    def test_post_body_and_status(self):
+        """测试 POST 请求体与响应头"""
+        status, headers, body = self.pool.request("POST", self.base + "/echo", body=b'{"a":1}')
+        self.assertEqual(status, 201)
+        self.assertEqual(body, b'{"a":1}')
+        self.assertIn("Content-Length", dict(headers))
+
+    def test_head_without_body_reuses_connection(self):
+        """测试 HEAD 响应只取响应头，连接仍可复用"""
+        status, headers, body = self.pool.request("HEAD", self.base + "/count")
+        self.assertEqual(body, b"")
+        self.assertEqual(dict(headers)["Content-Range"], "*/42")
+        self.pool.request("GET", self.base + "/a")
+        self.assertEqual(self.pool.get_stats()["hits"], 1)
+
+    def test_idle_timeout_evicts(self):
+        """测试空闲超时的连接不再复用"""
+        self.pool.idle_timeout = 0
+        self.pool.request("GET", self.base + "/a")
+        self.pool.request("GET", self.base + "/b")
+        stats = self.pool.get_stats()
+        self.assertEqual(stats["new_connections"], 2)
+        self.assertEqual(stats["idle_evictions"], 1)
+
+    def test_server_close_not_pooled(self):
+        """测试服务端要求关闭的连接不回收"""
+        self.pool.request("GET", self.base + "/close")
+        self.assertEqual(self.pool.get_stats()["idle"], 0)
+
+    def test_stale_connection_retried(self):
+        """测试复用连接已被服务端关闭时换新连接重试"""
+        self.pool.request("GET", self.base + "/a")
+        time.sleep(0.6)
+        _, _, body = self.pool.request("GET", self.base + "/b")
+        self.assertEqual(json.loads(body)["path"], "/b")
+        stats = self.pool.get_stats()
+        self.assertEqual(stats["stale_retries"], 1)
+        self.assertEqual(stats["new_connections"], 2)
+
+    def test_stale_connection_post_not_resent(self):
+        """测试复用连接上读取响应时断开的 POST 不重发，避免重复写入"""
+        self.pool.request("GET", self.base + "/a")
+        dropped = self.server.dropped
+        with self.assertRaises(http_pool._STALE_ERRORS):
+            self.pool.request("POST", self.base + "/drop", body=b'{"a":1}')
+        self.assertEqual(self.server.dropped, dropped + 1)
+        stats = self.pool.get_stats()
+        self.assertEqual(stats["stale_retries"], 0)
+        self.assertEqual(stats["idle"], 0)
+
+    def test_error_status_raises(self):
+        """测试错误状态码抛出 HTTPError 且连接仍可复用"""
+        with self.assertRaises(urllib.error.HTTPError) as ctx:
+            self.pool.request("GET", self.base + "/missing")
+        self.assertEqual(ctx.exception.code, 404)
+        self.pool.request("GET", self.base + "/a")
+        self.assertEqual(self.pool.get_stats()["hits"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
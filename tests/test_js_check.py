@@ -0,0 +1,104 @@
+"""
+JS 语法校验缓存测试
+"""
+import unittest
+import sys
+import os
+import json
+import shutil
+import subprocess
+import tempfile
+import time
+from unittest.mock import patch
+
+# 添加 src 到路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import js_check
+
+
+class _CacheDirTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        for p in (
+            patch.object(js_check, 'JS_CHECK_CACHE_DIR', self.tmpdir.name),
+            patch.object(js_check, 'JS_CHECK_FORCE', False),
+            patch.object(js_check, '_verdicts', {}),
+        ):
+            p.start()
+            self.addCleanup(p.stop)
+
+    def verdict_files(self):
+        return [n for n in os.listdir(self.tmpdir.name) if n != js_check._NODE_INFO_FILE]
+
+
+@unittest.skipUnless(shutil.which("node"), "node not installed")
+class TestVerdictCache(_CacheDirTestCase):
+    """测试结论缓存：未变化时不启动 node"""
+
+    def test_cached_across_restart(self):
+        """测试重启后（进程内缓存为空）从磁盘读取结论，不启动子进程"""
+        self.assertEqual(js_check.validate("const a = 1;"), (True, ""))
+        self.assertEqual(len(self.verdict_files()), 1)
+        js_check._verdicts.clear()
+        with patch.object(subprocess, 'run', side_effect=AssertionError("spawned node")):
+            self.assertEqual(js_check.validate("const a = 1;"), (True, ""))
+
+    def test_syntax_error_cached(self):
+        """测试语法错误同样缓存，内容变化后重新校验"""
+        ok, message = js_check.validate("const = ;")
+        self.assertFalse(ok)
+        self.assertTrue(message)
+        with patch.object(subprocess, 'run', side_effect=AssertionError("spawned node")):
+            self.assertEqual(js_check.validate("const = ;"), (False, message))
+        self.assertTrue(js_check.validate("const b = 2;")[0])
+        self.assertEqual(len(self.verdict_files()), 2)
+
+    def test_force_revalidates(self):
+        """测试 force 时忽略已有结论"""
+        js_check.validate("const a = 1;")
+        with patch.object(subprocess, 'run', wraps=subprocess.run) as mock_run:
+            self.assertTrue(js_check.validate("const a = 1;", force=True)[0])
+        self.assertEqual(mock_run.call_count, 1)
+
+    def test_node_version_in_key(self):
+        """测试 node 版本变化后结论失效"""
+        js_check.validate("const a = 1;")
+        js_check._verdicts.clear()
+        with patch.object(js_check, '_node_version', return_value="v0.0.0-test"), \
+                patch.object(subprocess, 'run', wraps=subprocess.run) as mock_run:
+            js_check.validate("const a = 1;")
+        self.assertEqual(mock_run.call_count, 1)
+        self.assertEqual(len(self.verdict_files()), 2)
+
+
+class TestCleanup(_CacheDirTestCase):
+    """测试清理过期与超出数量的结论"""
+
+    def test_cleanup(self):
+        """测试按 mtime 保留最新的条目并删除过期条目，node 信息文件不受影响"""
+        now = time.time()
+        for i, age_days in enumerate((0, 1, 2, 40)):
+            path = os.path.join(self.tmpdir.name, f"{i}.json")
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump({"ok": True}, f)
+            os.utime(path, (now - age_days * 86400, now - age_days * 86400))
+        with open(os.path.join(self.tmpdir.name, js_check._NODE_INFO_FILE), "w", encoding="utf-8") as f:
+            json.dump({}, f)
+
+        self.assertEqual(js_check.cleanup(max_entries=10, max_age_days=30), 1)
+        self.assertEqual(js_check.cleanup(max_entries=2, max_age_days=30), 1)
+        self.assertEqual(sorted(self.verdict_files()), ["0.json", "1.json"])
+        self.assertIn(js_check._NODE_INFO_FILE, os.listdir(self.tmpdir.name))
+
+    def test_without_node(self):
+        """测试没有 node 时跳过校验且不写缓存"""
+        with patch.object(shutil, 'which', return_value=None):
+            self.assertEqual(js_check.validate("const = ;"), (True, "node not found"))
+        self.assertEqual(self.verdict_files(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+"""
+按客户端读缓存测试
+"""
+import unittest
+import sys
+import os
+import time
+
+# 添加 src 到路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import read_cache
+
+
+def _rows(*ids):
+    return [(i, f"R{i}", "c", "", "t") for i in ids]
+
+
+class TestClientCache(unittest.TestCase):
+    """测试 LRU/TTL、写穿与并发回填"""
+
+    def test_hit_requires_enough_rows(self):
+        """测试缓存行数不足且不完整时视为未命中"""
+        cache = read_cache.ClientCache(window=3)
+        token = cache.begin_fill()
+        cache.fill("a", _rows(5, 4, 3, 2), complete=False, token=token)
+        self.assertEqual([r[0] for r in cache.get("a", 3)], [5, 4, 3])
+        self.assertIsNone(cache.get("a", 4))  # 只保留了窗口内的 3 行
+
+        cache.fill("b", _rows(1), complete=True, token=cache.begin_fill())
+        self.assertEqual(len(cache.get("b", 10)), 1)  # 完整时行数少也能命中
+
+    def test_write_through(self):
+        """测试写入插到头部、删除从缓存移除"""
+        cache = read_cache.ClientCache(window=3)
+        cache.fill("a", _rows(2, 1), complete=True, token=cache.begin_fill())
+        cache.prepend("a", _rows(3))
+        self.assertEqual([r[0] for r in cache.get("a", 3)], [3, 2, 1])
+        cache.prepend("a", _rows(4))
+        self.assertIsNone(cache.get("a", 4))  # 超出窗口后不再完整
+        cache.remove("a", [4])
+        self.assertEqual([r[0] for r in cache.get("a", 2)], [3, 2])
+
+    def test_lru_and_ttl(self):
+        """测试按最近使用淘汰和过期"""
+        cache = read_cache.ClientCache(max_clients=2, ttl=0.05)
+        for client in ("a", "b"):
+            cache.fill(client, _rows(1), complete=True, token=cache.begin_fill())
+        cache.get("a", 1)
+        cache.fill("c", _rows(1), complete=True, token=cache.begin_fill())
+        self.assertIsNone(cache.get("b", 1))
+        self.assertIsNotNone(cache.get("a", 1))
+        time.sleep(0.06)
+        self.assertIsNone(cache.get("a", 1))
+        stats = cache.get_stats()
+        self.assertEqual(stats["evictions"], 1)
+        self.assertEqual(stats["expired"], 1)
+
+    def test_stale_fill_discarded(self):
+        """测试查询期间发生写入时不回填过时结果"""
+        cache = read_cache.ClientCache()
+        token = cache.begin_fill()
+        cache.prepend("a", _rows(2))  # 查询进行中写入了新行
+        self.assertFalse(cache.fill("a", _rows(1), complete=True, token=token))
+        self.assertIsNone(cache.get("a", 1))
+        self.assertTrue(cache.fill("a", _rows(2, 1), complete=True, token=cache.begin_fill()))
+
+
+if __name__ == '__main__':
+    unittest.main()
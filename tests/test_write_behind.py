@@ -0,0 +1,183 @@
+"""
+写后缓冲队列测试
+"""
+import unittest
+import sys
+import os
+import threading
+import time
+
+# 添加 src 到路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import write_behind
+
+
+class _FakeBackend:
+    """按顺序分配 id 的批量写入桩，可设置前几次调用失败"""
+
+    def __init__(self, fail_times=0):
+        self.fail_times = fail_times
+        self.batches = []
+        self.next_id = 100
+        self.release = threading.Event()
+        self.release.set()
+
+    def insert(self, payloads):
+        self.release.wait(5)
+        if self.fail_times > 0:
+            self.fail_times -= 1
+            raise ConnectionError("backend down")
+        self.batches.append(list(payloads))
+        rows = []
+        for p in payloads:
+            rows.append(dict(p, id=self.next_id))
+            self.next_id += 1
+        return rows
+
+
+def _payload(client_id, rule_id):
+    return {"rule_id": rule_id, "content": "c", "category": "tactical",
+            "timestamp": "2026-01-01T00:00:00+00:00", "client_id": client_id}
+
+
+class TestWriteBehindQueue(unittest.TestCase):
+    """测试批量刷新、顺序、重试与撤销"""
+
+    def test_flushes_full_batch_in_order(self):
+        """测试攒满批次后一次写入，且保持提交顺序"""
+        backend = _FakeBackend()
+        queue = write_behind.WriteBehindQueue(backend.insert, batch_size=3, flush_ms=10000)
+        queue.start()
+        records = [queue.submit(_payload("a", f"R{i}")) for i in range(3)]
+        self.assertEqual([r["id"] for r in records], [-1, -2, -3])
+        self.assertTrue(queue.flush(2))
+        self.assertEqual(len(backend.batches), 1)
+        self.assertEqual([p["rule_id"] for p in backend.batches[0]], ["R0", "R1", "R2"])
+        self.assertEqual([queue.resolve(r["id"]) for r in records], [100, 101, 102])
+        queue.close()
+
+    def test_flushes_after_interval(self):
+        """测试未攒满时在 flush_ms 后写入"""
+        backend = _FakeBackend()
+        queue = write_behind.WriteBehindQueue(backend.insert, batch_size=50, flush_ms=50)
+        queue.start()
+        time.sleep(0.05)  # 写线程已进入空闲等待
+        queue.submit(_payload("a", "R0"))
+        deadline = time.monotonic() + 2
+        while not backend.batches and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(len(backend.batches), 1)
+        queue.close()
+
+    def test_retries_failed_batch(self):
+        """测试写入失败后整批保留并重试"""
+        backend = _FakeBackend(fail_times=2)
+        queue = write_behind.WriteBehindQueue(backend.insert, batch_size=2, flush_ms=10, retry_base=0.01)
+        queue.start()
+        queue.submit(_payload("a", "R0"))
+        queue.submit(_payload("a", "R1"))
+        self.assertEqual(len(queue.pending_for("a")), 2)  # 失败期间仍可读到
+        self.assertTrue(queue.flush(2))
+        stats = queue.get_stats()
+        self.assertEqual(stats["retries"], 2)
+        self.assertEqual(stats["flushed"], 2)
+        self.assertEqual(stats["pending"], 0)
+        self.assertEqual([p["rule_id"] for p in backend.batches[0]], ["R0", "R1"])
+        queue.close()
+
+    def test_rejected_records_dropped(self):
+        """测试后端拒绝的记录不再重试：逐条重写后只丢弃被拒的一条，其他客户端的写入照常完成"""
+        backend = _FakeBackend()
+        insert = backend.insert
+
+        def reject_bad(payloads):
+            if any(p["rule_id"] == "BAD" for p in payloads):
+                raise ValueError("HTTP 400")
+            return insert(payloads)
+
+        rejected = []
+        queue = write_behind.WriteBehindQueue(
+            reject_bad, batch_size=3, flush_ms=10, retry_base=0.01,
+            is_retryable=lambda e: isinstance(e, ConnectionError), on_reject=rejected.extend,
+        )
+        queue.start()
+        queue.submit(_payload("a", "R0"))
+        bad = queue.submit(_payload("a", "BAD"))
+        ok = queue.submit(_payload("b", "R1"))
+        self.assertTrue(queue.flush(2))
+        self.assertEqual(queue.pending_for("a"), [])
+        self.assertIsNone(queue.resolve(bad["id"]))
+        self.assertIsNotNone(queue.resolve(ok["id"]))
+        self.assertEqual([p["rule_id"] for p in rejected], ["BAD"])
+        stats = queue.get_stats()
+        self.assertEqual((stats["flushed"], stats["rejected"], stats["retries"]), (2, 1, 0))
+        self.assertEqual(stats["dead_letters"], 1)
+        self.assertEqual(queue.dead_letters[0]["payload"]["rule_id"], "BAD")
+        queue.close()
+
+    def test_tombstones_flush_in_order(self):
+        """测试墓碑记录按提交顺序单独成批，不出现在待写入记录中"""
+        batches = []
+
+        def flush(payloads):
+            batches.append([p.get(write_behind.TOMBSTONE_KEY) or p["rule_id"] for p in payloads])
+            return [None] if write_behind.is_tombstone(payloads[0]) else [dict(p, id=1) for p in payloads]
+
+        queue = write_behind.WriteBehindQueue(flush, batch_size=50, flush_ms=10000)
+        queue.submit(_payload("a", "R0"))
+        queue.submit_delete("a", [7])
+        queue.submit(_payload("a", "R1"))
+        self.assertEqual([r["rule_id"] for r in queue.pending_for("a")], ["R1", "R0"])
+        self.assertEqual(queue.deleted_for("a"), {7})
+        self.assertEqual(queue.deleted_for("b"), set())
+        self.assertEqual(queue.cancel_last("a")["rule_id"], "R1")
+        self.assertTrue(queue.close(2))
+        self.assertEqual(batches, [["R0"], [[7]]])
+        self.assertEqual(queue.deleted_for("a"), set())
+
+    def test_cancel_pending_records(self):
+        """测试撤销未写入的记录，不影响其他客户端"""
+        backend = _FakeBackend()
+        queue = write_behind.WriteBehindQueue(backend.insert, batch_size=50, flush_ms=10000)
+        first = queue.submit(_payload("a", "R0"))
+        queue.submit(_payload("b", "R1"))
+        queue.submit(_payload("a", "R2"))
+
+        self.assertEqual(queue.cancel_last("a")["rule_id"], "R2")
+        self.assertIsNone(queue.cancel(first["id"], "b"))  # 不能撤销其他客户端的记录
+        self.assertEqual(queue.cancel(first["id"], "a")["rule_id"], "R0")
+        self.assertEqual([r["rule_id"] for r in queue.pending_for("b")], ["R1"])
+        self.assertTrue(queue.close(2))
+        self.assertEqual([p["rule_id"] for p in backend.batches[0]], ["R1"])
+
+    def test_inflight_records_not_cancelled(self):
+        """测试正在写入的记录不可撤销，但仍对读可见"""
+        backend = _FakeBackend()
+        backend.release.clear()
+        queue = write_behind.WriteBehindQueue(backend.insert, batch_size=1, flush_ms=10000)
+        queue.start()
+        record = queue.submit(_payload("a", "R0"))
+        deadline = time.monotonic() + 2
+        while queue.get_stats()["inflight"] == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertIsNone(queue.cancel_last("a"))
+        self.assertIsNone(queue.cancel(record["id"], "a"))
+        self.assertEqual(len(queue.pending_for("a")), 1)
+        backend.release.set()
+        self.assertTrue(queue.close(2))
+        self.assertEqual(queue.resolve(record["id"]), 100)
+
+    def test_close_drains_queue(self):
+        """测试关闭时刷出剩余写入"""
+        backend = _FakeBackend()
+        queue = write_behind.WriteBehindQueue(backend.insert, batch_size=50, flush_ms=10000)
+        queue.start()
+        for i in range(5):
+            queue.submit(_payload("a", f"R{i}"))
+        self.assertTrue(queue.close(2))
+        self.assertEqual(sum(len(b) for b in backend.batches), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()